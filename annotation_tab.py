@@ -1,18 +1,127 @@
+import copy
+import logging
 import gradio as gr
-from PIL import Image
-from utils import get_image_for_display, get_test_folders, process_folder
+from autosave import autosaver
+from prefetch import prefetcher
+from rapid_annotate import AnnotationCanvas, canvas_value, clean_edit, preview_data_url, FLUSH_JS, TOGGLE_JS
+from sessions import SessionStore, SESSION_TTL
+from storage import write_json_atomic
+from trajectory import update_trajectory
+from utils import get_image_for_display, get_test_folders, process_folder, display_size
 import os
-import json
-
-def annotation_tab():
+import secrets
+import time
+
+# You can set AUTOSAVE=1 to turn autosave on by default; edits are then written shortly after each click.
+AUTOSAVE = os.environ.get("AUTOSAVE", "0") == "1"
+
+# You can adjust the height to change the size of the image display.
+# Previews are rendered for this height, not at the screenshot's full resolution.
+DISPLAY_HEIGHT = 512
+
+logger = logging.getLogger(__name__)
+
+# You can adjust where the unexported edits of expired sessions are kept with the RECOVERY_DIR environment variable.
+RECOVERY_DIR = os.environ.get("RECOVERY_DIR", "recovery")
+
+def save_unexported(session):
+    """Keeps an expired session's unexported edits in a recovery file, outside the folder's shared interactions.
+
+    The file maps test IDs to their frames like interactions.json, so the edits can be merged by hand.
+    """
+    if not session.modified_test_ids:
+        return
+    frames = {test_id: session.interactions.get(test_id) for test_id in sorted(session.modified_test_ids)}
+    recovery_dir = os.path.join(RECOVERY_DIR, os.path.basename(os.path.normpath(session.folder_path)))
+    path = os.path.join(recovery_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(4)}.json")
+    try:
+        os.makedirs(recovery_dir, exist_ok=True)
+        write_json_atomic(path, frames, indent=4)
+        logger.warning("Unexported edits of an expired session saved to %s", path)
+    except OSError as e:
+        logger.error("Could not save unexported edits of an expired session to %s: %s", path, e)
+
+annotation_sessions = SessionStore(SESSION_TTL, on_evict=save_unexported)
+
+def record_edit(session, test_id, autosave):
+    """Schedules an edited test ID for autosave, or keeps it for the next export."""
+    if autosave and test_id not in session.autosave_conflicts:
+        # Written in the background once the clicks pause.
+        autosaver.mark(
+            session.interactions,
+            test_id,
+            lambda conflicts: autosave_conflicted(session, conflicts),
+            lambda test_ids, error: autosave_failed(session, test_ids, error),
+        )
+    else:
+        session.modified_test_ids.add(test_id)
+
+def autosave_conflicted(session, test_ids):
+    # Called from the autosave thread. The edits stay in the session until the user exports them.
+    session.autosave_conflicts.update(test_ids)
+    session.modified_test_ids.update(test_ids)
+    session.notices.append(f"{', '.join(test_ids)} changed in another session, so your edits were not autosaved. Export to overwrite.")
+
+def autosave_failed(session, test_ids, error):
+    # Called from the autosave thread once retrying is given up. The edits stay for the next export.
+    session.modified_test_ids.update(test_ids)
+    session.notices.append(f"Autosave of {', '.join(test_ids)} failed ({error}). Export to save your edits.")
+
+def show_notices(session):
+    while session.notices:
+        gr.Warning(session.notices.pop(0), duration=5)
+
+def rapid_frame(request):
+    """Called by the rapid mode canvas for the plain preview of one frame."""
+    image_groups = annotation_sessions.get(request.get("token")).image_groups
+    images = image_groups.get(request.get("test_id"), []) if image_groups else []
+    index = request.get("index")
+    if not isinstance(index, int) or not 0 <= index < len(images):
+        return None
+    return preview_data_url(images[index], DISPLAY_HEIGHT)
+
+def rapid_save(batch):
+    """Called by the rapid mode canvas with a batch of edits.
+
+    Returns {"saved": number applied, "error": why the others were not, or None}. The canvas keeps
+    a batch that was not saved in full.
+    """
+    session = annotation_sessions.get(batch.get("token"))
+    interactions, image_groups = session.interactions, session.image_groups
+    if not image_groups:
+        return {"saved": 0, "error": "session expired, reload the folder"}
+    saved, edited_test_ids, error = 0, set(), None
+    img_ids_by_test_id = {}
+    with session.lock:
+        for edit in batch.get("edits", []):
+            try:
+                test_id, img_id, interaction = clean_edit(edit)
+            except (AttributeError, ValueError) as e:
+                logger.warning("Rapid mode: rejected edit %r: %s", edit, e)
+                error = f"rejected edit: {e}"
+                continue
+            if test_id not in img_ids_by_test_id:
+                img_ids_by_test_id[test_id] = {os.path.basename(image_path) for image_path in image_groups.get(test_id, [])}
+            if img_id not in img_ids_by_test_id[test_id]:
+                error = f"unknown frame {test_id}/{img_id}"
+                continue
+            if test_id not in interactions:
+                interactions[test_id] = {}
+            interactions[test_id][img_id] = interaction
+            update_trajectory(test_id, interactions[test_id], img_id)
+            edited_test_ids.add(test_id)
+            saved += 1
+        for test_id in edited_test_ids:
+            record_edit(session, test_id, batch.get("autosave"))
+    return {"saved": saved, "error": error}
+
+def annotation_tab(render_concurrency_limit=4):
     with gr.TabItem("Interaction Annotate"):
         # States for annotation tab
-        image_groups_state = gr.State({})
+        # Token of the server-side session holding the folder, its image groups and interactions
+        session_state = gr.State("")
         current_test_id_state = gr.State("")
         current_image_index_state = gr.State(0)
-        image_dimensions_state = gr.State()
-        interactions_state = gr.State({})
-        folder_path_state = gr.State("")
 
         with gr.Row():
             folder_input = gr.Dropdown(label="Select Test Folder", choices=get_test_folders(), interactive=True)
@@ -20,8 +129,8 @@ def annotation_tab():
 
         with gr.Row():
             with gr.Column(scale=3):
-                # You can adjust the height to change the size of the image display.
-                image_display = gr.Image(label="Image", interactive=True, type="pil", height=512)
+                image_display = gr.Image(label="Image", interactive=True, type="pil", height=DISPLAY_HEIGHT)
+                rapid_canvas = AnnotationCanvas(rapid_frame, rapid_save, DISPLAY_HEIGHT, visible=False)
             with gr.Column(scale=1):
                 test_id_dropdown = gr.Dropdown(label="Test ID", interactive=True)
                 img_id_label = gr.Label(label="Image ID")
@@ -34,6 +143,10 @@ def annotation_tab():
                     longpress_duration = gr.Number(label="Duration (ms)", value=1000, interactive=True, visible=False, precision=0)
                     slide_duration = gr.Number(label="Duration (ms)", value=1000, interactive=True, visible=False, precision=0)
                     grounding_label = gr.Textbox(label="Grounding", interactive=False)
+                autosave_checkbox = gr.Checkbox(label="Autosave", value=AUTOSAVE)
+                rapid_checkbox = gr.Checkbox(label="Rapid mode (keyboard)", value=False)
+                # Frame index of the rapid mode canvas, filled in by the browser when leaving rapid mode
+                rapid_index = gr.Number(visible=False, precision=0)
                 export_button = gr.Button("Export Interaction")
 
         def handle_tool_change(tool_type):
@@ -46,67 +159,77 @@ def annotation_tab():
         tool_selector.change(
             handle_tool_change,
             [tool_selector],
-            [multiclick_clicks, longpress_duration, slide_duration]
+            [multiclick_clicks, longpress_duration, slide_duration],
+            concurrency_limit=None
         )
 
-        def handle_image_click(evt: gr.SelectData, dims, interactions, test_id, image_groups, index, tool_type, clicks, duration, slide_duration):
-            if tool_type not in ['click', 'multiclick', 'longpress', 'slide'] or not dims or not test_id:
+        def handle_image_click(evt: gr.SelectData, token, test_id, index, tool_type, clicks, duration, slide_duration, autosave):
+            session = annotation_sessions.get(token)
+            interactions, image_groups = session.interactions, session.image_groups
+            if not image_groups or not test_id:
+                return gr.update(), gr.update(), gr.update(), gr.update(), gr.update()
+            if tool_type not in ['click', 'multiclick', 'longpress', 'slide']:
                 current_image_path = image_groups[test_id][index]
-                display_image = get_image_for_display(current_image_path, test_id, interactions)
-                return interactions, grounding_label.value, display_image, gr.update(), gr.update(), gr.update()
+                display_image = get_image_for_display(current_image_path, test_id, interactions, display_height=DISPLAY_HEIGHT)
+                return grounding_label.value, display_image, gr.update(), gr.update(), gr.update()
 
-            width, height = dims
+            img_path = image_groups[test_id][index]
+            img_id = os.path.basename(img_path)
+
+            # The click is reported in preview pixels of this frame, so normalize by its own preview size.
+            width, height = display_size(image_groups.image_size(img_path), DISPLAY_HEIGHT)
             norm_x = evt.index[0] / width
             norm_y = evt.index[1] / height
             new_grounding_point = [norm_x, norm_y]
 
-            img_path = image_groups[test_id][index]
-            img_id = os.path.basename(img_path)
+            with session.lock:
+                if test_id not in interactions:
+                    interactions[test_id] = {}
 
-            if test_id not in interactions:
-                interactions[test_id] = {}
+                current_interaction = interactions.get(test_id, {}).get(img_id, {})
+                if current_interaction.get("interaction_type") != tool_type:
+                    current_interaction = {
+                        "interaction_type": tool_type,
+                        "interaction_parameters": {}
+                    }
 
-            current_interaction = interactions.get(test_id, {}).get(img_id, {})
-            if current_interaction.get("interaction_type") != tool_type:
-                current_interaction = {
-                    "interaction_type": tool_type,
-                    "interaction_parameters": {}
-                }
+                interaction_params = current_interaction.get("interaction_parameters", {})
 
-            interaction_params = current_interaction.get("interaction_parameters", {})
+                if tool_type == 'slide':
+                    existing_grounding = interaction_params.get("grounding", [])
+                    if not isinstance(existing_grounding, list) or (existing_grounding and not isinstance(existing_grounding[0], list)):
+                        existing_grounding = []
 
-            if tool_type == 'slide':
-                existing_grounding = interaction_params.get("grounding", [])
-                if not isinstance(existing_grounding, list) or (existing_grounding and not isinstance(existing_grounding[0], list)):
-                    existing_grounding = []
-
-                if len(existing_grounding) < 2:
-                    existing_grounding.append(new_grounding_point)
-                else:
-                    existing_grounding[0] = existing_grounding[1]
-                    existing_grounding[1] = new_grounding_point
+                    if len(existing_grounding) < 2:
+                        existing_grounding.append(new_grounding_point)
+                    else:
+                        existing_grounding[0] = existing_grounding[1]
+                        existing_grounding[1] = new_grounding_point
                 
-                interaction_params["grounding"] = existing_grounding
-                interaction_params['duration'] = slide_duration
-                if 'clicks' in interaction_params: del interaction_params['clicks']
-                grounding_text = ", ".join([f"({p[0]:.4f}, {p[1]:.4f})" for p in existing_grounding])
-            else:
-                interaction_params["grounding"] = new_grounding_point
-                grounding_text = f"({norm_x:.4f}, {norm_y:.4f})"
-                if 'duration' in interaction_params: del interaction_params['duration']
-                if 'clicks' in interaction_params: del interaction_params['clicks']
+                    interaction_params["grounding"] = existing_grounding
+                    interaction_params['duration'] = slide_duration
+                    if 'clicks' in interaction_params: del interaction_params['clicks']
+                    grounding_text = ", ".join([f"({p[0]:.4f}, {p[1]:.4f})" for p in existing_grounding])
+                else:
+                    interaction_params["grounding"] = new_grounding_point
+                    grounding_text = f"({norm_x:.4f}, {norm_y:.4f})"
+                    if 'duration' in interaction_params: del interaction_params['duration']
+                    if 'clicks' in interaction_params: del interaction_params['clicks']
 
-                if tool_type == 'multiclick':
-                    interaction_params['clicks'] = clicks
-                elif tool_type == 'longpress':
-                    interaction_params['duration'] = duration
+                    if tool_type == 'multiclick':
+                        interaction_params['clicks'] = clicks
+                    elif tool_type == 'longpress':
+                        interaction_params['duration'] = duration
 
-            interactions[test_id][img_id] = {
-                "interaction_type": tool_type,
-                "interaction_parameters": interaction_params
-            }
+                interactions[test_id][img_id] = {
+                    "interaction_type": tool_type,
+                    "interaction_parameters": interaction_params
+                }
+                update_trajectory(test_id, interactions[test_id], img_id)
+                record_edit(session, test_id, autosave)
+            show_notices(session)
             
-            display_image = get_image_for_display(img_path, test_id, interactions)
+            display_image = get_image_for_display(img_path, test_id, interactions, display_height=DISPLAY_HEIGHT)
 
             images = image_groups.get(test_id, [])
             disable_buttons = tool_type == 'slide' and len(interaction_params.get("grounding", [])) == 1
@@ -115,73 +238,87 @@ def annotation_tab():
             next_interactive = (index < len(images) - 1) and not disable_buttons
             export_interactive = not disable_buttons
 
-            return interactions, grounding_text, display_image, gr.update(interactive=prev_interactive), gr.update(interactive=next_interactive), gr.update(interactive=export_interactive)
+            return grounding_text, display_image, gr.update(interactive=prev_interactive), gr.update(interactive=next_interactive), gr.update(interactive=export_interactive)
 
+        # Events that decode and draw images share the "render" concurrency group sized in app.py.
         image_display.select(
             handle_image_click, 
-            [image_dimensions_state, interactions_state, current_test_id_state, image_groups_state, current_image_index_state, tool_selector, multiclick_clicks, longpress_duration, slide_duration],
-            [interactions_state, grounding_label, image_display, prev_button, next_button, export_button]
+            [session_state, current_test_id_state, current_image_index_state, tool_selector, multiclick_clicks, longpress_duration, slide_duration, autosave_checkbox],
+            [grounding_label, image_display, prev_button, next_button, export_button],
+            concurrency_id="render", concurrency_limit=render_concurrency_limit
         )
 
-        def start_process(folder_path):
-            images, test_id, message, image_groups, dims, interactions = process_folder(folder_path)
+        def prefetch_neighbours(test_id, index, token, request: gr.Request):
+            # Runs after the frame has been sent, so Previous/Next can be served from the render cache.
+            session = annotation_sessions.get(token)
+            if session.image_groups:
+                # Copied under the session lock, since a click in this tab may be editing the frames right now.
+                with session.lock:
+                    snapshot = {test_id: copy.deepcopy(session.interactions.get(test_id, {}))}
+                prefetcher.schedule(request.session_hash, test_id, session.image_groups.get(test_id, []), index, snapshot, display_height=DISPLAY_HEIGHT)
+
+        prefetch_inputs = [current_test_id_state, current_image_index_state, session_state]
+
+        def start_process(folder_path, token):
+            images, test_id, message, image_groups, _, interactions = process_folder(folder_path)
+            token, session = annotation_sessions.create(token)
 
             test_ids = sorted(list(image_groups.keys()))
             
             if not images:
                 gr.Warning("No valid data found in the selected folder.", duration=2)
-                return {}, "", 0, gr.update(choices=[], value=None), None, None, {}, folder_path, "", gr.update(interactive=False), gr.update(interactive=False)
+                return token, "", 0, gr.update(choices=[], value=None), None, "", gr.update(interactive=False), gr.update(interactive=False)
+
+            session.folder_path = folder_path
+            session.image_groups = image_groups
+            session.interactions = interactions
             
             gr.Info(f"Successfully loaded data from {folder_path}", duration=2)
             first_image_path = images[0]
             img_id = os.path.basename(first_image_path)
-            display_image = get_image_for_display(first_image_path, test_id, interactions)
+            display_image = get_image_for_display(first_image_path, test_id, interactions, display_height=DISPLAY_HEIGHT)
             img_label = f"{img_id} (1/{len(images)})"
 
             return (
-                image_groups,
+                token,
                 test_id,
                 0,
                 gr.update(choices=test_ids, value=test_id),
                 display_image,
-                dims,
-                interactions,
-                folder_path,
                 img_label,
                 gr.update(interactive=False), # Disable prev
                 gr.update(interactive=len(images) > 1) # Enable next if more than 1 image
             )
 
-        start_button.click(
+        folder_loaded = start_button.click(
             fn=start_process,
-            inputs=[folder_input],
+            inputs=[folder_input, session_state],
             outputs=[
-                image_groups_state,
+                session_state,
                 current_test_id_state,
                 current_image_index_state,
                 test_id_dropdown,
                 image_display,
-                image_dimensions_state,
-                interactions_state,
-                folder_path_state,
                 img_id_label,
                 prev_button,
                 next_button
             ],
+            concurrency_id="render", concurrency_limit=render_concurrency_limit
         )
+        folder_loaded.then(prefetch_neighbours, prefetch_inputs, None, show_progress="hidden", concurrency_limit=None)
 
-        def update_gallery(test_id, image_groups, interactions):
+        def update_gallery(test_id, token):
+            session = annotation_sessions.get(token)
+            interactions, image_groups = session.interactions, session.image_groups
             if not test_id or not image_groups:
-                return None, 0, None, "", interactions, "", gr.update(interactive=False), gr.update(interactive=False), "click", 2, 1000, 1000, test_id, gr.update(interactive=True)
+                return None, 0, "", "", gr.update(interactive=False), gr.update(interactive=False), "click", 2, 1000, 1000, test_id, gr.update(interactive=True)
 
             images = image_groups.get(test_id, [])
             if not images:
-                return None, 0, None, "", interactions, "", gr.update(interactive=False), gr.update(interactive=False), "click", 2, 1000, 1000, test_id, gr.update(interactive=True)
+                return None, 0, "", "", gr.update(interactive=False), gr.update(interactive=False), "click", 2, 1000, 1000, test_id, gr.update(interactive=True)
             
             image_path = images[0]
             img_id = os.path.basename(image_path)
-            with Image.open(image_path) as img:
-                dims = img.size
 
             tool_type = "click"
             clicks = 2
@@ -211,26 +348,31 @@ def annotation_tab():
                 elif tool_type == 'slide':
                     slide_duration = interaction_params.get('duration', 1000)
 
-            display_image = get_image_for_display(image_path, test_id, interactions)
+            display_image = get_image_for_display(image_path, test_id, interactions, display_height=DISPLAY_HEIGHT)
             img_label = f"{img_id} (1/{len(images)})"
 
             return (
-                display_image, 0, dims, grounding_text, interactions, img_label, 
+                display_image, 0, grounding_text, img_label, 
                 gr.update(interactive=False), gr.update(interactive=len(images) > 1 and not disable_buttons),
                 tool_type, clicks, duration, slide_duration, test_id, gr.update(interactive=not disable_buttons)
             )
 
-        test_id_dropdown.change(
+        test_id_loaded = test_id_dropdown.change(
             fn=update_gallery,
-            inputs=[test_id_dropdown, image_groups_state, interactions_state],
+            inputs=[test_id_dropdown, session_state],
             outputs=[
-                image_display, current_image_index_state, image_dimensions_state, 
-                grounding_label, interactions_state, img_id_label, prev_button, next_button,
+                image_display, current_image_index_state, 
+                grounding_label, img_id_label, prev_button, next_button,
                 tool_selector, multiclick_clicks, longpress_duration, slide_duration, current_test_id_state, export_button
-            ]
+            ],
+            concurrency_id="render", concurrency_limit=render_concurrency_limit
         )
+        test_id_loaded.then(prefetch_neighbours, prefetch_inputs, None, show_progress="hidden", concurrency_limit=None)
 
-        def change_image(direction, test_id, index, image_groups, interactions, tool_type, clicks, duration, slide_duration):
+        def change_image(direction, test_id, index, token, tool_type, clicks, duration, slide_duration):
+            session = annotation_sessions.get(token)
+            show_notices(session)
+            interactions, image_groups = session.interactions, session.image_groups
             new_index = index + direction
             images = image_groups.get(test_id, [])
 
@@ -268,7 +410,7 @@ def annotation_tab():
                 elif tool_type == 'slide':
                     slide_duration = interaction_params.get('duration', 1000)
 
-            display_image = get_image_for_display(image_path, test_id, interactions)
+            display_image = get_image_for_display(image_path, test_id, interactions, display_height=DISPLAY_HEIGHT)
             img_label = f"{img_id} ({new_index + 1}/{len(images)})"
 
             return (
@@ -279,42 +421,107 @@ def annotation_tab():
             )
 
         prev_button.click(
-            fn=lambda test_id, index, image_groups, interactions, tool_type, clicks, duration, slide_duration: change_image(-1, test_id, index, image_groups, interactions, tool_type, clicks, duration, slide_duration),
-            inputs=[current_test_id_state, current_image_index_state, image_groups_state, interactions_state, tool_selector, multiclick_clicks, longpress_duration, slide_duration],
+            fn=lambda test_id, index, token, tool_type, clicks, duration, slide_duration: change_image(-1, test_id, index, token, tool_type, clicks, duration, slide_duration),
+            inputs=[current_test_id_state, current_image_index_state, session_state, tool_selector, multiclick_clicks, longpress_duration, slide_duration],
             outputs=[
                 image_display, current_image_index_state, img_id_label, grounding_label, 
                 prev_button, next_button, tool_selector, multiclick_clicks, longpress_duration, slide_duration, export_button
-            ]
-        )
+            ],
+            concurrency_id="render", concurrency_limit=render_concurrency_limit
+        ).then(prefetch_neighbours, prefetch_inputs, None, show_progress="hidden", concurrency_limit=None)
 
         next_button.click(
-            fn=lambda test_id, index, image_groups, interactions, tool_type, clicks, duration, slide_duration: change_image(1, test_id, index, image_groups, interactions, tool_type, clicks, duration, slide_duration),
-            inputs=[current_test_id_state, current_image_index_state, image_groups_state, interactions_state, tool_selector, multiclick_clicks, longpress_duration, slide_duration],
+            fn=lambda test_id, index, token, tool_type, clicks, duration, slide_duration: change_image(1, test_id, index, token, tool_type, clicks, duration, slide_duration),
+            inputs=[current_test_id_state, current_image_index_state, session_state, tool_selector, multiclick_clicks, longpress_duration, slide_duration],
             outputs=[
                 image_display, current_image_index_state, img_id_label, grounding_label, 
                 prev_button, next_button, tool_selector, multiclick_clicks, longpress_duration, slide_duration, export_button
-            ]
-        )
+            ],
+            concurrency_id="render", concurrency_limit=render_concurrency_limit
+        ).then(prefetch_neighbours, prefetch_inputs, None, show_progress="hidden", concurrency_limit=None)
 
-        def export_interactions(interactions, folder_path):
+        def export_interactions(token):
+            session = annotation_sessions.get(token)
+            interactions, modified_test_ids, folder_path = session.interactions, session.modified_test_ids, session.folder_path
             if not folder_path or not interactions:
                 gr.Warning("No interactions to export!", duration=2)
                 return
 
-            base_folder_path = os.path.join("test_folder", folder_path)
-            export_dir = os.path.join(base_folder_path, "test_img")
-            
             try:
-                os.makedirs(export_dir, exist_ok=True)
-                export_path = os.path.join(export_dir, "interactions.json")
-                with open(export_path, 'w') as f:
-                    json.dump(interactions, f, indent=4)
-                gr.Info(f"Interactions exported to {export_path}", duration=2)
+                exported = sorted(modified_test_ids)
+                if exported:
+                    # Only this session's edited test IDs are merged into the folder's saved interactions.
+                    with session.lock:
+                        conflicts = interactions.commit(exported)
+                    modified_test_ids.difference_update(set(exported) - set(conflicts))
+                    session.autosave_conflicts.difference_update(set(exported) - set(conflicts))
+                    if conflicts:
+                        gr.Warning(f"{', '.join(conflicts)} changed in another session since you opened it. Export again to overwrite.", duration=5)
+                    if len(conflicts) < len(exported):
+                        gr.Info(f"Interactions exported to {interactions.store.test_img_dir}", duration=2)
+                else:
+                    # With no edits, the saved file is rewritten from everything committed so far.
+                    export_path = interactions.store.save_all()
+                    gr.Info(f"Interactions exported to {export_path}", duration=2)
             except Exception as e:
                 gr.Warning(f"Error exporting interactions: {e}", duration=2)
 
         export_button.click(
             export_interactions,
-            [interactions_state, folder_path_state],
-            []
-        )
\ No newline at end of file
+            [session_state],
+            [],
+            js=FLUSH_JS
+        )
+
+        def toggle_rapid_mode(rapid, canvas_index, token, test_id, index, tool_type, clicks, duration, slide_duration, autosave):
+            if rapid:
+                session = annotation_sessions.get(token)
+                if not session.image_groups or not test_id:
+                    gr.Warning("Load a test folder before switching to rapid mode.", duration=2)
+                    return (gr.update(value=False),) + (gr.update(),) * 12
+                value = canvas_value(token, test_id, session.image_groups, session.interactions, index, tool_type, clicks, duration, slide_duration, autosave)
+                return (
+                    gr.update(), gr.update(visible=False), gr.update(visible=True, value=value),
+                    gr.update(), gr.update(), gr.update(),
+                    # Frames and tools are switched from the keyboard until rapid mode is left.
+                    gr.update(interactive=False), gr.update(interactive=False), gr.update(interactive=False),
+                    gr.update(), gr.update(), gr.update(), gr.update()
+                )
+
+            # Show the frame the canvas was on, with everything annotated there.
+            if canvas_index is not None:
+                index = int(canvas_index)
+            display_image, new_index, img_label, grounding_text, prev_update, next_update, tool_type, clicks, duration, slide_duration, export_update = change_image(0, test_id, index, token, tool_type, clicks, duration, slide_duration)
+            tool_update = gr.update(interactive=True) if isinstance(tool_type, dict) else gr.update(value=tool_type, interactive=True)
+            return (
+                gr.update(), gr.update(value=display_image, visible=True), gr.update(visible=False, value=None),
+                new_index, img_label, grounding_text, prev_update, next_update, tool_update,
+                clicks, duration, slide_duration, export_update
+            )
+
+        rapid_checkbox.input(
+            toggle_rapid_mode,
+            [rapid_checkbox, rapid_index, session_state, current_test_id_state, current_image_index_state, tool_selector, multiclick_clicks, longpress_duration, slide_duration, autosave_checkbox],
+            [
+                rapid_checkbox, image_display, rapid_canvas, current_image_index_state, img_id_label, grounding_label,
+                prev_button, next_button, tool_selector, multiclick_clicks, longpress_duration, slide_duration, export_button
+            ],
+            js=TOGGLE_JS,
+            concurrency_id="render", concurrency_limit=render_concurrency_limit
+        )
+
+        def reload_rapid_canvas(rapid, token, test_id, index, tool_type, clicks, duration, slide_duration, autosave):
+            # A new folder or test ID while in rapid mode is annotated on the canvas too.
+            session = annotation_sessions.get(token)
+            if not rapid or not session.image_groups or not test_id:
+                return gr.update(), gr.update(), gr.update(), gr.update()
+            value = canvas_value(token, test_id, session.image_groups, session.interactions, index, tool_type, clicks, duration, slide_duration, autosave)
+            return value, gr.update(interactive=False), gr.update(interactive=False), gr.update(interactive=False)
+
+        for loaded in (folder_loaded, test_id_loaded):
+            loaded.then(
+                reload_rapid_canvas,
+                [rapid_checkbox, session_state, current_test_id_state, current_image_index_state, tool_selector, multiclick_clicks, longpress_duration, slide_duration, autosave_checkbox],
+                [rapid_canvas, prev_button, next_button, tool_selector],
+                concurrency_limit=None
+            )
\ No newline at end of file
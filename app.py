@@ -1,19 +1,45 @@
+import argparse
+import os
 import gradio as gr
 from annotation_tab import annotation_tab
 from calculate_tab import calculate_tab
 
-def create_app():
+def env_int(name, default=None):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+# You can adjust these with the matching command-line flags or environment variables.
+# Requests allowed to wait in the queue before new ones are rejected; None means unlimited.
+QUEUE_SIZE = env_int("QUEUE_SIZE")
+# Workers shared by the events that decode and draw images (clicks, navigation, plots).
+RENDER_CONCURRENCY_LIMIT = env_int("RENDER_CONCURRENCY_LIMIT", 4)
+# Workers per event for everything else, such as exports.
+DEFAULT_CONCURRENCY_LIMIT = env_int("DEFAULT_CONCURRENCY_LIMIT", 1)
+# Threads available to the server for running event handlers.
+MAX_THREADS = env_int("MAX_THREADS", 40)
+
+def create_app(queue_size=QUEUE_SIZE, render_concurrency_limit=RENDER_CONCURRENCY_LIMIT, default_concurrency_limit=DEFAULT_CONCURRENCY_LIMIT):
     with gr.Blocks() as app:
         gr.HTML("""<style>
         .gr-image { pointer-events: none; }
         </style>""")
-        
+
         with gr.Tabs() as main_tabs:
-            annotation_tab()
-            calculate_tab()
-            
+            annotation_tab(render_concurrency_limit)
+            calculate_tab(render_concurrency_limit)
+
+    app.queue(max_size=queue_size, default_concurrency_limit=default_concurrency_limit)
     return app
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Interaction annotation and analysis platform.")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="Maximum queued requests (env QUEUE_SIZE, default unlimited).")
+    parser.add_argument("--render-concurrency-limit", type=int, default=RENDER_CONCURRENCY_LIMIT, help="Concurrent image/plot rendering events (env RENDER_CONCURRENCY_LIMIT).")
+    parser.add_argument("--default-concurrency-limit", type=int, default=DEFAULT_CONCURRENCY_LIMIT, help="Concurrent runs of each other event (env DEFAULT_CONCURRENCY_LIMIT).")
+    parser.add_argument("--max-threads", type=int, default=MAX_THREADS, help="Server worker threads (env MAX_THREADS).")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    app = create_app()
-    app.launch()
\ No newline at end of file
+    args = parse_args()
+    app = create_app(args.queue_size, args.render_concurrency_limit, args.default_concurrency_limit)
+    app.launch(max_threads=args.max_threads)
@@ -0,0 +1,108 @@
+import atexit
+import copy
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class AutoSaver:
+    """Saves edited test IDs from a background thread once edits have paused for `delay` seconds.
+
+    mark only records a copy of the test ID's frames, so the request thread never waits on disk.
+    A burst of clicks on the same test ID is coalesced into a single write of its latest state.
+    Writes are commits to the session's SessionInteractions. If another session committed the same
+    test ID in between, nothing is written for it: the snapshot is dropped and on_conflict is called,
+    so the session can leave the test ID to an explicit export. A failed write is retried with a
+    doubling delay; once `retries` retries have failed too, the snapshots are dropped and on_failure
+    is called the same way.
+    """
+
+    def __init__(self, delay=2.0, retries=3):
+        self.delay = delay
+        self.retries = retries
+        self.writes = 0
+        self.errors = 0
+        # id of a SessionInteractions -> (that SessionInteractions, {test ID: frames to write}, on_conflict, on_failure)
+        self._pending = {}
+        # id of a SessionInteractions -> failed writes in a row
+        self._failures = {}
+        self._deadline = 0.0
+        self._cond = threading.Condition()
+        # Held while a batch is taken and written, so an older batch never lands after a newer one.
+        self._write_lock = threading.Lock()
+        self._thread = None
+
+    def mark(self, interactions, test_id, on_conflict=None, on_failure=None):
+        """Schedules the current frames of test_id in a SessionInteractions to be committed.
+
+        on_conflict is called from the autosave thread with the test IDs that were not written because
+        another session committed them first, on_failure with the test IDs given up on and the error.
+        """
+        snapshot = copy.deepcopy(interactions.get(test_id))
+        with self._cond:
+            entry = self._pending.get(id(interactions))
+            if entry is None:
+                entry = self._pending[id(interactions)] = (interactions, {}, on_conflict, on_failure)
+            entry[1][test_id] = snapshot
+            self._deadline = time.monotonic() + self.delay
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def flush(self):
+        """Writes everything still pending right away."""
+        with self._write_lock:
+            with self._cond:
+                batch, self._pending = self._pending, {}
+            self._write(batch)
+
+    def pending(self):
+        with self._cond:
+            return sum(len(entry[1]) for entry in self._pending.values())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                while (remaining := self._deadline - time.monotonic()) > 0:
+                    self._cond.wait(remaining)
+            self.flush()
+
+    def _write(self, batch):
+        for key, (interactions, frames, on_conflict, on_failure) in batch.items():
+            try:
+                # Conflicts are not rebased, so a later autosave cannot overwrite the other session either.
+                conflicts = interactions.commit(list(frames), frames, rebase_conflicts=False)
+            except Exception as e:
+                self.errors += 1
+                failures = self._failures[key] = self._failures.get(key, 0) + 1
+                if failures > self.retries:
+                    del self._failures[key]
+                    logger.error("Autosave to %s failed %d times, giving up on %s", interactions.store.test_img_dir, failures, ", ".join(frames), exc_info=True)
+                    if on_failure:
+                        on_failure(sorted(frames), e)
+                    continue
+                logger.warning("Autosave to %s failed, retrying: %s", interactions.store.test_img_dir, e)
+                with self._cond:
+                    # Keep anything edited since, and try again after a delay that doubles with every failure.
+                    retry = self._pending.setdefault(key, (interactions, {}, on_conflict, on_failure))[1]
+                    for test_id, snapshot in frames.items():
+                        retry.setdefault(test_id, snapshot)
+                    self._deadline = max(self._deadline, time.monotonic() + self.delay * 2 ** failures)
+                    self._cond.notify()
+                continue
+            self._failures.pop(key, None)
+            self.writes += 1
+            if conflicts:
+                logger.warning("Autosave skipped %s, changed in another session", ", ".join(conflicts))
+                if on_conflict:
+                    on_conflict(conflicts)
+
+# You can adjust the debounce window, in seconds, with the AUTOSAVE_DELAY environment variable,
+# and how many times a failed write is retried before giving up with AUTOSAVE_RETRIES.
+autosaver = AutoSaver(delay=float(os.environ.get("AUTOSAVE_DELAY", 2.0)), retries=int(os.environ.get("AUTOSAVE_RETRIES", 3)))
+atexit.register(autosaver.flush)
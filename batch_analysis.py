@@ -0,0 +1,175 @@
+"""Headless scoring of every annotated test ID, for nightly reports without the UI.
+
+Run from the repository root:
+
+    python batch_analysis.py [--root test_folder] [--output report] [--format csv|parquet] [--workers N]
+
+Writes <output>_summary.<ext> with one row per test ID and <output>_steps.<ext> with one row per
+interaction point, using the same metrics as the Load Calculate tab.
+"""
+import argparse
+import csv
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from folder_index import FolderIndex
+from path_metrics import compute_path_metrics
+from storage import load_all_interactions
+from utils import get_test_folders
+
+SUMMARY_FIELDS = ["folder", "test_id", "frames", "annotated_frames", "points", "mean_distance", "std_distance",
+                  "total_distance", "mean_score", "min_score", "max_score", "worst_img_id"]
+STEP_FIELDS = ["folder", "test_id", "step", "img_id", "interaction_type", "start_x", "start_y", "end_x", "end_y",
+               "distance_to_next", "mean_without", "score"]
+
+def iter_tasks(root, folders=None, batch_size=16):
+    """Yields (folder, test_img_dir, [(test_id, frames), ...]) batches of the test IDs with images under root.
+
+    Only test IDs are listed here; their images are read by the workers in analyze_batch.
+    """
+    for folder in sorted(folders or get_test_folders(root)):
+        test_img_dir = os.path.join(root, folder, "test_img")
+        if not os.path.isdir(test_img_dir):
+            continue
+        interactions = load_all_interactions(test_img_dir)
+        batch = []
+        for test_id in FolderIndex(test_img_dir, read_only=True):
+            batch.append((test_id, interactions.get(test_id, {})))
+            if len(batch) == batch_size:
+                yield folder, test_img_dir, batch
+                batch = []
+        if batch:
+            yield folder, test_img_dir, batch
+
+def _float(value):
+    value = float(value)
+    return None if math.isnan(value) else value
+
+# Folder indexes of the worker process, so its manifest is parsed once per folder rather than once per batch.
+_worker_indexes = {}
+
+def analyze_batch(task):
+    """Lists the images of a batch of test IDs and scores them.
+
+    Returns (test_img_dir, results, changes): analyze_test_id's result for each test ID, and the manifest
+    records rescanned for the batch, which the parent merges so the manifest is written once per folder.
+    """
+    folder, test_img_dir, batch = task
+    image_groups = _worker_indexes.get(test_img_dir)
+    if image_groups is None:
+        image_groups = _worker_indexes[test_img_dir] = FolderIndex(test_img_dir, read_only=True)
+    results = []
+    for test_id, frames in batch:
+        images = image_groups.get(test_id)
+        if images:
+            results.append(analyze_test_id((folder, test_id, frames, image_groups.frame_sizes(test_id), len(images))))
+    return test_img_dir, results, image_groups.take_changes()
+
+def analyze_test_id(task):
+    """Returns the summary row and step rows of one test ID."""
+    folder, test_id, frames, dims, frame_count = task
+    summary = dict.fromkeys(SUMMARY_FIELDS)
+    summary.update(folder=folder, test_id=test_id, frames=frame_count, annotated_frames=len(frames), points=0)
+
+    metrics = compute_path_metrics({test_id: frames}, test_id, dims, key=test_id)
+    if metrics is None:
+        return summary, []
+
+    scores = metrics.scores
+    has_scores = not np.isnan(scores).all()
+    summary.update(
+        points=len(metrics.img_ids),
+        mean_distance=_float(metrics.mean),
+        std_distance=_float(metrics.std),
+        total_distance=_float(metrics.distances.sum()),
+        mean_score=_float(np.nanmean(scores)) if has_scores else None,
+        min_score=_float(np.nanmin(scores)) if has_scores else None,
+        max_score=_float(np.nanmax(scores)) if has_scores else None,
+        worst_img_id=metrics.img_ids[int(np.nanargmin(scores))] if has_scores else None,
+    )
+
+    steps = []
+    for step, img_id in enumerate(metrics.img_ids):
+        steps.append({
+            "folder": folder,
+            "test_id": test_id,
+            "step": step,
+            "img_id": img_id,
+            "interaction_type": frames[img_id].get("interaction_type"),
+            "start_x": _float(metrics.starts[step, 0]),
+            "start_y": _float(metrics.starts[step, 1]),
+            "end_x": _float(metrics.ends[step, 0]),
+            "end_y": _float(metrics.ends[step, 1]),
+            "distance_to_next": _float(metrics.distances[step]) if step < len(metrics.distances) else None,
+            "mean_without": _float(metrics.means_without[step]),
+            "score": _float(scores[step]),
+        })
+    return summary, steps
+
+def collect(batches):
+    """Gathers analyze_batch results into (summaries, steps), writing each folder's manifest once at the end."""
+    summaries, steps, indexes = [], [], {}
+    for test_img_dir, results, changes in batches:
+        for summary, test_steps in results:
+            summaries.append(summary)
+            steps.extend(test_steps)
+        if changes:
+            if test_img_dir not in indexes:
+                indexes[test_img_dir] = FolderIndex(test_img_dir)
+            indexes[test_img_dir].merge(changes)
+    for image_groups in indexes.values():
+        image_groups.flush()
+    return summaries, steps
+
+def run_analysis(tasks, workers=None):
+    """Analyzes iter_tasks batches on a process pool (in this process when workers is 0). Returns (summaries, steps)."""
+    if workers == 0:
+        _worker_indexes.clear()
+        return collect(map(analyze_batch, tasks))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Image headers are read in the workers too, so a cold folder is indexed in parallel.
+        return collect(executor.map(analyze_batch, tasks))
+
+def write_report(rows, fields, path, fmt):
+    if fmt == "parquet":
+        import pandas as pd
+        pd.DataFrame(rows, columns=fields).to_parquet(path, index=False)
+        return
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", default="test_folder", help="Directory holding the test folders.")
+    parser.add_argument("--folders", nargs="*", help="Only these test folders (default: all).")
+    parser.add_argument("--output", default="report", help="Path prefix of the report files.")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU, 0: no pool).")
+    args = parser.parse_args(argv)
+
+    if args.format == "parquet":
+        try:
+            import pandas
+            pandas.io.parquet.get_engine("auto")
+        except ImportError as e:
+            sys.exit(f"Parquet output needs pandas with pyarrow or fastparquet installed: {e}")
+
+    start = time.perf_counter()
+    summaries, steps = run_analysis(iter_tasks(args.root, args.folders), args.workers)
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    summary_path = f"{args.output}_summary.{args.format}"
+    steps_path = f"{args.output}_steps.{args.format}"
+    write_report(summaries, SUMMARY_FIELDS, summary_path, args.format)
+    write_report(steps, STEP_FIELDS, steps_path, args.format)
+    print(f"Scored {len(summaries)} test IDs ({len(steps)} steps) in {time.perf_counter() - start:.2f} s")
+    print(f"Wrote {summary_path} and {steps_path}")
+
+if __name__ == "__main__":
+    main()
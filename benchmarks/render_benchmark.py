@@ -0,0 +1,84 @@
+"""Micro-benchmark: full-frame overlay compositing vs. dirty-region compositing.
+
+Run from the repository root:
+
+    python benchmarks/render_benchmark.py [--repeat 5]
+"""
+import argparse
+import glob
+import math
+import os
+import sys
+import timeit
+
+from PIL import Image, ImageDraw, ImageColor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cache import image_cache
+from utils import draw_point_on_image, paste_marker
+
+
+def full_frame_draw_point_on_image(image_path, normalized_coords, color="red", interaction_type="click", trajectory_points=None):
+    """The previous renderer: full-size RGBA overlay blended over the whole frame."""
+    with Image.open(image_path) as base_img:
+        base_img = base_img.convert("RGBA")
+        overlay = Image.new("RGBA", base_img.size, (255, 255, 255, 0))
+        draw = ImageDraw.Draw(overlay)
+        width, height = base_img.size
+        rgb_color = ImageColor.getrgb(color)
+
+        if trajectory_points and len(trajectory_points) > 1:
+            pixel_points = [(p[0] * width, p[1] * height) for p in trajectory_points]
+            num_segments = len(pixel_points) - 1
+            for i in range(num_segments):
+                alpha = int(255 * ((i + 1) / num_segments))
+                draw.line([pixel_points[i], pixel_points[i + 1]], fill=(255, 0, 0, alpha), width=5)
+
+        coords_to_draw = normalized_coords if isinstance(normalized_coords[0], (list, tuple)) else [normalized_coords]
+        for coords in coords_to_draw:
+            paste_marker(overlay, coords[0] * width, coords[1] * height, rgb_color, 100, 25)
+
+        if interaction_type == 'slide' and len(coords_to_draw) == 2:
+            x1, y1 = coords_to_draw[0][0] * width, coords_to_draw[0][1] * height
+            x2, y2 = coords_to_draw[1][0] * width, coords_to_draw[1][1] * height
+            draw.line([(x1, y1), (x2, y2)], fill=rgb_color + (255,), width=10)
+            angle = math.atan2(y1 - y2, x1 - x2)
+            head = [(x2, y2)] + [(x2 + 80 * math.cos(angle + a), y2 + 80 * math.sin(angle + a)) for a in (-math.pi / 8, math.pi / 8)]
+            draw.polygon(head, fill=rgb_color + (255,))
+
+        return Image.alpha_composite(base_img, overlay).convert("RGB")
+
+
+CASES = {
+    "click": dict(normalized_coords=[0.5, 0.5], color="red", interaction_type="click"),
+    "slide": dict(normalized_coords=[[0.5, 0.7], [0.5, 0.3]], color="green", interaction_type="slide"),
+    "trajectory": dict(normalized_coords=[0.5, 0.5], color="red", interaction_type="click",
+                       trajectory_points=[[0.2, 0.8], [0.3, 0.6], [0.45, 0.55], [0.5, 0.5]]),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--folder", default="test_folder")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=10, help="Number of sample images to use.")
+    args = parser.parse_args()
+
+    images = sorted(glob.glob(os.path.join(args.folder, "*", "test_img", "*", "imgs", "*")))[:args.limit]
+    if not images:
+        sys.exit(f"No sample images found under {args.folder}")
+
+    print(f"{len(images)} images, best of {args.repeat} runs (ms per render)")
+    print(f"{'case':<12}{'full frame':>12}{'dirty region':>14}{'speedup':>10}")
+    for name, kwargs in CASES.items():
+        results = []
+        for renderer in (full_frame_draw_point_on_image, draw_point_on_image):
+            # Clear the decoded-image cache so both paths pay the same decode cost.
+            run = lambda: [(image_cache.clear(), renderer(path, **kwargs)) for path in images]
+            best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+            results.append(best / len(images) * 1000)
+        print(f"{name:<12}{results[0]:>12.2f}{results[1]:>14.2f}{results[0] / results[1]:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from PIL import Image
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by the total size of its values."""
+
+    def __init__(self, max_size, sizeof=None):
+        self.max_size = max_size
+        self.sizeof = sizeof or (lambda value: 1)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            if size > self.max_size:
+                return value
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_size:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            value, size = self._entries.pop(key)
+            self._size -= size
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "size": self._size, "max_size": self.max_size}
+
+def image_nbytes(img):
+    return img.width * img.height * len(img.getbands())
+
+# You can adjust the memory budget of decoded screenshots with the IMAGE_CACHE_MB environment variable.
+image_cache = LRUCache(int(os.environ.get("IMAGE_CACHE_MB", 512)) * 1024 * 1024, sizeof=image_nbytes)
+
+# Composited previews, keyed by everything drawn on them. Budget set with RENDER_CACHE_MB.
+render_cache = LRUCache(int(os.environ.get("RENDER_CACHE_MB", 256)) * 1024 * 1024, sizeof=image_nbytes)
+
+# Header-only (width, height) lookups are tiny, so they get their own entry-count bound.
+image_size_cache = LRUCache(100000)
+
+# You can adjust how often, in seconds, the mtime of a cached screenshot is checked with IMAGE_RECHECK_SECONDS.
+IMAGE_RECHECK_SECONDS = float(os.environ.get("IMAGE_RECHECK_SECONDS", 2.0))
+
+# (st_mtime_ns, when it was read) per file path.
+_mtime_cache = LRUCache(100000)
+
+def file_mtime(path):
+    """Returns the mtime of a file for cache keys, stat-ing it at most once every IMAGE_RECHECK_SECONDS.
+
+    A file replaced within that window keeps being served from the caches until the next check.
+    """
+    now = time.monotonic()
+    entry = _mtime_cache.get(path)
+    if entry is None or now - entry[1] >= IMAGE_RECHECK_SECONDS:
+        entry = _mtime_cache.put(path, (os.stat(path).st_mtime_ns, now))
+    return entry[0]
+
+def load_image(image_path, size=None):
+    """Returns the decoded RGB image from the process-wide cache, optionally downscaled to size.
+
+    The result is shared, do not draw on it.
+    """
+    size = tuple(size) if size else None
+    key = (image_path, file_mtime(image_path), size)
+    img = image_cache.get(key)
+    if img is None:
+        with Image.open(image_path) as f:
+            if size and size != f.size:
+                # Let the JPEG decoder skip resolution we are about to throw away.
+                f.draft("RGB", size)
+                img = f.convert("RGB")
+                if img.size != size:
+                    img = img.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+            else:
+                img = f.convert("RGB")
+        image_cache.put(key, img)
+    return img
+
+def get_image_size(image_path):
+    """Returns (width, height) read from the file header, without decoding the image."""
+    key = (image_path, file_mtime(image_path))
+    size = image_size_cache.get(key)
+    if size is None:
+        with Image.open(image_path) as img:
+            size = image_size_cache.put(key, img.size)
+    return size
@@ -1,100 +1,149 @@
 import gradio as gr
 from regex import D
 from utils import get_test_folders, process_folder, get_image_for_display
+from path_metrics import get_path_metrics, get_folder_aggregate, PERCENTILES
+from cache import LRUCache
+from sessions import SessionStore, SESSION_TTL
+from patch_plot import PatchPlot, plot_value, message_value
 import os
-from PIL import Image
+import plotly.colors
 import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 import numpy as np
-import math
 import pandas as pd
 
-def calculate_euclidean_distance(p1, p2, dims):
-    """Calculates the scaled Euclidean distance between two normalized points."""
-    return math.sqrt(((p1[0] - p2[0]) * dims[0])**2 + (((p1[1] - p2[1]) * dims[1])**2))
+# Previews are rendered for the height of the image widgets.
+DISPLAY_HEIGHT = 300
+
+# Figures as plain dicts, without the parts that move with the current step. Keyed by PathMetrics.key.
+_figure_cache = LRUCache(256)
+
+# You can adjust these with the PLOT_WEBGL_THRESHOLD and PLOT_MAX_POINTS environment variables.
+# Above this many steps, distance plots switch to WebGL traces on a numeric step axis.
+WEBGL_THRESHOLD = int(os.environ.get("PLOT_WEBGL_THRESHOLD", 500))
+# WebGL distance traces are decimated to about this many points, keeping the min and max of each bucket; 0 disables it.
+MAX_PLOT_POINTS = int(os.environ.get("PLOT_MAX_POINTS", 2000))
+# You can send only the overlay patches on every Simple Path step, instead of whole figures to gr.Plot, with PATCH_PLOTS=1.
+PATCH_PLOTS = os.environ.get("PATCH_PLOTS", "0") == "1"
+
+def highlight_marker(x, y, color, name=None):
+    marker = dict(type="scatter", x=[x], y=[y], mode="markers", marker=dict(color=color, size=12, symbol="circle-open-dot"))
+    if name:
+        marker["name"] = name
+    return marker
+
+def hline_shape(y, dash, color):
+    """The shape fig.add_hline() would add."""
+    return dict(type="line", xref="x domain", x0=0, x1=1, yref="y", y0=y, y1=y, line=dict(dash=dash, color=color))
+
+def mean_band_shape(y):
+    """The shaded band from zero up to the mean, drawn behind the traces."""
+    return dict(type="rect", xref="x domain", x0=0, x1=1, yref="y", y0=0, y1=y, fillcolor='rgba(255, 0, 0, 0.1)', line=dict(width=0), layer="below")
+
+def step_x(step, webgl):
+    """The x value of a step on the distance axis: the "1-2" label, or the step number on a WebGL plot."""
+    return step if webgl else f"{step}-{step + 1}"
+
+def decimate_minmax(values, max_points):
+    """Indices of the values to draw: the first, the last and the min and max of each bucket, so spikes survive."""
+    if not max_points or len(values) <= max_points:
+        return np.arange(len(values))
+    edges = np.linspace(0, len(values), max(max_points // 2, 1) + 1).astype(int)
+    keep = {0, len(values) - 1}
+    for start, end in zip(edges[:-1], edges[1:]):
+        keep.add(start + int(np.argmin(values[start:end])))
+        keep.add(start + int(np.argmax(values[start:end])))
+    return np.array(sorted(keep))
+
+def distance_trace(distances, webgl, **trace_kwargs):
+    """The trace of a distance series: go.Scatter over step labels, or a decimated go.Scattergl over step numbers."""
+    distances = np.asarray(distances, dtype=float)
+    if not webgl:
+        x_values = [step_x(i, False) for i in range(1, len(distances) + 1)]
+        return go.Scatter(x=x_values, y=distances.tolist(), mode='lines+markers', **trace_kwargs)
+    keep = decimate_minmax(distances, MAX_PLOT_POINTS)
+    return go.Scattergl(x=(keep + 1).tolist(), y=distances[keep].tolist(), mode='lines', **trace_kwargs)
+
+def with_overlays(base_figure, traces, shapes):
+    """Returns a Figure of a cached base figure dict with per-step traces and shapes added on top."""
+    layout = dict(base_figure["layout"])
+    layout["shapes"] = list(layout.get("shapes", ())) + shapes
+    # The base was validated when it was built and the overlays are known-good, so skip revalidation.
+    return go.Figure(dict(data=base_figure["data"] + traces, layout=layout), _validate=False)
+
+def render_plot(figure_key, base_figure, traces, shapes, sent_key=None):
+    """Returns (value, key) for a Simple Path plot: a PatchPlot value, or a whole Figure without patch updates."""
+    if PATCH_PLOTS:
+        return plot_value(figure_key, base_figure, traces, shapes, sent_key)
+    return with_overlays(base_figure, traces, shapes), None
+
+def render_message(text):
+    """Returns (value, key) for a Simple Path plot showing only a message."""
+    if PATCH_PLOTS:
+        return message_value(text)
+    fig = go.Figure()
+    fig.update_layout(xaxis_visible=False, yaxis_visible=False, annotations=[{"text": text, "xref": "paper", "yref": "paper", "showarrow": False, "font": {"size": 16}}])
+    return fig, None
 
-def create_distance_plot(interactions, test_id, dims, current_image_index):
-    """Creates a line plot of distances between interaction points."""
-    if not interactions or not test_id or test_id not in interactions or not dims:
-        fig = go.Figure()
-        fig.update_layout(xaxis_visible=False, yaxis_visible=False, annotations=[{"text": "No data to display.", "xref": "paper", "yref": "paper", "showarrow": False, "font": {"size": 16}}])
-        return fig, "", "", ""
+def build_distance_figure(test_id, metrics):
+    """Builds the distance plot of a test ID, without the current-step highlight, as a figure dict."""
+    webgl = len(metrics.distances) > WEBGL_THRESHOLD
 
-    interaction_data = interactions[test_id]
-    
-    sorted_img_ids = sorted(interaction_data.keys())
-
-    interaction_points = []
-    for img_id in sorted_img_ids:
-        interaction = interaction_data[img_id]
-        params = interaction.get("interaction_parameters", {})
-        grounding = params.get("grounding")
-        
-        if not grounding:
-            continue
-
-        if interaction.get("interaction_type") == "slide":
-            if len(grounding) == 2:
-                interaction_points.append({"start": grounding[0], "end": grounding[1]})
-        else:
-            interaction_points.append({"start": grounding, "end": grounding})
+    fig = go.Figure()
 
-    if len(interaction_points) < 2:
-        fig = go.Figure()
-        fig.update_layout(xaxis_visible=False, yaxis_visible=False, annotations=[{"text": "Not enough interaction points to draw a plot.", "xref": "paper", "yref": "paper", "showarrow": False, "font": {"size": 16}}])
-        return fig, "", "", ""
+    fig.add_shape(mean_band_shape(metrics.mean))
 
-    distances = [calculate_euclidean_distance(interaction_points[i]['start'], interaction_points[i-1]['end'], dims) for i in range(1, len(interaction_points))]
+    fig.add_trace(distance_trace(metrics.distances, webgl))
 
-    if not distances:
-        fig = go.Figure()
-        fig.update_layout(xaxis_visible=False, yaxis_visible=False, annotations=[{"text": "No distances to plot.", "xref": "paper", "yref": "paper", "showarrow": False, "font": {"size": 16}}])
-        return fig, "", "", ""
+    fig.add_hline(y=metrics.mean, line_dash="dot", line_color="red")
+
+    fig.update_layout(
+        title_text=f"Interaction Distances for {test_id}",
+        xaxis_title="Interaction Step",
+        yaxis_title="Euclidean Distance (pixels)",
+        xaxis=dict(type='linear' if webgl else 'category'),
+        showlegend=False,
+        plot_bgcolor='white',
+        # paper_bgcolor='white',
+        dragmode=False
+    )
+    return fig.to_dict()
+
+def create_distance_plot(interactions, test_id, dims, current_image_index, sent_key=None):
+    """Creates a line plot of distances between interaction points.
+
+    Returns the plot value and its key (see render_plot) followed by the statistics. Pass the key last
+    sent to the browser as sent_key to get only the moved overlays when the base figure is unchanged.
+    """
+    if not test_id or test_id not in interactions or not dims:
+        return *render_message("No data to display."), "", "", ""
+
+    metrics = get_path_metrics(interactions, test_id, dims)
+    if metrics is None:
+        return *render_message("Not enough interaction points to draw a plot."), "", "", ""
 
-    mean_dist = pd.Series(distances).mean()
-    std_dist = pd.Series(distances).std()
+    distances = metrics.distances.tolist()
+    mean_dist = metrics.mean
+    std_dist = metrics.std
 
     mean_dist_without_current = None
     operation_quality_score = None
-    if current_image_index is not None and len(distances) > 1:
-        indices_to_remove = []
-        if current_image_index > 0:
-            indices_to_remove.append(current_image_index - 1)
-        if current_image_index < len(distances):
-            indices_to_remove.append(current_image_index)
-        
-        remaining_distances = [d for i, d in enumerate(distances) if i not in indices_to_remove]
-        
-        if remaining_distances:
-            mean_dist_without_current = pd.Series(remaining_distances).mean()
-            if mean_dist is not None and mean_dist > 0:
-                operation_quality_score = (mean_dist_without_current - mean_dist) / mean_dist
-            else:
-                operation_quality_score = 0.0
-
     average_operation_quality_score = None
     if len(distances) > 1:
-        all_scores = []
-        num_interaction_points = len(interaction_points)
-        for i in range(num_interaction_points):
-            indices_to_remove = []
-            if i > 0:
-                indices_to_remove.append(i - 1)
-            if i < len(distances):
-                indices_to_remove.append(i)
-            
-            if not indices_to_remove:
-                continue
+        means_without, scores = metrics.means_without, metrics.scores
 
-            remaining_distances = [d for j, d in enumerate(distances) if j not in indices_to_remove]
+        if current_image_index is not None:
+            if current_image_index < len(scores):
+                if not np.isnan(means_without[current_image_index]):
+                    mean_dist_without_current = means_without[current_image_index]
+                    operation_quality_score = scores[current_image_index]
+            else:
+                # Past the last interaction point nothing is removed.
+                mean_dist_without_current = mean_dist
+                operation_quality_score = 0.0
 
-            if remaining_distances:
-                mean_dist_without_i = pd.Series(remaining_distances).mean()
-                if mean_dist is not None and mean_dist > 0:
-                    score = (mean_dist_without_i - mean_dist) / mean_dist
-                    all_scores.append(score)
-        
-        if all_scores:
-            average_operation_quality_score = pd.Series(all_scores).mean()
+        if mean_dist > 0 and not np.isnan(scores).all():
+            average_operation_quality_score = np.nanmean(scores)
 
     stats_basic = f"""<b>Basic Statistics:</b><br>
 Mean: {mean_dist:.2f}<br>
@@ -119,160 +168,257 @@ Std Dev: {std_dist:.2f}"""
 <span style='color:green;'>正分 (越高越好):</span> 高效交互, 缩短了路径。<br>
 <span style='color:red;'>负分 (越低越差):</span> 低效交互, 拉长了路径。"""
 
-    x_values = [f"{i}-{i+1}" for i in range(1, len(distances) + 1)]
-    
-    fig = go.Figure()
-
-    fig.add_trace(go.Scatter(
-        x=x_values,
-        y=[mean_dist] * len(x_values),
-        fill='tozeroy',
-        mode='none',
-        fillcolor='rgba(255, 0, 0, 0.1)',
-    ))
-
-    fig.add_trace(go.Scatter(x=x_values, y=distances, mode='lines+markers'))
-
+    highlights = []
     if current_image_index > 0:
         highlight_index = current_image_index
         if highlight_index <= len(distances):
-            fig.add_trace(go.Scatter(
-                x=[x_values[highlight_index - 1]],
-                y=[distances[highlight_index - 1]],
-                mode='markers',
-                marker=dict(color='red', size=12, symbol='circle-open-dot'),
-            ))
-
-    fig.add_hline(y=mean_dist, line_dash="dot", line_color="red")
+            highlights.append(highlight_marker(step_x(highlight_index, len(distances) > WEBGL_THRESHOLD), distances[highlight_index - 1], 'red'))
+
+    hlines = []
     if mean_dist_without_current is not None:
-        fig.add_hline(y=mean_dist_without_current, line_dash="dash", line_color="#636EFA")
+        hlines.append(hline_shape(mean_dist_without_current, "dash", "#636EFA"))
 
-    fig.update_layout(
-        title_text=f"Interaction Distances for {test_id}",
-        xaxis_title="Interaction Step",
-        yaxis_title="Euclidean Distance (pixels)",
-        xaxis=dict(type='category'),
-        showlegend=False,
-        plot_bgcolor='white',
-        # paper_bgcolor='white',
-        dragmode=False
-    )
+    figure_key = ("distance", metrics.key)
+    base_figure = _figure_cache.get(figure_key)
+    if base_figure is None:
+        base_figure = _figure_cache.put(figure_key, build_distance_figure(test_id, metrics))
+    plot, plot_key = render_plot(figure_key, base_figure, highlights, hlines, sent_key)
     
-    return fig, stats_basic, stats_mean_wo_current, stats_score
-
+    return plot, plot_key, stats_basic, stats_mean_wo_current, stats_score
 
-def get_distances_for_test_id(interactions, test_id, dims):
-    """Helper function to calculate distances for a given test_id."""
-    if not interactions or not test_id or test_id not in interactions or not dims:
-        return [], 0, 0
 
-    interaction_data = interactions[test_id]
-    sorted_img_ids = sorted(interaction_data.keys())
-
-    interaction_points = []
-    for img_id in sorted_img_ids:
-        interaction = interaction_data[img_id]
-        params = interaction.get("interaction_parameters", {})
-        grounding = params.get("grounding")
-        
-        if not grounding:
-            continue
-
-        if interaction.get("interaction_type") == "slide":
-            if len(grounding) == 2:
-                interaction_points.append({"start": grounding[0], "end": grounding[1]})
-        else:
-            interaction_points.append({"start": grounding, "end": grounding})
+def build_comparison_figure(test_id1, test_id2, distances1, mean_dist1, distances2, mean_dist2):
+    """Builds the comparison plot of two test IDs, without the current-step highlights, as a figure dict."""
+    webgl = max(len(distances1), len(distances2)) > WEBGL_THRESHOLD
+    fig = go.Figure()
 
-    if len(interaction_points) < 2:
-        return [], 0, 0
+    # Plot for test_id1
+    if distances1:
+        fig.add_trace(distance_trace(distances1, webgl, name=test_id1, line=dict(color='red')))
+        fig.add_hline(y=mean_dist1, line_dash="dot", line_color="red")
 
-    distances = [calculate_euclidean_distance(interaction_points[i]['start'], interaction_points[i-1]['end'], dims) for i in range(1, len(interaction_points))]
-    
-    if not distances:
-        return [], 0, 0
+    # Plot for test_id2
+    if distances2:
+        fig.add_trace(distance_trace(distances2, webgl, name=test_id2, line=dict(color='#636EFA')))
+        fig.add_hline(y=mean_dist2, line_dash="dot", line_color="#636EFA")
 
-    mean_dist = pd.Series(distances).mean()
-    std_dist = pd.Series(distances).std()
-    
-    return distances, mean_dist, std_dist
+    fig.update_layout(
+        title_text=f"Comparison of Interaction Distances: {test_id1} vs {test_id2}",
+        xaxis_title="Interaction Step",
+        yaxis_title="Euclidean Distance (pixels)",
+        xaxis=dict(type='linear' if webgl else 'category'),
+        plot_bgcolor='white',
+        dragmode=False,
+        showlegend=False
+    )
+    return fig.to_dict()
 
-def create_comparison_plot(interactions, test_id1, test_id2, dims1, dims2, current_image_index1, current_image_index2):
-    """Creates a line plot comparing distances of two test_ids."""
+def create_comparison_plot(interactions, test_id1, test_id2, dims1, dims2, current_image_index1, current_image_index2, sent_key=None):
+    """Creates a line plot comparing distances of two test_ids. Returns the plot value, its key and the statistics."""
     
-    distances1, mean_dist1, std_dist1 = get_distances_for_test_id(interactions, test_id1, dims1)
-    distances2, mean_dist2, std_dist2 = get_distances_for_test_id(interactions, test_id2, dims2)
+    metrics1 = get_path_metrics(interactions, test_id1, dims1)
+    metrics2 = get_path_metrics(interactions, test_id2, dims2)
+    distances1, mean_dist1, std_dist1 = (metrics1.distances.tolist(), metrics1.mean, metrics1.std) if metrics1 else ([], 0, 0)
+    distances2, mean_dist2, std_dist2 = (metrics2.distances.tolist(), metrics2.mean, metrics2.std) if metrics2 else ([], 0, 0)
 
     if not distances1 and not distances2:
-        fig = go.Figure()
-        fig.update_layout(xaxis_visible=False, yaxis_visible=False, annotations=[{"text": "No data to display for either Test ID.", "xref": "paper", "yref": "paper", "showarrow": False, "font": {"size": 16}}])
-        return fig, ""
+        return *render_message("No data to display for either Test ID."), ""
 
-    fig = go.Figure()
-    
     stats_text = f"""<b>Comparison Statistics:</b><br>
 <b>{test_id1} (Red):</b><br>
 Mean: {mean_dist1:.2f}, Std Dev: {std_dist1:.2f}<br>
 <b>{test_id2} (Blue):</b><br>
 Mean: {mean_dist2:.2f}, Std Dev: {std_dist2:.2f}"""
 
-    # Plot for test_id1
-    if distances1:
-        x_values1 = [f"{i}-{i+1}" for i in range(1, len(distances1) + 1)]
-        fig.add_trace(go.Scatter(x=x_values1, y=distances1, mode='lines+markers', name=test_id1, line=dict(color='red')))
-        fig.add_hline(y=mean_dist1, line_dash="dot", line_color="red")
-        if current_image_index1 > 0:
-            highlight_index = current_image_index1
-            if highlight_index <= len(distances1):
-                fig.add_trace(go.Scatter(
-                    x=[x_values1[highlight_index - 1]],
-                    y=[distances1[highlight_index - 1]],
-                    mode='markers',
-                    marker=dict(color='red', size=12, symbol='circle-open-dot'),
-                    name=f'{test_id1} current'
-                ))
+    highlights = []
+    webgl = max(len(distances1), len(distances2)) > WEBGL_THRESHOLD
+    if distances1 and 0 < current_image_index1 <= len(distances1):
+        highlights.append(highlight_marker(step_x(current_image_index1, webgl), distances1[current_image_index1 - 1], 'red', f'{test_id1} current'))
+    if distances2 and 0 < current_image_index2 <= len(distances2):
+        highlights.append(highlight_marker(step_x(current_image_index2, webgl), distances2[current_image_index2 - 1], 'blue', f'{test_id2} current'))
+
+    figure_key = ("comparison", test_id1, test_id2, metrics1 and metrics1.key, metrics2 and metrics2.key)
+    base_figure = _figure_cache.get(figure_key)
+    if base_figure is None:
+        base_figure = _figure_cache.put(figure_key, build_comparison_figure(test_id1, test_id2, distances1, mean_dist1, distances2, mean_dist2))
+    plot, plot_key = render_plot(figure_key, base_figure, highlights, [], sent_key)
+    
+    return plot, plot_key, stats_text
+
+# You can adjust how many test IDs the ranking chart shows; beyond this, only the best and worst halves.
+RANKING_BARS = 40
+
+def build_aggregate_figure(aggregate):
+    """Builds the folder aggregate figure: per-step percentile bands and the score ranking, as a figure dict."""
+    steps = list(range(1, aggregate.distances.shape[1] + 1))
+    fig = make_subplots(rows=1, cols=2, column_widths=[0.65, 0.35], horizontal_spacing=0.12,
+                        subplot_titles=("Distance per Step across Test IDs", "Average Operation Quality Score"))
+
+    # Bands from the outermost percentile pair inwards, each drawn as an upper line filled down to its lower line.
+    percentiles = aggregate.percentiles
+    for i in range(len(PERCENTILES) // 2):
+        lower, upper = percentiles[i], percentiles[-1 - i]
+        name = f"p{PERCENTILES[i]}-p{PERCENTILES[-1 - i]}"
+        fig.add_trace(go.Scatter(x=steps, y=upper.tolist(), mode='lines', line=dict(width=0), hoverinfo='skip', showlegend=False), row=1, col=1)
+        fig.add_trace(go.Scatter(x=steps, y=lower.tolist(), mode='lines', line=dict(width=0), fill='tonexty',
+                                 fillcolor=f'rgba(99, 110, 250, {0.15 * (i + 1)})', name=name), row=1, col=1)
+    if len(PERCENTILES) % 2:
+        fig.add_trace(go.Scatter(x=steps, y=percentiles[len(PERCENTILES) // 2].tolist(), mode='lines', line=dict(color='#636EFA'),
+                                 name=f"p{PERCENTILES[len(PERCENTILES) // 2]}"), row=1, col=1)
+    fig.add_trace(go.Scatter(x=steps, y=aggregate.mean.tolist(), mode='lines+markers', line=dict(color='red', dash='dot'), name="mean",
+                             customdata=aggregate.counts.tolist(), hovertemplate="step %{x}: %{y:.2f} (%{customdata} test IDs)<extra>mean</extra>"), row=1, col=1)
+
+    ranked = [i for i in aggregate.ranking if not np.isnan(aggregate.mean_scores[i])]
+    if len(ranked) > RANKING_BARS:
+        ranked = ranked[:RANKING_BARS // 2] + ranked[-(RANKING_BARS // 2):]
+    ranked_scores = aggregate.mean_scores[ranked]
+    fig.add_trace(go.Bar(
+        # Best at the top.
+        x=ranked_scores[::-1].tolist(),
+        y=[aggregate.test_ids[i] for i in ranked][::-1],
+        orientation='h',
+        marker_color=['green' if score >= 0 else 'red' for score in ranked_scores[::-1]],
+        hovertemplate="%{y}: %{x:.2%}<extra></extra>",
+        showlegend=False,
+    ), row=1, col=2)
 
-    # Plot for test_id2
-    if distances2:
-        x_values2 = [f"{i}-{i+1}" for i in range(1, len(distances2) + 1)]
-        fig.add_trace(go.Scatter(x=x_values2, y=distances2, mode='lines+markers', name=test_id2, line=dict(color='#636EFA')))
-        fig.add_hline(y=mean_dist2, line_dash="dot", line_color="#636EFA")
-        if current_image_index2 > 0:
-            highlight_index = current_image_index2
-            if highlight_index <= len(distances2):
-                fig.add_trace(go.Scatter(
-                    x=[x_values2[highlight_index - 1]],
-                    y=[distances2[highlight_index - 1]],
-                    mode='markers',
-                    marker=dict(color='blue', size=12, symbol='circle-open-dot'),
-                    name=f'{test_id2} current'
-                ))
+    fig.update_layout(
+        plot_bgcolor='white',
+        dragmode=False,
+        legend=dict(orientation='h', y=-0.15),
+        height=max(450, 14 * len(ranked) + 150),
+    )
+    fig.update_xaxes(title_text="Interaction Step", row=1, col=1)
+    fig.update_yaxes(title_text="Euclidean Distance (pixels)", row=1, col=1)
+    fig.update_xaxes(tickformat=".0%", row=1, col=2)
+    return fig.to_dict()
+
+def create_aggregate_plot(interactions, image_groups):
+    """Creates the folder aggregate figure, a summary and the ranking table of every test ID."""
+    aggregate = get_folder_aggregate(interactions, image_groups) if interactions and image_groups else None
+    if aggregate is None:
+        fig = go.Figure()
+        fig.update_layout(xaxis_visible=False, yaxis_visible=False, annotations=[{"text": "No test ID has enough interaction points.", "xref": "paper", "yref": "paper", "showarrow": False, "font": {"size": 16}}])
+        return fig, "", None
+
+    figure_key = ("aggregate", aggregate.key)
+    base_figure = _figure_cache.get(figure_key)
+    if base_figure is None:
+        base_figure = _figure_cache.put(figure_key, build_aggregate_figure(aggregate))
+    fig = with_overlays(base_figure, [], [])
+
+    summary = f"""<b>Folder Statistics:</b><br>
+Test IDs analyzed: {len(aggregate.test_ids)} (skipped with fewer than 2 points: {len(aggregate.skipped)})<br>
+Mean distance: {np.nanmean(aggregate.distances):.2f}, Median steps: {np.median(aggregate.points - 1):.0f}"""
+
+    ranking = aggregate.ranking
+    table = pd.DataFrame({
+        "Rank": np.arange(1, len(ranking) + 1),
+        "Test ID": [aggregate.test_ids[i] for i in ranking],
+        "Points": aggregate.points[ranking],
+        "Mean Distance": aggregate.mean_distances[ranking].round(2),
+        "Std Dev": aggregate.std_distances[ranking].round(2),
+        "Average Score": [f"{score:.2%}" if not np.isnan(score) else "" for score in aggregate.mean_scores[ranking]],
+    })
+    return fig, summary, table
+
+# Colors of the series in the N-way comparison, reused in order when there are more series.
+SERIES_COLORS = plotly.colors.qualitative.Dark24
+
+def group_test_ids_by_task(test_ids):
+    """Groups test IDs that record the same task in different apps, e.g. ks_3 and xhs_3, by their suffix."""
+    groups = {}
+    for test_id in sorted(test_ids):
+        if "_" in test_id:
+            groups.setdefault(test_id.rsplit("_", 1)[1], []).append(test_id)
+    return {task: members for task, members in groups.items() if len(members) > 1}
+
+def build_multi_comparison_figure(series):
+    """Builds the comparison of (test_id, PathMetrics) pairs as a figure dict with one batched WebGL trace.
+
+    Each series is followed by a NaN point, which breaks the line between series, and its markers are
+    colored through a discrete colorscale indexed by series number, so the payload grows only with the
+    number of points.
+    """
+    lengths = [len(metrics.distances) for _, metrics in series]
+    x = np.concatenate([np.append(np.arange(1, n + 1, dtype=float), np.nan) for n in lengths])
+    y = np.concatenate([np.append(metrics.distances, np.nan) for _, metrics in series])
+    series_index = np.repeat(np.arange(len(series)), np.array(lengths) + 1)
+    colors = [SERIES_COLORS[i % len(SERIES_COLORS)] for i in range(len(series))]
+    # One band per series, from i/n to (i+1)/n, so even a single series has the two stops Plotly needs.
+    count = len(series)
+    colorscale = [stop for i, color in enumerate(colors) for stop in ([i / count, color], [(i + 1) / count, color])]
+
+    fig = go.Figure(go.Scattergl(
+        x=x.tolist(),
+        y=y.tolist(),
+        mode='lines+markers',
+        line=dict(color='rgba(120, 120, 120, 0.5)', width=1),
+        marker=dict(color=series_index.tolist(), colorscale=colorscale, cmin=-0.5, cmax=count - 0.5, size=7),
+        text=np.array([test_id for test_id, _ in series], dtype=object)[series_index].tolist(),
+        hovertemplate="%{text}<br>step %{x}: %{y:.2f}<extra></extra>",
+    ))
+    for (_, metrics), color in zip(series, colors):
+        fig.add_hline(y=metrics.mean, line_dash="dot", line_color=color)
 
     fig.update_layout(
-        title_text=f"Comparison of Interaction Distances: {test_id1} vs {test_id2}",
+        title_text=f"Comparison of Interaction Distances across {len(series)} Test IDs",
         xaxis_title="Interaction Step",
         yaxis_title="Euclidean Distance (pixels)",
-        xaxis=dict(type='category'),
         plot_bgcolor='white',
         dragmode=False,
         showlegend=False
     )
-    
+    return fig.to_dict()
+
+def create_multi_comparison_plot(interactions, test_ids, image_groups):
+    """Creates one plot comparing the distances of any number of test IDs, with their statistics."""
+    series, missing = [], []
+    for test_id in test_ids or []:
+        metrics = get_path_metrics(interactions, test_id, image_groups.frame_sizes(test_id)) if image_groups else None
+        if metrics is None:
+            missing.append(test_id)
+        else:
+            series.append((test_id, metrics))
+
+    if not series:
+        fig = go.Figure()
+        fig.update_layout(xaxis_visible=False, yaxis_visible=False, annotations=[{"text": "No data to display for the selected Test IDs.", "xref": "paper", "yref": "paper", "showarrow": False, "font": {"size": 16}}])
+        return fig, ""
+
+    figure_key = ("multi_comparison", tuple(metrics.key for _, metrics in series))
+    base_figure = _figure_cache.get(figure_key)
+    if base_figure is None:
+        base_figure = _figure_cache.put(figure_key, build_multi_comparison_figure(series))
+    fig = with_overlays(base_figure, [], [])
+
+    stats_text = "<b>Comparison Statistics:</b><br>\n"
+    for i, (test_id, metrics) in enumerate(series):
+        color = SERIES_COLORS[i % len(SERIES_COLORS)]
+        stats_text += f"<span style='color:{color};'>&#9632;</span> <b>{test_id}:</b> Mean: {metrics.mean:.2f}, Std Dev: {metrics.std:.2f}, Points: {len(metrics.img_ids)}<br>\n"
+    if missing:
+        stats_text += f"Not enough interaction points: {', '.join(missing)}"
     return fig, stats_text
 
 
-def calculate_tab():
+calc_sessions = SessionStore(SESSION_TTL)
+
+def session_frame_sizes(session, test_id):
+    """Per-image sizes of a test ID, looked up from the session's folder index rather than sent through gr.State."""
+    return session.image_groups.frame_sizes(test_id) if session.image_groups and test_id else None
+
+def calculate_tab(render_concurrency_limit=4):
     with gr.TabItem("Load Calculate"):
         # States for load calculate tab
-        calc_image_groups_state = gr.State({})
-        calc_folder_path_state = gr.State("")
-        calc_interactions_state = gr.State({})
+        # Token of the server-side session holding the folder, its image groups and interactions
+        calc_session_state = gr.State("")
         calc_current_test_id_state = gr.State("")
         calc_current_image_index_state = gr.State(0)
-        calc_image_dimensions_state = gr.State()
         calc_current_test_id_compare_state = gr.State("")
         calc_current_image_index_compare_state = gr.State(0)
-        calc_image_dimensions_compare_state = gr.State()
+        # Keys of the base figures the browser has for the two Simple Path plots, so steps only send overlays
+        calc_plot_key_state = gr.State()
+        calc_comparison_plot_key_state = gr.State()
 
 
         with gr.Row():
@@ -288,12 +434,12 @@ def calculate_tab():
                 with gr.Row():
                     with gr.Column(scale=1):
                         img_id_label_simple = gr.Label(label="Image ID")
-                        image_display_simple = gr.Image(label="Image", interactive=False, type="pil", height=300)
+                        image_display_simple = gr.Image(label="Image", interactive=False, type="pil", height=DISPLAY_HEIGHT)
                         with gr.Row():
                             prev_button_simple = gr.Button("Previous")
                             next_button_simple = gr.Button("Next")
                     with gr.Column(scale=3):
-                        plot_display_simple = gr.Plot(label="Interaction Distance Plot")
+                        plot_display_simple = (PatchPlot if PATCH_PLOTS else gr.Plot)(label="Interaction Distance Plot")
                         with gr.Row():
                             with gr.Column(scale=1):
                                 stats_basic_simple = gr.Markdown()
@@ -308,204 +454,281 @@ def calculate_tab():
                 with gr.Row():
                     with gr.Column(scale=1):
                         img_id_label_compare = gr.Label(label="Image ID")
-                        image_display_compare = gr.Image(label="Image", interactive=False, type="pil", height=300)
+                        image_display_compare = gr.Image(label="Image", interactive=False, type="pil", height=DISPLAY_HEIGHT)
                         with gr.Row():
                             prev_button_compare = gr.Button("Previous")
                             next_button_compare = gr.Button("Next")
                     with gr.Column(scale=3):
-                        comparison_plot_display = gr.Plot(label="Comparison Distance Plot")
+                        comparison_plot_display = (PatchPlot if PATCH_PLOTS else gr.Plot)(label="Comparison Distance Plot")
                         comparison_stats_label = gr.Markdown()
 
             with gr.TabItem("Advanced Path"):
                 gr.Markdown("### Advanced Path Analysis")
-                gr.Markdown("*Coming soon...*")
+                aggregate_button = gr.Button("Analyze Folder")
+                aggregate_plot_display = gr.Plot(label="Folder Distance Distribution")
+                aggregate_stats_label = gr.Markdown()
+                aggregate_table = gr.Dataframe(label="Test IDs by Average Score", interactive=False)
+
+                gr.Markdown("---")
+                gr.Markdown("### Compare Multiple Test IDs")
+                with gr.Row():
+                    task_dropdown = gr.Dropdown(label="Select by Task", interactive=True, scale=1)
+                    test_id_dropdown_multi = gr.Dropdown(label="Test IDs to Compare", multiselect=True, interactive=True, scale=3)
+                multi_comparison_plot_display = gr.Plot(label="Multi Comparison Distance Plot")
+                multi_comparison_stats_label = gr.Markdown()
 
             with gr.TabItem("Standalone"):
                 gr.Markdown("### Standalone Analysis")
                 gr.Markdown("*Coming soon...*")
 
-        def calc_start_process(folder_path):
+        def calc_start_process(folder_path, token):
             # This function is called when the main "Start" button is clicked
             images, test_id, message, image_groups, dims, interactions = process_folder(folder_path)
+            token, session = calc_sessions.create(token)
             if not images:
                 gr.Warning("No valid data found in the selected folder.", duration=2)
-                return {}, folder_path, {}, gr.update(choices=[], value=None), gr.update(choices=[], value=None)
+                return token, gr.update(choices=[], value=None), gr.update(choices=[], value=None), gr.update(choices=[], value=None), gr.update(choices=[], value=[])
             else:
                 gr.Info(f"Successfully loaded data from {folder_path}", duration=2)
+                session.folder_path = folder_path
+                session.image_groups = image_groups
+                session.interactions = interactions
                 test_ids = sorted(list(image_groups.keys()))
-                return image_groups, folder_path, interactions, gr.update(choices=test_ids, value=test_ids[0] if test_ids else None), gr.update(choices=test_ids, value=None)
+                tasks = list(group_test_ids_by_task(test_ids))
+                return (
+                    token, gr.update(choices=test_ids, value=test_ids[0] if test_ids else None), gr.update(choices=test_ids, value=None),
+                    gr.update(choices=tasks, value=None), gr.update(choices=test_ids, value=[])
+                )
 
+        # Events that decode and draw images share the "render" concurrency group sized in app.py.
         calc_start_button.click(
             fn=calc_start_process,
-            inputs=[calc_folder_input],
-            outputs=[calc_image_groups_state, calc_folder_path_state, calc_interactions_state, test_id_dropdown_simple, test_id_dropdown_compare]
+            inputs=[calc_folder_input, calc_session_state],
+            outputs=[calc_session_state, test_id_dropdown_simple, test_id_dropdown_compare, task_dropdown, test_id_dropdown_multi],
+            concurrency_id="render", concurrency_limit=render_concurrency_limit
         )
 
-        def on_test_id_select_simple(test_id, image_groups, interactions):
+        def on_test_id_select_simple(test_id, token):
+            session = calc_sessions.get(token)
+            interactions, image_groups = session.interactions, session.image_groups
             if not test_id or not image_groups or not interactions:
-                return None, 0, None, "", None, "", "", "", gr.update(interactive=False), gr.update(interactive=False), test_id, gr.update(choices=[]), None, "", None, "", gr.update(interactive=False), gr.update(interactive=False), None, ""
+                return None, 0, "", None, "", "", "", gr.update(interactive=False), gr.update(interactive=False), test_id, gr.update(choices=[]), None, "", None, "", gr.update(interactive=False), gr.update(interactive=False), None, "", None, None
 
             images = image_groups.get(test_id, [])
             if not images:
-                return None, 0, None, "", None, "", "", "", gr.update(interactive=False), gr.update(interactive=False), test_id, gr.update(choices=[]), None, "", None, "", gr.update(interactive=False), gr.update(interactive=False), None, ""
+                return None, 0, "", None, "", "", "", gr.update(interactive=False), gr.update(interactive=False), test_id, gr.update(choices=[]), None, "", None, "", gr.update(interactive=False), gr.update(interactive=False), None, "", None, None
 
             image_path = images[0]
             img_id = os.path.basename(image_path)
-            with Image.open(image_path) as img:
-                dims = img.size
+            # Per-image sizes, so mixed-resolution recordings measure distances correctly.
+            dims = session_frame_sizes(session, test_id)
 
-            display_image = get_image_for_display(image_path, test_id, interactions, draw_trajectory=True)
+            display_image = get_image_for_display(image_path, test_id, interactions, draw_trajectory=True, display_height=DISPLAY_HEIGHT)
             img_label = f"{img_id} (1/{len(images)})"
             
-            plot, stats_basic, stats_mean_wo_current, stats_score = create_distance_plot(interactions, test_id, dims, 0)
+            plot, plot_key, stats_basic, stats_mean_wo_current, stats_score = create_distance_plot(interactions, test_id, dims, 0)
 
             all_test_ids = sorted(list(image_groups.keys()))
             compare_choices = [tid for tid in all_test_ids if tid != test_id]
 
             return (
-                display_image, 0, dims, img_label, plot, stats_basic, stats_mean_wo_current, stats_score,
+                display_image, 0, img_label, plot, stats_basic, stats_mean_wo_current, stats_score,
                 gr.update(interactive=False), # prev
                 gr.update(interactive=len(images) > 1), # next
                 test_id,
                 gr.update(choices=compare_choices, value=None),
                 # Reset compare view
-                None, "", None, "", gr.update(interactive=False), gr.update(interactive=False), None, ""
+                None, "", None, "", gr.update(interactive=False), gr.update(interactive=False), None, "",
+                plot_key, None
             )
 
         test_id_dropdown_simple.change(
             fn=on_test_id_select_simple,
-            inputs=[test_id_dropdown_simple, calc_image_groups_state, calc_interactions_state],
+            inputs=[test_id_dropdown_simple, calc_session_state],
             outputs=[
-                image_display_simple, calc_current_image_index_state, calc_image_dimensions_state,
+                image_display_simple, calc_current_image_index_state,
                 img_id_label_simple, plot_display_simple, 
                 stats_basic_simple, stats_mean_wo_current_simple, stats_score_simple,
                 prev_button_simple, next_button_simple,
                 calc_current_test_id_state, test_id_dropdown_compare,
                 image_display_compare, img_id_label_compare, comparison_plot_display, comparison_stats_label, 
-                prev_button_compare, next_button_compare, calc_current_test_id_compare_state, calc_current_image_index_compare_state
-            ]
+                prev_button_compare, next_button_compare, calc_current_test_id_compare_state, calc_current_image_index_compare_state,
+                calc_plot_key_state, calc_comparison_plot_key_state
+            ],
+            concurrency_id="render", concurrency_limit=render_concurrency_limit
         )
 
-        def on_test_id_select_compare(test_id_compare, test_id_simple, image_groups, interactions, current_image_index_simple, dims_simple):
+        def on_test_id_select_compare(test_id_compare, test_id_simple, token, current_image_index_simple):
+            session = calc_sessions.get(token)
+            interactions, image_groups = session.interactions, session.image_groups
             if not test_id_compare:
-                return None, 0, None, "", None, "", gr.update(interactive=False), gr.update(interactive=False), None
+                return None, 0, "", None, "", gr.update(interactive=False), gr.update(interactive=False), None, None
 
             images = image_groups.get(test_id_compare, [])
             if not images:
-                return None, 0, None, "", None, "", gr.update(interactive=False), gr.update(interactive=False), None
+                return None, 0, "", None, "", gr.update(interactive=False), gr.update(interactive=False), None, None
 
             image_path = images[0]
             img_id = os.path.basename(image_path)
-            with Image.open(image_path) as img:
-                dims = img.size
+            dims = session_frame_sizes(session, test_id_compare)
 
-            display_image = get_image_for_display(image_path, test_id_compare, interactions, draw_trajectory=True)
+            display_image = get_image_for_display(image_path, test_id_compare, interactions, draw_trajectory=True, display_height=DISPLAY_HEIGHT)
             img_label = f"{img_id} (1/{len(images)})"
 
-            plot, stats = create_comparison_plot(interactions, test_id_simple, test_id_compare, dims_simple, dims, current_image_index_simple, 0)
+            plot, plot_key, stats = create_comparison_plot(interactions, test_id_simple, test_id_compare, session_frame_sizes(session, test_id_simple), dims, current_image_index_simple, 0)
 
             return (
                 display_image,
                 0,
-                dims,
                 img_label,
                 plot,
                 stats,
                 gr.update(interactive=False),
                 gr.update(interactive=len(images) > 1),
-                test_id_compare
+                test_id_compare,
+                plot_key
             )
 
         test_id_dropdown_compare.change(
             fn=on_test_id_select_compare,
-            inputs=[test_id_dropdown_compare, calc_current_test_id_state, calc_image_groups_state, calc_interactions_state, calc_current_image_index_state, calc_image_dimensions_state],
+            inputs=[test_id_dropdown_compare, calc_current_test_id_state, calc_session_state, calc_current_image_index_state],
             outputs=[
-                image_display_compare, calc_current_image_index_compare_state, calc_image_dimensions_compare_state,
+                image_display_compare, calc_current_image_index_compare_state,
                 img_id_label_compare, comparison_plot_display, comparison_stats_label, 
-                prev_button_compare, next_button_compare, calc_current_test_id_compare_state
-            ]
+                prev_button_compare, next_button_compare, calc_current_test_id_compare_state, calc_comparison_plot_key_state
+            ],
+            concurrency_id="render", concurrency_limit=render_concurrency_limit
         )
 
-        def change_image_simple(direction, test_id, index, image_groups, interactions, dims, dims_compare, test_id_compare, current_image_index_compare):
+        def change_image_simple(direction, test_id, index, token, test_id_compare, current_image_index_compare, plot_key, comparison_plot_key):
+            session = calc_sessions.get(token)
+            interactions, image_groups = session.interactions, session.image_groups
             new_index = index + direction
             images = image_groups.get(test_id, [])
 
             if not (0 <= new_index < len(images)):
-                return gr.update(), new_index, gr.update(), gr.update(), gr.update(), gr.update(), gr.update(), gr.update(), gr.update(), gr.update(), gr.update()
+                return gr.update(), new_index, gr.update(), gr.update(), gr.update(), gr.update(), gr.update(), gr.update(), gr.update(), gr.update(), gr.update(), plot_key, comparison_plot_key
 
             image_path = images[new_index]
             img_id = os.path.basename(image_path)
             
-            display_image = get_image_for_display(image_path, test_id, interactions, draw_trajectory=True)
+            display_image = get_image_for_display(image_path, test_id, interactions, draw_trajectory=True, display_height=DISPLAY_HEIGHT)
             img_label = f"{img_id} ({new_index + 1}/{len(images)})"
             
-            plot, stats_basic, stats_mean_wo_current, stats_score = create_distance_plot(interactions, test_id, dims, new_index)
+            dims = session_frame_sizes(session, test_id)
+            plot, plot_key, stats_basic, stats_mean_wo_current, stats_score = create_distance_plot(interactions, test_id, dims, new_index, plot_key)
 
             compare_plot, compare_stats = gr.update(), gr.update()
             if test_id_compare:
-                compare_plot, compare_stats = create_comparison_plot(interactions, test_id, test_id_compare, dims, dims_compare, new_index, current_image_index_compare)
+                compare_plot, comparison_plot_key, compare_stats = create_comparison_plot(interactions, test_id, test_id_compare, dims, session_frame_sizes(session, test_id_compare), new_index, current_image_index_compare, comparison_plot_key)
 
             return (
                 display_image, new_index, img_label, plot, stats_basic, stats_mean_wo_current, stats_score,
                 gr.update(interactive=new_index > 0), 
                 gr.update(interactive=new_index < len(images) - 1),
                 compare_plot,
-                compare_stats
+                compare_stats,
+                plot_key,
+                comparison_plot_key
             )
 
         prev_button_simple.click(
-            fn=lambda test_id, index, groups, inter, dims, dims_comp, t_id_comp, idx_comp: change_image_simple(-1, test_id, index, groups, inter, dims, dims_comp, t_id_comp, idx_comp),
-            inputs=[calc_current_test_id_state, calc_current_image_index_state, calc_image_groups_state, calc_interactions_state, calc_image_dimensions_state, calc_image_dimensions_compare_state, calc_current_test_id_compare_state, calc_current_image_index_compare_state],
+            fn=lambda test_id, index, token, t_id_comp, idx_comp, plot_key, comp_plot_key: change_image_simple(-1, test_id, index, token, t_id_comp, idx_comp, plot_key, comp_plot_key),
+            inputs=[calc_current_test_id_state, calc_current_image_index_state, calc_session_state, calc_current_test_id_compare_state, calc_current_image_index_compare_state, calc_plot_key_state, calc_comparison_plot_key_state],
             outputs=[
                 image_display_simple, calc_current_image_index_state, img_id_label_simple, 
                 plot_display_simple, 
                 stats_basic_simple, stats_mean_wo_current_simple, stats_score_simple,
                 prev_button_simple, next_button_simple,
-                comparison_plot_display, comparison_stats_label
-            ]
+                comparison_plot_display, comparison_stats_label,
+                calc_plot_key_state, calc_comparison_plot_key_state
+            ],
+            concurrency_id="render", concurrency_limit=render_concurrency_limit
         )
 
         next_button_simple.click(
-            fn=lambda test_id, index, groups, inter, dims, dims_comp, t_id_comp, idx_comp: change_image_simple(1, test_id, index, groups, inter, dims, dims_comp, t_id_comp, idx_comp),
-            inputs=[calc_current_test_id_state, calc_current_image_index_state, calc_image_groups_state, calc_interactions_state, calc_image_dimensions_state, calc_image_dimensions_compare_state, calc_current_test_id_compare_state, calc_current_image_index_compare_state],
+            fn=lambda test_id, index, token, t_id_comp, idx_comp, plot_key, comp_plot_key: change_image_simple(1, test_id, index, token, t_id_comp, idx_comp, plot_key, comp_plot_key),
+            inputs=[calc_current_test_id_state, calc_current_image_index_state, calc_session_state, calc_current_test_id_compare_state, calc_current_image_index_compare_state, calc_plot_key_state, calc_comparison_plot_key_state],
             outputs=[
                 image_display_simple, calc_current_image_index_state, img_id_label_simple, 
                 plot_display_simple, 
                 stats_basic_simple, stats_mean_wo_current_simple, stats_score_simple,
                 prev_button_simple, next_button_simple,
-                comparison_plot_display, comparison_stats_label
-            ]
+                comparison_plot_display, comparison_stats_label,
+                calc_plot_key_state, calc_comparison_plot_key_state
+            ],
+            concurrency_id="render", concurrency_limit=render_concurrency_limit
         )
 
-        def change_image_compare(direction, test_id_simple, test_id_compare, index, image_groups, interactions, dims_simple, dims_compare, current_image_index_simple):
+        def change_image_compare(direction, test_id_simple, test_id_compare, index, token, current_image_index_simple, comparison_plot_key):
+            session = calc_sessions.get(token)
+            interactions, image_groups = session.interactions, session.image_groups
             new_index = index + direction
             images = image_groups.get(test_id_compare, [])
 
             if not (0 <= new_index < len(images)):
-                return gr.update(), new_index, gr.update(), gr.update(), gr.update(), gr.update(), gr.update()
+                return gr.update(), new_index, gr.update(), gr.update(), gr.update(), gr.update(), gr.update(), comparison_plot_key
 
             image_path = images[new_index]
             img_id = os.path.basename(image_path)
             
-            display_image = get_image_for_display(image_path, test_id_compare, interactions)
+            display_image = get_image_for_display(image_path, test_id_compare, interactions, display_height=DISPLAY_HEIGHT)
             img_label = f"{img_id} ({new_index + 1}/{len(images)})"
             
-            plot, stats = create_comparison_plot(interactions, test_id_simple, test_id_compare, dims_simple, dims_compare, current_image_index_simple, new_index)
+            plot, comparison_plot_key, stats = create_comparison_plot(interactions, test_id_simple, test_id_compare, session_frame_sizes(session, test_id_simple), session_frame_sizes(session, test_id_compare), current_image_index_simple, new_index, comparison_plot_key)
 
             return (
                 display_image, new_index, img_label, plot, stats,
                 gr.update(interactive=new_index > 0), 
-                gr.update(interactive=new_index < len(images) - 1)
+                gr.update(interactive=new_index < len(images) - 1),
+                comparison_plot_key
             )
 
         prev_button_compare.click(
-            fn=lambda t_id_simple, t_id_comp, idx, groups, inter, dims_simple, dims_comp, idx_simple: change_image_compare(-1, t_id_simple, t_id_comp, idx, groups, inter, dims_simple, dims_comp, idx_simple),
-            inputs=[calc_current_test_id_state, calc_current_test_id_compare_state, calc_current_image_index_compare_state, calc_image_groups_state, calc_interactions_state, calc_image_dimensions_state, calc_image_dimensions_compare_state, calc_current_image_index_state],
-            outputs=[image_display_compare, calc_current_image_index_compare_state, img_id_label_compare, comparison_plot_display, comparison_stats_label, prev_button_compare, next_button_compare]
+            fn=lambda t_id_simple, t_id_comp, idx, token, idx_simple, comp_plot_key: change_image_compare(-1, t_id_simple, t_id_comp, idx, token, idx_simple, comp_plot_key),
+            inputs=[calc_current_test_id_state, calc_current_test_id_compare_state, calc_current_image_index_compare_state, calc_session_state, calc_current_image_index_state, calc_comparison_plot_key_state],
+            outputs=[image_display_compare, calc_current_image_index_compare_state, img_id_label_compare, comparison_plot_display, comparison_stats_label, prev_button_compare, next_button_compare, calc_comparison_plot_key_state],
+            concurrency_id="render", concurrency_limit=render_concurrency_limit
         )
 
         next_button_compare.click(
-            fn=lambda t_id_simple, t_id_comp, idx, groups, inter, dims_simple, dims_comp, idx_simple: change_image_compare(1, t_id_simple, t_id_comp, idx, groups, inter, dims_simple, dims_comp, idx_simple),
-            inputs=[calc_current_test_id_state, calc_current_test_id_compare_state, calc_current_image_index_compare_state, calc_image_groups_state, calc_interactions_state, calc_image_dimensions_state, calc_image_dimensions_compare_state, calc_current_image_index_state],
-            outputs=[image_display_compare, calc_current_image_index_compare_state, img_id_label_compare, comparison_plot_display, comparison_stats_label, prev_button_compare, next_button_compare]
+            fn=lambda t_id_simple, t_id_comp, idx, token, idx_simple, comp_plot_key: change_image_compare(1, t_id_simple, t_id_comp, idx, token, idx_simple, comp_plot_key),
+            inputs=[calc_current_test_id_state, calc_current_test_id_compare_state, calc_current_image_index_compare_state, calc_session_state, calc_current_image_index_state, calc_comparison_plot_key_state],
+            outputs=[image_display_compare, calc_current_image_index_compare_state, img_id_label_compare, comparison_plot_display, comparison_stats_label, prev_button_compare, next_button_compare, calc_comparison_plot_key_state],
+            concurrency_id="render", concurrency_limit=render_concurrency_limit
+        )
+
+        def on_aggregate(token):
+            session = calc_sessions.get(token)
+            return create_aggregate_plot(session.interactions, session.image_groups)
+
+        aggregate_button.click(
+            fn=on_aggregate,
+            inputs=[calc_session_state],
+            outputs=[aggregate_plot_display, aggregate_stats_label, aggregate_table],
+            concurrency_id="render", concurrency_limit=render_concurrency_limit
+        )
+
+        def on_task_select(task, token):
+            if not task:
+                return gr.update()
+            session = calc_sessions.get(token)
+            return group_test_ids_by_task(session.image_groups).get(task, [])
+
+        task_dropdown.change(
+            fn=on_task_select,
+            inputs=[task_dropdown, calc_session_state],
+            outputs=[test_id_dropdown_multi],
+            concurrency_limit=None
+        )
+
+        def on_multi_select(test_ids, token):
+            session = calc_sessions.get(token)
+            return create_multi_comparison_plot(session.interactions, test_ids, session.image_groups)
+
+        test_id_dropdown_multi.change(
+            fn=on_multi_select,
+            inputs=[test_id_dropdown_multi, calc_session_state],
+            outputs=[multi_comparison_plot_display, multi_comparison_stats_label],
+            concurrency_id="render", concurrency_limit=render_concurrency_limit
         )
\ No newline at end of file
@@ -0,0 +1,197 @@
+import json
+import os
+import time
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from cache import get_image_size
+from storage import write_json_atomic
+
+# Cached listing of a test_img directory, stored next to interactions.json.
+MANIFEST_NAME = ".folder_manifest.json"
+MANIFEST_VERSION = 2
+# While test IDs are being looked up, a changed manifest is written at most this often, in seconds.
+# Passes over a whole folder call flush() once at the end instead.
+MANIFEST_SAVE_SECONDS = 5.0
+
+def read_image_header(image_path):
+    """Returns (width, height) from the file header, or None if it is not a readable image."""
+    try:
+        with Image.open(image_path) as img:
+            return img.size
+    except OSError:
+        return None
+
+def has_images(imgs_folder):
+    """True if imgs_folder exists and holds a non-hidden entry; stops at the first one found."""
+    try:
+        with os.scandir(imgs_folder) as it:
+            return any(not entry.name.startswith('.') for entry in it)
+    except (FileNotFoundError, NotADirectoryError):
+        return False
+
+class FolderIndex(Mapping):
+    """Maps the test IDs of a test_img directory to their sorted image paths.
+
+    Test IDs are enumerated with a single os.scandir pass, and the image list of a test ID is only
+    read when it is first looked up, so opening a folder does not walk every imgs directory. As before,
+    test IDs whose imgs directory is missing or empty are left out; listing only peeks at the first entry.
+
+    Image lists, sizes and mtimes are persisted in a manifest next to interactions.json. Looking up a
+    test ID still lists and stats its imgs directory, but only images whose file size or mtime changed
+    have their headers read again. Changes are written back at most every MANIFEST_SAVE_SECONDS and
+    on flush(), so loading a whole folder does not rewrite the manifest once per test ID.
+
+    A read_only index never writes the manifest; worker processes use one and hand the rows they
+    rescanned to the parent through take_changes(), which merges them with merge() and flushes once.
+    """
+
+    def __init__(self, test_ids_dir, read_only=False):
+        self.test_ids_dir = test_ids_dir
+        self.manifest_path = os.path.join(test_ids_dir, MANIFEST_NAME)
+        self._manifest = self._load_manifest()
+        self._entries = None
+        self._sorted_test_ids = None
+        self._images = {}
+        self._sizes = {}
+        self.read_only = read_only
+        self._changes = {}
+        self._dirty = False
+        self._saved_at = None
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+            return {}
+        return manifest.get("test_ids", {})
+
+    def _save_manifest(self):
+        if self._entries is not None:
+            # Forget test IDs whose folders are gone.
+            self._manifest = {test_id: record for test_id, record in self._manifest.items() if test_id in self._entries}
+        try:
+            write_json_atomic(self.manifest_path, {"version": MANIFEST_VERSION, "test_ids": self._manifest})
+        except OSError:
+            pass # The manifest is only a cache; a read-only folder still works without it.
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def flush(self):
+        """Writes the manifest if a test ID was rescanned since it was last written."""
+        if self._dirty:
+            self._save_manifest()
+
+    def take_changes(self):
+        """Returns the manifest records of the test IDs rescanned since the last call, and forgets them."""
+        changes, self._changes = self._changes, {}
+        return changes
+
+    def merge(self, records):
+        """Adds manifest records rescanned by another index of this folder; flush() writes them."""
+        if records and not self.read_only:
+            self._manifest.update(records)
+            self._dirty = True
+
+    def iter_test_ids(self):
+        """Yields test IDs as they are found, in directory order, remembering their scandir entries."""
+        if self._entries is not None:
+            yield from self._entries
+            return
+        entries = {}
+        with os.scandir(self.test_ids_dir) as it:
+            for entry in it:
+                if entry.is_dir() and has_images(os.path.join(entry.path, "imgs")):
+                    entries[entry.name] = entry
+                    yield entry.name
+        self._entries = entries
+
+    def test_ids(self):
+        if self._sorted_test_ids is None:
+            if self._entries is None:
+                for _ in self.iter_test_ids():
+                    pass
+            self._sorted_test_ids = sorted(self._entries)
+        return self._sorted_test_ids
+
+    def _scan_images(self, imgs_folder, known):
+        """Returns the manifest rows of an imgs folder, reusing the sizes in known rows whose file is unchanged."""
+        known = {row[0]: row for row in known}
+        with os.scandir(imgs_folder) as it:
+            entries = sorted((entry for entry in it if not entry.name.startswith('.')), key=lambda entry: entry.name)
+        rows, changed = [], []
+        for entry in entries:
+            stat = entry.stat()
+            row = known.get(entry.name)
+            if row is None or row[3:] != [stat.st_size, stat.st_mtime_ns]:
+                row = [entry.name, None, None, stat.st_size, stat.st_mtime_ns]
+                changed.append(row)
+            rows.append(row)
+        # Header reads are I/O bound, so batch them over a few threads.
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            sizes = list(executor.map(read_image_header, [os.path.join(imgs_folder, row[0]) for row in changed]))
+        for row, size in zip(changed, sizes):
+            if size:
+                row[1:3] = size
+        return rows
+
+    def _load_test_id(self, test_id):
+        imgs_folder = os.path.join(self._entries[test_id].path, "imgs")
+        known = self._manifest.get(test_id, {}).get("images", [])
+        try:
+            rows = self._scan_images(imgs_folder, known)
+        except FileNotFoundError:
+            return []
+        if rows != known:
+            self._manifest[test_id] = {"images": rows}
+            if self.read_only:
+                self._changes[test_id] = self._manifest[test_id]
+            else:
+                self._dirty = True
+                if self._saved_at is None or time.monotonic() - self._saved_at >= MANIFEST_SAVE_SECONDS:
+                    self._save_manifest()
+
+        images = []
+        for name, width, height, _, _ in rows:
+            image_path = os.path.join(imgs_folder, name)
+            images.append(image_path)
+            if width is not None:
+                self._sizes[image_path] = (width, height)
+        return images
+
+    def __getitem__(self, test_id):
+        images = self._images.get(test_id)
+        if images is None:
+            if test_id not in self:
+                raise KeyError(test_id)
+            images = self._images[test_id] = self._load_test_id(test_id)
+        return images
+
+    def __iter__(self):
+        return iter(self.test_ids())
+
+    def __len__(self):
+        return len(self.test_ids())
+
+    def __contains__(self, test_id):
+        if self._entries is None:
+            self.test_ids()
+        return test_id in self._entries
+
+    def first_non_empty(self):
+        """Returns the first test ID, in sorted order, that has images, or None."""
+        return next((test_id for test_id in self.test_ids() if self[test_id]), None)
+
+    def frame_sizes(self, test_id):
+        """Maps every image ID of a test ID to its (width, height), read in one batch via the manifest."""
+        return {os.path.basename(image_path): self.image_size(image_path) for image_path in self.get(test_id, [])}
+
+    def image_size(self, image_path):
+        """(width, height) of an image, from the manifest when known, otherwise from its header."""
+        size = self._sizes.get(image_path)
+        if size is None:
+            size = get_image_size(image_path)
+        return size
@@ -0,0 +1,210 @@
+import copy
+import os
+import threading
+from collections.abc import MutableMapping
+from sqlite_store import SQLiteInteractions
+from storage import INTERACTIONS_NAME, JOURNAL_NAME, SQLITE_NAME, load_interactions, read_journal, save_interactions
+
+class FolderStore:
+    """The interactions of one test_img directory, shared by every session in the process.
+
+    Each test ID carries a version that is bumped whenever a session commits it. A commit only goes
+    through if the test ID is still at the version the session started editing from, so one annotator
+    cannot silently overwrite another's export. Changes made to the files by other processes are
+    picked up on the next checkout or commit.
+    """
+
+    def __init__(self, test_img_dir):
+        self.test_img_dir = test_img_dir
+        self.versions = {}
+        self._lock = threading.RLock()
+        self._signature = self._disk_signature()
+        self.interactions = load_interactions(test_img_dir)
+        self._journal_offset = self._journal_size(self._signature)
+
+    def _disk_signature(self):
+        signature = []
+        for name in (INTERACTIONS_NAME, JOURNAL_NAME, SQLITE_NAME, SQLITE_NAME + "-wal"):
+            try:
+                stat = os.stat(os.path.join(self.test_img_dir, name))
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return signature
+
+    @staticmethod
+    def _journal_size(signature):
+        return signature[1][1] if signature[1] else 0
+
+    def _refresh(self):
+        """Picks up changes other processes made to the files, bumping the versions of the test IDs they changed.
+
+        The SQLite backend compares revisions, and exports only appended to the journal are read from
+        where the last read stopped; anything else reloads the folder.
+        """
+        signature = self._disk_signature()
+        if signature == self._signature:
+            return
+        if isinstance(self.interactions, SQLiteInteractions) and signature[2]:
+            changed = self.interactions.reload()
+        elif not isinstance(self.interactions, SQLiteInteractions) and signature[0] == self._signature[0] and signature[2:] == self._signature[2:] and self._journal_size(signature) >= self._journal_offset:
+            changes, self._journal_offset = read_journal(self.test_img_dir, self._journal_offset)
+            changed = [test_id for test_id, frames in changes.items() if self.interactions.get(test_id) != frames]
+            for test_id in changed:
+                if changes[test_id] is None:
+                    del self.interactions[test_id]
+                else:
+                    self.interactions[test_id] = changes[test_id]
+        else:
+            interactions = load_interactions(self.test_img_dir)
+            changed = [test_id for test_id in set(self.interactions) | set(interactions) if self.interactions.get(test_id) != interactions.get(test_id)]
+            self.interactions = interactions
+            self._journal_offset = self._journal_size(signature)
+        for test_id in changed:
+            self.versions[test_id] = self.versions.get(test_id, 0) + 1
+        self._signature = signature
+
+    def test_ids(self):
+        with self._lock:
+            self._refresh()
+            return list(self.interactions)
+
+    def has(self, test_id):
+        with self._lock:
+            self._refresh()
+            return test_id in self.interactions
+
+    def has_any(self, exclude=()):
+        """Whether the store has a test ID outside exclude, without listing them all when exclude is empty."""
+        with self._lock:
+            self._refresh()
+            if not exclude:
+                return bool(self.interactions)
+            return any(test_id not in exclude for test_id in self.interactions)
+
+    def version(self, test_id):
+        with self._lock:
+            return self.versions.get(test_id, 0)
+
+    def checkout(self, test_id):
+        """Returns a private copy of the frames of test_id (None if it has none) and its current version."""
+        with self._lock:
+            self._refresh()
+            return copy.deepcopy(self.interactions.get(test_id)), self.versions.get(test_id, 0)
+
+    def commit(self, frames_by_test_id, base_versions, rebase_conflicts=True):
+        """Saves the given frames, None meaning removed, for every test ID still at its base version.
+
+        base_versions is updated in place: committed test IDs move to their new version. With
+        rebase_conflicts, conflicting ones move to the version they conflicted with, so committing them
+        again overwrites; otherwise they keep conflicting. Returns the sorted conflicting test IDs.
+        """
+        with self._lock:
+            self._refresh()
+            committed, conflicts = {}, []
+            for test_id, frames in frames_by_test_id.items():
+                current = self.versions.get(test_id, 0)
+                if base_versions.get(test_id, 0) != current:
+                    conflicts.append(test_id)
+                    if rebase_conflicts:
+                        base_versions[test_id] = current
+                else:
+                    committed[test_id] = copy.deepcopy(frames)
+            if committed:
+                save_interactions(self.test_img_dir, committed, list(committed))
+                for test_id, frames in committed.items():
+                    if frames is None:
+                        self.interactions.pop(test_id, None)
+                    else:
+                        self.interactions[test_id] = frames
+                    self.versions[test_id] = base_versions[test_id] = self.versions.get(test_id, 0) + 1
+                if isinstance(self.interactions, SQLiteInteractions):
+                    # Take the new revisions of the rows just written; other test IDs that changed meanwhile still count.
+                    for test_id in set(self.interactions.reload()) - set(committed):
+                        self.versions[test_id] = self.versions.get(test_id, 0) + 1
+                self._signature = self._disk_signature()
+                self._journal_offset = self._journal_size(self._signature)
+            return sorted(conflicts)
+
+    def save_all(self):
+        """Rewrites the saved file from everything committed so far. Returns the path written."""
+        with self._lock:
+            self._refresh()
+            path = save_interactions(self.test_img_dir, self.interactions)
+            self._signature = self._disk_signature()
+            self._journal_offset = self._journal_size(self._signature)
+            return path
+
+class SessionInteractions(MutableMapping):
+    """One session's interactions, backed by a FolderStore.
+
+    A test ID is copied out of the store the first time it is read, and edits stay private to the
+    session until they are committed. Test IDs that were never read always show the store's latest
+    state.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        # Private frames per test ID; None marks a test ID deleted in this session.
+        self._frames = {}
+        self.base_versions = {}
+
+    def __getitem__(self, test_id):
+        if test_id not in self._frames:
+            frames, version = self.store.checkout(test_id)
+            if frames is None:
+                raise KeyError(test_id)
+            self._frames[test_id] = frames
+            self.base_versions[test_id] = version
+        frames = self._frames[test_id]
+        if frames is None:
+            raise KeyError(test_id)
+        return frames
+
+    def __setitem__(self, test_id, frames):
+        if test_id not in self.base_versions:
+            self.base_versions[test_id] = self.store.version(test_id)
+        self._frames[test_id] = frames
+
+    def __delitem__(self, test_id):
+        self[test_id]
+        self._frames[test_id] = None
+
+    def __contains__(self, test_id):
+        if test_id in self._frames:
+            return self._frames[test_id] is not None
+        return self.store.has(test_id)
+
+    def __iter__(self):
+        test_ids = set(self.store.test_ids()) | set(self._frames)
+        return iter(sorted(test_id for test_id in test_ids if self._frames.get(test_id, True) is not None))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __bool__(self):
+        # Tested on every event, so it avoids the sorted union __iter__ and __len__ build.
+        if any(frames is not None for frames in self._frames.values()):
+            return True
+        return self.store.has_any({test_id for test_id, frames in self._frames.items() if frames is None})
+
+    def commit(self, test_ids, frames_by_test_id=None, rebase_conflicts=True):
+        """Commits this session's frames of test_ids, or the given snapshot of them. Returns the conflicting test IDs."""
+        if frames_by_test_id is None:
+            frames_by_test_id = {test_id: self._frames.get(test_id) for test_id in test_ids if test_id in self._frames}
+        return self.store.commit(frames_by_test_id, self.base_versions, rebase_conflicts)
+
+_folder_stores = {}
+_folder_stores_lock = threading.Lock()
+
+def get_folder_store(test_img_dir):
+    key = os.path.abspath(test_img_dir)
+    with _folder_stores_lock:
+        store = _folder_stores.get(key)
+        if store is None:
+            store = _folder_stores[key] = FolderStore(test_img_dir)
+        return store
+
+def open_interactions(test_img_dir):
+    """Starts a new session's view of the interactions of a test_img directory."""
+    return SessionInteractions(get_folder_store(test_img_dir))
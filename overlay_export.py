@@ -0,0 +1,139 @@
+"""Bulk export of interaction and trajectory overlays for every frame of a test folder, e.g. for QA review packs.
+
+Run from the repository root:
+
+    python overlay_export.py kesong_mark [--output exports/kesong_mark] [--workers N] [--display-height 1024]
+
+Frames are written to <output>/<test_id>/<image name>.<format>. An export manifest in the output
+directory remembers what each file was rendered from, so re-running only renders frames whose
+screenshot or interactions changed.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from cache import image_cache, load_image, get_image_size
+from folder_index import FolderIndex
+from storage import load_all_interactions, write_json_atomic
+from utils import display_size, draw_point_on_image, get_render_args
+
+EXPORT_MANIFEST_NAME = ".export_manifest.json"
+EXPORT_MANIFEST_VERSION = 1
+
+def load_export_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, EXPORT_MANIFEST_NAME), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict) or manifest.get("version") != EXPORT_MANIFEST_VERSION:
+        return {}
+    return manifest.get("frames", {})
+
+def save_export_manifest(output_dir, frames):
+    write_json_atomic(os.path.join(output_dir, EXPORT_MANIFEST_NAME), {"version": EXPORT_MANIFEST_VERSION, "frames": frames})
+
+def frame_key(image_path, render_args, display_height, fmt):
+    """Hash of everything an exported frame depends on: the screenshot file, what is drawn, size and format."""
+    stat = os.stat(image_path)
+    payload = json.dumps([stat.st_mtime_ns, stat.st_size, render_args, display_height, fmt])
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+def iter_jobs(test_img_dir, output_dir, display_height=None, fmt="jpg", draw_trajectory=True, annotated_only=False):
+    """Yields (image_path, render_args, display_height, out_path, relative_path, key) for every frame to export."""
+    interactions = load_all_interactions(test_img_dir)
+    image_groups = FolderIndex(test_img_dir)
+    for test_id in image_groups:
+        for image_path in image_groups[test_id]:
+            render_args = get_render_args(image_path, test_id, interactions, draw_trajectory)
+            if render_args is None and annotated_only:
+                continue
+            relative_path = os.path.join(test_id, f"{os.path.splitext(os.path.basename(image_path))[0]}.{fmt}")
+            key = frame_key(image_path, render_args, display_height, fmt)
+            yield image_path, render_args, display_height, os.path.join(output_dir, relative_path), relative_path, key
+    image_groups.flush()
+
+def _init_worker():
+    # Every frame is decoded once, so worker processes do not keep decoded screenshots around.
+    image_cache.max_size = 0
+
+def render_frame(job):
+    """Renders and saves one frame. Returns (relative_path, key, error)."""
+    image_path, render_args, display_height, out_path, relative_path, key = job
+    try:
+        if render_args is None:
+            image = load_image(image_path, display_size(get_image_size(image_path), display_height))
+        else:
+            coords, color, interaction_type, trajectory_points = render_args
+            image = draw_point_on_image(image_path, coords, color, interaction_type=interaction_type, trajectory_points=trajectory_points, display_height=display_height)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        if out_path.endswith(".jpg"):
+            image.save(out_path, quality=90)
+        else:
+            image.save(out_path)
+        return relative_path, key, None
+    except (OSError, ValueError) as e:
+        # ValueError covers malformed interaction parameters and images PIL cannot save in the chosen format.
+        return relative_path, key, str(e)
+
+def export_overlays(test_img_dir, output_dir, workers=None, chunksize=8, force=False, **job_options):
+    """Renders every changed frame of a test_img directory into output_dir. Returns (rendered, skipped, errors)."""
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {} if force else load_export_manifest(output_dir)
+    jobs, exported, skipped = [], {}, 0
+    for job in iter_jobs(test_img_dir, output_dir, **job_options):
+        out_path, relative_path, key = job[3:]
+        if manifest.get(relative_path) == key and os.path.isfile(out_path):
+            exported[relative_path] = key
+            skipped += 1
+        else:
+            jobs.append(job)
+
+    errors = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            for relative_path, key, error in executor.map(render_frame, jobs, chunksize=chunksize):
+                if error:
+                    errors.append((relative_path, error))
+                else:
+                    exported[relative_path] = key
+    finally:
+        # Saved even when interrupted, so finished frames are not rendered again.
+        save_export_manifest(output_dir, exported)
+    return len(jobs) - len(errors), skipped, errors
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("folder", help="Test folder name under --root.")
+    parser.add_argument("--root", default="test_folder")
+    parser.add_argument("--output", help="Output directory (default: exports/<folder>).")
+    parser.add_argument("--format", choices=["jpg", "png"], default="jpg")
+    parser.add_argument("--display-height", type=int, default=None, help="Scale frames to this height (default: full resolution).")
+    parser.add_argument("--no-trajectory", action="store_true", help="Only draw each frame's own interaction.")
+    parser.add_argument("--annotated-only", action="store_true", help="Skip frames without an interaction.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU).")
+    parser.add_argument("--chunksize", type=int, default=8, help="Frames sent to a worker at a time.")
+    parser.add_argument("--force", action="store_true", help="Render every frame, even unchanged ones.")
+    args = parser.parse_args(argv)
+
+    test_img_dir = os.path.join(args.root, args.folder, "test_img")
+    if not os.path.isdir(test_img_dir):
+        sys.exit(f"'test_img' directory not found in '{args.folder}'.")
+    output_dir = args.output or os.path.join("exports", args.folder)
+
+    start = time.perf_counter()
+    rendered, skipped, errors = export_overlays(
+        test_img_dir, output_dir, workers=args.workers, chunksize=args.chunksize, force=args.force,
+        display_height=args.display_height, fmt=args.format, draw_trajectory=not args.no_trajectory, annotated_only=args.annotated_only,
+    )
+    print(f"Rendered {rendered} frames, skipped {skipped} unchanged, in {time.perf_counter() - start:.2f} s -> {output_dir}")
+    for relative_path, error in errors:
+        print(f"Failed to render {relative_path}: {error}")
+    if errors:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
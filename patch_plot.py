@@ -0,0 +1,73 @@
+import hashlib
+import os
+import gradio as gr
+import plotly
+
+# plotly.js from the installed plotly package, so the page needs no CDN and matches the figures built here.
+PLOTLY_JS = os.path.join(os.path.dirname(plotly.__file__), "package_data", "plotly.min.js")
+gr.set_static_paths([PLOTLY_JS])
+
+JS_ON_LOAD = """
+const root = element.querySelector('.patch-plot');
+let base = null, baseKey = null;
+// The head script may still be loading when the component mounts; draws queue until Plotly exists.
+const plotlyReady = new Promise(resolve => {
+    (function poll() { window.Plotly ? resolve() : setTimeout(poll, 50); })();
+});
+function update() {
+    // The base is taken at once, so a patch arriving before Plotly loads still finds it.
+    const value = props.value;
+    if (!value) {
+        base = baseKey = null;
+        plotlyReady.then(() => Plotly.purge(root));
+        return;
+    }
+    if (value.base) {
+        base = value.base;
+        baseKey = value.key;
+    } else if (value.key !== baseKey) {
+        // A patch for a base this page never received; the next full figure replaces it.
+        return;
+    }
+    const layout = Object.assign({}, base.layout, {shapes: (base.layout.shapes || []).concat(value.shapes)});
+    const data = base.data.concat(value.traces);
+    plotlyReady.then(() => Plotly.react(root, data, layout, {displayModeBar: false, responsive: true}));
+}
+update();
+watch('value', update);
+"""
+
+class PatchPlot(gr.HTML):
+    """A Plotly plot that keeps its base figure in the browser, so moving the per-step overlays only sends them.
+
+    Values are made by plot_value(); None clears the plot.
+    """
+
+    def __init__(self, label=None, **kwargs):
+        super().__init__(
+            value=None,
+            label=label,
+            html_template="<div class='patch-plot'></div>",
+            css_template=".patch-plot { min-height: 450px; }",
+            js_on_load=JS_ON_LOAD,
+            head=f"<script src='gradio_api/file={PLOTLY_JS}'></script>",
+            container=True,
+            **kwargs
+        )
+
+def figure_id(figure_key):
+    """A short JSON-safe id of a _figure_cache key."""
+    return hashlib.blake2b(repr(figure_key).encode(), digest_size=8).hexdigest()
+
+def plot_value(figure_key, base_figure, traces, shapes, sent_key=None):
+    """Returns (PatchPlot value, its key): only the overlays when sent_key shows the browser already has this base."""
+    key = figure_id(figure_key)
+    value = dict(key=key, traces=traces, shapes=shapes)
+    if key != sent_key:
+        value["base"] = base_figure
+    return value, key
+
+def message_value(text):
+    """A PatchPlot value showing only a message, like the empty figures of the plot builders."""
+    layout = dict(xaxis=dict(visible=False), yaxis=dict(visible=False), annotations=[{"text": text, "xref": "paper", "yref": "paper", "showarrow": False, "font": {"size": 16}}])
+    return dict(key=None, base=dict(data=[], layout=layout), traces=[], shapes=[]), None
@@ -0,0 +1,198 @@
+import hashlib
+import pickle
+from collections import namedtuple
+from collections.abc import Mapping
+import numpy as np
+from cache import LRUCache
+
+PathMetrics = namedtuple("PathMetrics", ["img_ids", "starts", "ends", "distances", "mean", "std", "means_without", "scores", "key"])
+PathMetrics.__doc__ = """Distances between consecutive interaction points of one test ID, with their statistics.
+
+img_ids names the image of each of the n interaction points, starts/ends are (n, 2) normalized points, distances has n - 1 entries, and means_without/scores
+have one entry per interaction point (see calculate_operation_quality_scores). key identifies the
+test ID, interactions content and dims the metrics were computed from.
+"""
+
+def get_interaction_points(frames):
+    """Converts one test ID's interactions into (n, 2) arrays of start and end points, in image order.
+
+    A slide starts and ends at its two grounding points; every other interaction starts and ends at the same point.
+    Also returns the image ID of each point.
+    """
+    img_ids = []
+    starts = []
+    ends = []
+    for img_id in sorted(frames):
+        interaction = frames[img_id]
+        grounding = interaction.get("interaction_parameters", {}).get("grounding")
+
+        if not grounding:
+            continue
+
+        if interaction.get("interaction_type") == "slide":
+            if len(grounding) == 2:
+                img_ids.append(img_id)
+                starts.append(grounding[0])
+                ends.append(grounding[1])
+        else:
+            img_ids.append(img_id)
+            starts.append(grounding)
+            ends.append(grounding)
+
+    return img_ids, np.array(starts, dtype=float).reshape(-1, 2), np.array(ends, dtype=float).reshape(-1, 2)
+
+def get_point_dims(img_ids, dims):
+    """Returns an (n, 2) array with the (width, height) of the image of each interaction point.
+
+    dims is either one (width, height) for every image or a mapping of image ID to (width, height).
+    Images missing from the mapping fall back to the first known size.
+    """
+    if not isinstance(dims, Mapping):
+        return np.broadcast_to(np.asarray(dims, dtype=float), (len(img_ids), 2))
+    fallback = next(iter(dims.values()))
+    return np.array([dims.get(img_id, fallback) for img_id in img_ids], dtype=float).reshape(-1, 2)
+
+def calculate_distances(starts, ends, point_dims):
+    """Distances in pixels from the end of each interaction to the start of the next one.
+
+    Each point is scaled by the size of its own image, so mixed-resolution recordings measure correctly.
+    """
+    return np.hypot(*(starts[1:] * point_dims[1:] - ends[:-1] * point_dims[:-1]).T)
+
+def calculate_operation_quality_scores(distances):
+    """Returns the mean distance without each interaction point, and the resulting score, for every point.
+
+    Point i leaves out the distances on either side of it (i - 1 and i). Both arrays have one entry per
+    interaction point and are NaN where no distance remains. Scores are 0 when the mean distance is 0.
+    """
+    distances = np.asarray(distances, dtype=float)
+    num_distances = len(distances)
+    mean_dist = distances.mean()
+
+    points = np.arange(num_distances + 1)
+    removed = np.zeros(num_distances + 1)
+    removed[1:] += distances
+    removed[:-1] += distances
+    remaining_count = num_distances - (points > 0) - (points < num_distances)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means_without = np.where(remaining_count > 0, (distances.sum() - removed) / remaining_count, np.nan)
+    if mean_dist > 0:
+        scores = (means_without - mean_dist) / mean_dist
+    else:
+        scores = np.where(np.isnan(means_without), np.nan, 0.0)
+    return means_without, scores
+
+def compute_path_metrics(interactions, test_id, dims, key=None):
+    """Returns the PathMetrics of a test ID, or None if it has fewer than two interaction points."""
+    if not test_id or test_id not in interactions or not dims:
+        return None
+
+    img_ids, starts, ends = get_interaction_points(interactions[test_id])
+    if len(starts) < 2:
+        return None
+
+    distances = calculate_distances(starts, ends, get_point_dims(img_ids, dims))
+    mean_dist = distances.mean()
+    # Sample standard deviation, as pandas reports it.
+    std_dist = distances.std(ddof=1) if len(distances) > 1 else np.nan
+    means_without, scores = calculate_operation_quality_scores(distances)
+    return PathMetrics(img_ids, starts, ends, distances, mean_dist, std_dist, means_without, scores, key or path_metrics_key(interactions, test_id, dims))
+
+def interactions_fingerprint(frames):
+    """Content hash of one test ID's interactions; it changes whenever any interaction changes.
+
+    Pickle keeps floats binary, which makes this several times faster than JSON for large folders. The
+    same content pickled in another key order only hashes differently, which merely costs a cache miss.
+    """
+    return hashlib.blake2b(pickle.dumps(frames, protocol=5), digest_size=16).hexdigest()
+
+def dims_key(dims):
+    if isinstance(dims, Mapping):
+        return tuple(sorted((img_id, tuple(size)) for img_id, size in dims.items()))
+    return tuple(dims)
+
+def path_metrics_key(interactions, test_id, dims):
+    return (test_id, interactions_fingerprint(interactions[test_id]), dims_key(dims))
+
+# Large enough to hold every test ID of a big folder, so the folder aggregate stays warm.
+_path_metrics_cache = LRUCache(20000)
+_NOT_ENOUGH_POINTS = object()
+
+def get_path_metrics(interactions, test_id, dims):
+    """Memoized compute_path_metrics. Entries are keyed by content, so edited interactions are recomputed."""
+    if not test_id or test_id not in interactions or not dims:
+        return None
+
+    key = path_metrics_key(interactions, test_id, dims)
+    metrics = _path_metrics_cache.get(key)
+    if metrics is None:
+        metrics = compute_path_metrics(interactions, test_id, dims, key) or _NOT_ENOUGH_POINTS
+        _path_metrics_cache.put(key, metrics)
+    return None if metrics is _NOT_ENOUGH_POINTS else metrics
+
+FolderAggregate = namedtuple("FolderAggregate", ["test_ids", "points", "distances", "scores", "mean", "percentiles", "counts", "mean_distances", "std_distances", "mean_scores", "ranking", "skipped", "key"])
+FolderAggregate.__doc__ = """Distance statistics across all test IDs of a folder.
+
+distances and scores are NaN-padded (tests, steps) and (tests, points) matrices, one row per test ID in
+test_ids. mean, percentiles (one row per entry of PERCENTILES) and counts describe each step across test
+IDs. ranking orders the rows by mean score, best first, with unscored test IDs last. skipped lists the
+test IDs with fewer than two interaction points.
+"""
+
+# Percentile bands of the folder aggregate. You can adjust them, keeping the median in the middle.
+PERCENTILES = (10, 25, 50, 75, 90)
+
+def pad_series(series):
+    """Stacks 1-D arrays of different lengths into one matrix, padding the short rows with NaN."""
+    lengths = np.fromiter((len(values) for values in series), dtype=int, count=len(series))
+    matrix = np.full((len(series), lengths.max(initial=0)), np.nan)
+    matrix[np.arange(matrix.shape[1]) < lengths[:, None]] = np.concatenate(series) if series else []
+    return matrix
+
+_aggregate_cache = LRUCache(32)
+
+def get_folder_aggregate(interactions, image_groups):
+    """Memoized FolderAggregate of every test ID in image_groups, or None if none has two interaction points."""
+    metrics_list, skipped = [], []
+    for test_id in image_groups:
+        metrics = get_path_metrics(interactions, test_id, image_groups.frame_sizes(test_id)) if test_id in interactions else None
+        if metrics is None:
+            skipped.append(test_id)
+        else:
+            metrics_list.append(metrics)
+    image_groups.flush()
+    if not metrics_list:
+        return None
+
+    key = tuple(metrics.key for metrics in metrics_list)
+    aggregate = _aggregate_cache.get(key)
+    if aggregate is None:
+        aggregate = _aggregate_cache.put(key, compute_folder_aggregate(metrics_list, skipped, key))
+    return aggregate
+
+def compute_folder_aggregate(metrics_list, skipped=(), key=None):
+    distances = pad_series([metrics.distances for metrics in metrics_list])
+    scores = pad_series([metrics.scores for metrics in metrics_list])
+    mean_scores = np.full(len(metrics_list), np.nan)
+    scored = ~np.isnan(scores).all(axis=1)
+    mean_scores[scored] = np.nanmean(scores[scored], axis=1)
+    # argsort puts NaN last, so unscored test IDs end up at the bottom of the ranking.
+    ranking = np.argsort(-mean_scores, kind="stable")
+
+    return FolderAggregate(
+        test_ids=[metrics.key[0] for metrics in metrics_list],
+        points=np.array([len(metrics.img_ids) for metrics in metrics_list]),
+        distances=distances,
+        scores=scores,
+        # Every step column has at least one value, so the NaN-aware reductions never see an empty column.
+        mean=np.nanmean(distances, axis=0),
+        percentiles=np.nanpercentile(distances, PERCENTILES, axis=0),
+        counts=np.count_nonzero(~np.isnan(distances), axis=0),
+        mean_distances=np.array([metrics.mean for metrics in metrics_list]),
+        std_distances=np.array([metrics.std for metrics in metrics_list]),
+        mean_scores=mean_scores,
+        ranking=ranking,
+        skipped=list(skipped),
+        key=key,
+    )
@@ -0,0 +1,97 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from cache import file_mtime, render_cache
+from utils import get_render_args, get_render_key, get_image_for_display
+
+class Prefetcher:
+    """Renders the frames around the current one in the background so Previous/Next hit the render cache.
+
+    Work is tracked per channel (one per browser session). Switching test ID in a channel cancels
+    its pending work, and prefetched frames that were never shown are counted as wasted.
+    """
+
+    def __init__(self, radius=2, max_workers=2, max_channels=256):
+        self.radius = radius
+        self.max_channels = max_channels
+        self.hits = 0
+        self.wasted = 0
+        self.cancelled = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._channels = OrderedDict()
+        self._lock = threading.Lock()
+
+    def schedule(self, channel, test_id, images, index, snapshot, draw_trajectory=False, display_height=None):
+        """Prefetches the frames around images[index].
+
+        snapshot is {test_id: frames}, a private copy the caller took while no edit could be running;
+        workers read it long after this returns.
+        """
+        if not test_id or not images or not (0 <= index < len(images)):
+            return
+
+        with self._lock:
+            state = self._channels.get(channel)
+            if state is None or state["test_id"] != test_id:
+                if state is not None:
+                    self._discard(state)
+                state = {"test_id": test_id, "pending": {}, "prefetched": set()}
+                self._channels[channel] = state
+            self._channels.move_to_end(channel)
+            while len(self._channels) > self.max_channels:
+                self._discard(self._channels.popitem(last=False)[1])
+
+            current_key = self._render_key(images[index], test_id, snapshot, draw_trajectory, display_height)
+            if current_key in state["prefetched"]:
+                state["prefetched"].discard(current_key)
+                self.hits += 1
+
+            for offset in range(1, self.radius + 1):
+                for neighbour in (index + offset, index - offset):
+                    if not (0 <= neighbour < len(images)):
+                        continue
+                    image_path = images[neighbour]
+                    key = self._render_key(image_path, test_id, snapshot, draw_trajectory, display_height)
+                    if key in state["pending"] or key in state["prefetched"] or key in render_cache:
+                        continue
+                    state["pending"][key] = self._executor.submit(self._render, state, key, image_path, test_id, snapshot, draw_trajectory, display_height)
+
+    def stats(self):
+        with self._lock:
+            pending = sum(len(state["pending"]) for state in self._channels.values())
+            return {"hits": self.hits, "wasted": self.wasted, "cancelled": self.cancelled, "pending": pending}
+
+    def _render_key(self, image_path, test_id, interactions, draw_trajectory, display_height):
+        render_args = get_render_args(image_path, test_id, interactions, draw_trajectory)
+        if render_args is None:
+            # Frames without an interaction are shown as is; prefetching warms their decode.
+            return ("base", image_path, file_mtime(image_path), display_height)
+        return get_render_key(image_path, render_args, display_height)
+
+    def _render(self, state, key, image_path, test_id, interactions, draw_trajectory, display_height):
+        try:
+            get_image_for_display(image_path, test_id, interactions, draw_trajectory=draw_trajectory, display_height=display_height)
+        except OSError:
+            # The file vanished or is unreadable; the request path will report it if the user gets there.
+            return
+        finally:
+            with self._lock:
+                state["pending"].pop(key, None)
+        with self._lock:
+            if state.get("discarded"):
+                self.wasted += 1
+            else:
+                state["prefetched"].add(key)
+
+    def _discard(self, state):
+        state["discarded"] = True
+        for future in state["pending"].values():
+            if future.cancel():
+                self.cancelled += 1
+        state["pending"].clear()
+        self.wasted += len(state["prefetched"])
+        state["prefetched"].clear()
+
+# You can adjust how many frames on each side are prefetched with the PREFETCH_RADIUS environment variable.
+prefetcher = Prefetcher(radius=int(os.environ.get("PREFETCH_RADIUS", 2)))
@@ -0,0 +1,376 @@
+import base64
+import io
+import os
+import secrets
+import gradio as gr
+from cache import LRUCache, file_mtime, load_image, get_image_size
+from utils import display_size
+
+TOOLS = ["click", "multiclick", "longpress", "slide"]
+
+# You can adjust how many edits the canvas collects before posting them, and how long it waits for more, with the
+# RAPID_BATCH_SIZE and RAPID_FLUSH_MS environment variables.
+RAPID_BATCH_SIZE = int(os.environ.get("RAPID_BATCH_SIZE", 20))
+RAPID_FLUSH_MS = int(os.environ.get("RAPID_FLUSH_MS", 1500))
+
+CANVAS_ELEM_ID = "rapid-annotate"
+
+# Encoded previews sent to the canvas, keyed like the image cache.
+_preview_cache = LRUCache(256)
+
+HTML_TEMPLATE = """<div class='rapid-annotate' tabindex='0'>
+<div class='rapid-status'></div>
+<canvas></canvas>
+<div class='rapid-help'>1-4: tool &middot; click: mark &middot; drag: slide &middot; &larr;/&rarr; or A/D: frame &middot; G: auto-advance &middot; S: save now</div>
+</div>"""
+
+CSS_TEMPLATE = """
+.rapid-annotate { outline: none; text-align: center; }
+.rapid-annotate:focus-visible { box-shadow: 0 0 0 2px var(--color-accent); }
+canvas { max-height: ${display_height}px; max-width: 100%; cursor: crosshair; display: block; margin: 4px auto; touch-action: none; }
+.rapid-status, .rapid-help { font-size: var(--text-sm); color: var(--body-text-color-subdued); }
+"""
+
+JS_ON_LOAD = """
+const root = element.querySelector('.rapid-annotate');
+const canvas = root.querySelector('canvas');
+const status = root.querySelector('.rapid-status');
+const ctx = canvas.getContext('2d');
+const TOOLS = ['click', 'multiclick', 'longpress', 'slide'];
+const COLORS = {click: 'red', multiclick: 'orange', longpress: 'blue', slide: 'green'};
+
+let state = null, loadId = null, frames = [], index = 0, tool = 'click', image = null;
+let advance = true, down = null, error = '';
+const images = new Map();
+const pending = new Map();
+let flushTimer = null, flushing = Promise.resolve();
+
+function fetchImage(i) {
+    if (i < 0 || i >= frames.length) return null;
+    if (!images.has(i)) {
+        const request = server.rapid_frame({token: state.token, test_id: state.test_id, index: i}).then(url => new Promise((resolve, reject) => {
+            const img = new Image();
+            img.onload = () => resolve(img);
+            img.onerror = reject;
+            img.src = url;
+        }));
+        request.catch(() => images.delete(i));
+        images.set(i, request);
+    }
+    return images.get(i);
+}
+
+function show() {
+    image = null;
+    draw();
+    if (!frames.length) return;
+    const shown = loadId, shownIndex = index;
+    fetchImage(index).then(img => {
+        if (shown === loadId && shownIndex === index) {
+            image = img;
+            draw();
+        }
+    }).catch(() => {});
+    // Keep the neighbours ready and forget frames far behind.
+    [index + 1, index + 2, index - 1].forEach(fetchImage);
+    for (const i of images.keys()) {
+        if (Math.abs(i - index) > 5) images.delete(i);
+    }
+}
+
+function marker(x, y, color, scale) {
+    const total = Math.max(1, 100 * scale), solid = Math.max(1, 25 * scale);
+    const gradient = ctx.createRadialGradient(x, y, solid, x, y, total);
+    gradient.addColorStop(0, color);
+    gradient.addColorStop(1, 'transparent');
+    ctx.globalAlpha = 0.6;
+    ctx.fillStyle = gradient;
+    ctx.beginPath();
+    ctx.arc(x, y, total, 0, 2 * Math.PI);
+    ctx.fill();
+    ctx.globalAlpha = 1;
+    ctx.fillStyle = color;
+    ctx.beginPath();
+    ctx.arc(x, y, solid, 0, 2 * Math.PI);
+    ctx.fill();
+}
+
+function arrow(x1, y1, x2, y2, color, scale) {
+    const head = 80 * scale, spread = Math.PI / 8, angle = Math.atan2(y1 - y2, x1 - x2);
+    ctx.strokeStyle = ctx.fillStyle = color;
+    ctx.lineWidth = Math.max(1, 10 * scale);
+    ctx.beginPath();
+    ctx.moveTo(x1, y1);
+    ctx.lineTo(x2, y2);
+    ctx.stroke();
+    ctx.beginPath();
+    ctx.moveTo(x2, y2);
+    ctx.lineTo(x2 + head * Math.cos(angle - spread), y2 + head * Math.sin(angle - spread));
+    ctx.lineTo(x2 + head * Math.cos(angle + spread), y2 + head * Math.sin(angle + spread));
+    ctx.fill();
+}
+
+function groundingPoints(interaction) {
+    const grounding = interaction && interaction.interaction_parameters && interaction.interaction_parameters.grounding;
+    if (!grounding || !grounding.length) return [];
+    return Array.isArray(grounding[0]) ? grounding : [grounding];
+}
+
+function incompleteSlide() {
+    const interaction = frames[index] && frames[index].interaction;
+    return !!interaction && interaction.interaction_type === 'slide' && groundingPoints(interaction).length === 1;
+}
+
+function draw() {
+    if (!state || !frames.length) {
+        status.textContent = '';
+        canvas.width = canvas.height = 0;
+        return;
+    }
+    const frame = frames[index];
+    let text = `${frame.img_id} (${index + 1}/${frames.length}) · tool: ${tool} · auto-advance: ${advance ? 'on' : 'off'}`;
+    if (pending.size) text += ` · unsaved: ${pending.size}`;
+    if (incompleteSlide()) text += ' · click the slide end point';
+    if (error) text += ` · ${error}`;
+    status.textContent = text;
+    if (!image) return;
+
+    canvas.width = image.naturalWidth;
+    canvas.height = image.naturalHeight;
+    ctx.drawImage(image, 0, 0);
+    const interaction = frame.interaction;
+    const points = groundingPoints(interaction).map(p => [p[0] * canvas.width, p[1] * canvas.height]);
+    if (!points.length) return;
+    // Marker sizes are in full-resolution pixels, as in the server-side previews.
+    const scale = canvas.height / (frame.height || canvas.height);
+    const color = COLORS[interaction.interaction_type] || 'red';
+    points.forEach(([x, y]) => marker(x, y, color, scale));
+    if (interaction.interaction_type === 'slide' && points.length === 2) {
+        arrow(points[0][0], points[0][1], points[1][0], points[1][1], color, scale);
+    }
+}
+
+function go(direction) {
+    const next = index + direction;
+    if (next < 0 || next >= frames.length || incompleteSlide()) return;
+    index = next;
+    show();
+}
+
+function flush() {
+    clearTimeout(flushTimer);
+    flushTimer = null;
+    if (!pending.size) return flushing;
+    const edits = Array.from(pending.values());
+    const autosave = state.autosave, retryMs = state.flush_ms * 4;
+    pending.clear();
+    // Edits made before a folder was reloaded still go to the session they were made in.
+    const batches = new Map();
+    for (const {token, ...edit} of edits) {
+        if (!batches.has(token)) batches.set(token, []);
+        batches.get(token).push(edit);
+    }
+    const post = (token, batch) => server.rapid_save({token, autosave, edits: batch}).then(result => {
+        if (!result || result.saved !== batch.length) throw new Error((result && result.error) || 'not every edit was saved');
+    });
+    const posts = () => Promise.all(Array.from(batches, ([token, batch]) => post(token, batch)));
+    flushing = flushing.then(posts).then(() => {
+        error = '';
+        draw();
+    }).catch(e => {
+        // Keep the edits, unless they were changed again meanwhile, and try again later.
+        for (const edit of edits) {
+            const key = `${edit.token}/${edit.test_id}/${edit.img_id}`;
+            if (!pending.has(key)) pending.set(key, edit);
+        }
+        error = `saving failed (${e.message}), retrying`;
+        draw();
+        flushTimer = setTimeout(flush, retryMs);
+    });
+    return flushing;
+}
+
+function mark(point, end) {
+    const frame = frames[index], defaults = state.defaults;
+    const previous = frame.interaction;
+    let parameters;
+    if (tool === 'slide') {
+        let grounding = previous && previous.interaction_type === 'slide' ? groundingPoints(previous) : [];
+        if (end) grounding = [point, end];
+        else grounding = grounding.length < 2 ? grounding.concat([point]) : [grounding[1], point];
+        parameters = {grounding, duration: defaults.slide_duration};
+    } else {
+        parameters = {grounding: point};
+        if (tool === 'multiclick') parameters.clicks = defaults.clicks;
+        if (tool === 'longpress') parameters.duration = defaults.duration;
+    }
+    frame.interaction = {interaction_type: tool, interaction_parameters: parameters};
+    pending.set(`${state.token}/${state.test_id}/${frame.img_id}`, {token: state.token, test_id: state.test_id, img_id: frame.img_id, ...frame.interaction});
+    clearTimeout(flushTimer);
+    if (pending.size >= state.batch_size) flush();
+    else flushTimer = setTimeout(flush, state.flush_ms);
+    if (advance && !incompleteSlide() && index < frames.length - 1) go(1);
+    else draw();
+}
+
+function position(event) {
+    const rect = canvas.getBoundingClientRect();
+    const clamp = v => Math.min(1, Math.max(0, v));
+    return [clamp((event.clientX - rect.left) / rect.width), clamp((event.clientY - rect.top) / rect.height)];
+}
+
+canvas.addEventListener('pointerdown', event => {
+    if (!image) return;
+    root.focus();
+    down = {point: position(event), x: event.clientX, y: event.clientY};
+});
+canvas.addEventListener('pointerup', event => {
+    if (!down) return;
+    const start = down;
+    down = null;
+    const dragged = tool === 'slide' && Math.hypot(event.clientX - start.x, event.clientY - start.y) > 8;
+    mark(start.point, dragged ? position(event) : null);
+});
+
+root.addEventListener('keydown', event => {
+    if (!state || event.ctrlKey || event.metaKey || event.altKey) return;
+    const key = event.key.toLowerCase();
+    if (key === 'arrowright' || key === 'd') go(1);
+    else if (key === 'arrowleft' || key === 'a') go(-1);
+    else if (key >= '1' && key <= String(TOOLS.length)) { tool = TOOLS[Number(key) - 1]; draw(); }
+    else if (key === 'g') { advance = !advance; draw(); }
+    else if (key === 's') flush();
+    else return;
+    event.preventDefault();
+});
+
+document.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'hidden' && state) flush();
+});
+
+// Called before leaving rapid mode or exporting, so the server has every edit.
+root.rapidFlush = async () => {
+    if (state) await flush();
+    return {index};
+};
+
+function load() {
+    const value = props.value;
+    if (value && value.load === loadId) return;
+    // Edits of the previous test ID are posted with the previous token.
+    if (state) flush();
+    images.clear();
+    state = value || null;
+    loadId = value ? value.load : null;
+    frames = value ? value.frames : [];
+    index = value ? value.index : 0;
+    tool = value ? value.tool : 'click';
+    show();
+    if (state) root.focus();
+}
+load();
+watch('value', load);
+"""
+
+# Run in the browser before an event is sent, so the edits the canvas still holds reach the server first.
+FLUSH_JS = f"""async (...inputs) => {{
+    const root = document.querySelector('#{CANVAS_ELEM_ID} .rapid-annotate');
+    if (root && root.rapidFlush) await root.rapidFlush();
+    return inputs;
+}}"""
+# For the rapid mode toggle, whose second input receives the frame index the canvas is on.
+TOGGLE_JS = f"""async (rapid, index, ...inputs) => {{
+    const root = document.querySelector('#{CANVAS_ELEM_ID} .rapid-annotate');
+    if (root && root.rapidFlush) index = (await root.rapidFlush()).index;
+    return [rapid, index, ...inputs];
+}}"""
+
+class AnnotationCanvas(gr.HTML):
+    """Annotates frames on a canvas in the browser, for annotating without a server round trip per click.
+
+    Markers and slide arrows are drawn client-side over a plain preview, the keyboard switches tools and
+    frames, and edits are posted in batches. Values are made by canvas_value(); None clears the canvas.
+    frame_fn and save_fn are called from the browser and must be named rapid_frame and rapid_save: see
+    preview_data_url() and clean_edit() for what they receive and return.
+    """
+
+    def __init__(self, frame_fn, save_fn, display_height, **kwargs):
+        super().__init__(
+            value=None,
+            html_template=HTML_TEMPLATE,
+            css_template=CSS_TEMPLATE,
+            js_on_load=JS_ON_LOAD,
+            server_functions=[frame_fn, save_fn],
+            elem_id=CANVAS_ELEM_ID,
+            container=True,
+            display_height=display_height,
+            **kwargs
+        )
+
+def canvas_value(token, test_id, image_groups, interactions, index, tool_type, clicks, duration, slide_duration, autosave):
+    """The AnnotationCanvas value for a test ID: its frames with their interactions, and the tool defaults."""
+    sizes = image_groups.frame_sizes(test_id)
+    saved = interactions.get(test_id) or {}
+    frames = []
+    for image_path in image_groups.get(test_id, []):
+        img_id = os.path.basename(image_path)
+        frames.append({"img_id": img_id, "height": sizes[img_id][1], "interaction": saved.get(img_id)})
+    return {
+        # A new id per load, so the canvas can tell a new value from its own echo.
+        "load": secrets.token_hex(8),
+        "token": token,
+        "test_id": test_id,
+        "index": index,
+        "tool": tool_type if tool_type in TOOLS else "click",
+        "frames": frames,
+        "defaults": {"clicks": clicks, "duration": duration, "slide_duration": slide_duration},
+        "autosave": bool(autosave),
+        "batch_size": RAPID_BATCH_SIZE,
+        "flush_ms": RAPID_FLUSH_MS,
+    }
+
+def preview_data_url(image_path, display_height):
+    """The plain preview of a frame as a JPEG data URL, for the canvas to draw on."""
+    key = (image_path, file_mtime(image_path), display_height)
+    url = _preview_cache.get(key)
+    if url is None:
+        image = load_image(image_path, display_size(get_image_size(image_path), display_height))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=85)
+        url = _preview_cache.put(key, "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode())
+    return url
+
+def _number(value, minimum):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < minimum:
+        raise ValueError(f"invalid parameter {value!r}")
+    return value
+
+def _point(value):
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise ValueError(f"invalid grounding point {value!r}")
+    x, y = (_number(v, 0) for v in value)
+    if x > 1 or y > 1:
+        raise ValueError(f"grounding point {value!r} is not normalized")
+    return [float(x), float(y)]
+
+def clean_edit(edit):
+    """Validates one edit posted by the canvas. Returns (test_id, img_id, interaction) as stored by the annotation tab.
+
+    Raises ValueError if the edit is malformed.
+    """
+    tool_type = edit.get("interaction_type")
+    if tool_type not in TOOLS:
+        raise ValueError(f"unknown interaction type {tool_type!r}")
+    params = edit.get("interaction_parameters") or {}
+    grounding = params.get("grounding")
+    if tool_type == "slide":
+        if not isinstance(grounding, list) or not 1 <= len(grounding) <= 2:
+            raise ValueError(f"invalid slide grounding {grounding!r}")
+        interaction_params = {"grounding": [_point(p) for p in grounding], "duration": _number(params.get("duration"), 0)}
+    else:
+        interaction_params = {"grounding": _point(grounding)}
+        if tool_type == "multiclick":
+            interaction_params["clicks"] = _number(params.get("clicks"), 1)
+        elif tool_type == "longpress":
+            interaction_params["duration"] = _number(params.get("duration"), 0)
+    return edit.get("test_id"), edit.get("img_id"), {"interaction_type": tool_type, "interaction_parameters": interaction_params}
@@ -0,0 +1,80 @@
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+class Session:
+    """Data of one loaded folder in one browser tab, kept on the server; only its token goes through gr.State."""
+
+    def __init__(self):
+        self.folder_path = ""
+        self.image_groups = {}
+        self.interactions = {}
+        # Test IDs edited since the last export; only these are written out.
+        self.modified_test_ids = set()
+        # Test IDs another session committed first; autosave leaves them to an explicit export.
+        self.autosave_conflicts = set()
+        # Warnings from background work, shown by the next event of this session.
+        self.notices = []
+        # Held while interactions are edited or copied, since events of one tab can run concurrently.
+        self.lock = threading.RLock()
+        self.last_used = time.monotonic()
+
+class SessionStore:
+    """Sessions keyed by random tokens, evicted after `ttl` seconds without use.
+
+    on_evict is called with each session that expires, e.g. to save edits that were never exported.
+    Looking up an unknown or expired token returns an empty session, so handlers behave as if no folder
+    was loaded.
+    """
+
+    def __init__(self, ttl, on_evict=None):
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, previous_token=None):
+        """Starts a new session, replacing previous_token's. Returns (token, session)."""
+        token = secrets.token_urlsafe(16)
+        session = Session()
+        with self._lock:
+            if previous_token:
+                self._sessions.pop(previous_token, None)
+            self._sessions[token] = session
+            expired = self._pop_expired()
+        self._evict(expired)
+        return token, session
+
+    def get(self, token):
+        with self._lock:
+            session = self._sessions.get(token) if token else None
+            if session is not None:
+                session.last_used = time.monotonic()
+                self._sessions.move_to_end(token)
+            expired = self._pop_expired()
+        self._evict(expired)
+        return session if session is not None else Session()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _pop_expired(self):
+        # Sessions are kept in order of last use, so expired ones are at the front.
+        cutoff = time.monotonic() - self.ttl
+        expired = []
+        while self._sessions:
+            token, session = next(iter(self._sessions.items()))
+            if session.last_used >= cutoff:
+                break
+            expired.append(self._sessions.pop(token))
+        return expired
+
+    def _evict(self, sessions):
+        if self.on_evict:
+            for session in sessions:
+                self.on_evict(session)
+
+# You can adjust how long, in seconds, an idle browser tab keeps its loaded folder with the SESSION_TTL environment variable.
+SESSION_TTL = float(os.environ.get("SESSION_TTL", 4 * 3600))
@@ -0,0 +1,182 @@
+import json
+import sqlite3
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+
+# One row per interaction. The primary key doubles as the index used to load a single test ID.
+# A test ID's revision changes whenever it is written, so readers can spot changes without loading frames.
+SCHEMA = """
+PRAGMA journal_mode=WAL;
+CREATE TABLE IF NOT EXISTS test_ids (
+    test_id TEXT PRIMARY KEY,
+    revision INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS interactions (
+    test_id TEXT NOT NULL,
+    img_id TEXT NOT NULL,
+    interaction_type TEXT,
+    parameters TEXT NOT NULL,
+    grounding TEXT,
+    PRIMARY KEY (test_id, img_id)
+);
+"""
+
+# Stored in PRAGMA user_version once the schema is set up, so later connections skip the script.
+SCHEMA_VERSION = 1
+
+def _ensure_schema(conn):
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
+    conn.executescript(SCHEMA)
+    # Databases made before test IDs had revisions.
+    if "revision" not in [column[1] for column in conn.execute("PRAGMA table_info(test_ids)")]:
+        conn.execute("ALTER TABLE test_ids ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+@contextmanager
+def connect(db_path):
+    """Opens the database, creating its tables if the file does not have them yet, and commits when the block succeeds."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        _ensure_schema(conn)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def interaction_to_row(test_id, img_id, interaction):
+    params = dict(interaction.get("interaction_parameters", {}))
+    grounding = params.pop("grounding", None)
+    return (
+        test_id,
+        img_id,
+        interaction.get("interaction_type"),
+        json.dumps(params, separators=(',', ':')),
+        None if grounding is None else json.dumps(grounding, separators=(',', ':')),
+    )
+
+def row_to_interaction(interaction_type, parameters, grounding):
+    params = json.loads(parameters)
+    if grounding is not None:
+        params = {"grounding": json.loads(grounding), **params}
+    return {"interaction_type": interaction_type, "interaction_parameters": params}
+
+def load_test_id(conn, test_id):
+    rows = conn.execute(
+        "SELECT img_id, interaction_type, parameters, grounding FROM interactions WHERE test_id = ? ORDER BY img_id",
+        (test_id,),
+    )
+    return {img_id: row_to_interaction(*row) for img_id, *row in rows}
+
+def load_revisions(conn):
+    """Returns {test_id: revision} of every test ID, from the test_ids table alone."""
+    return dict(conn.execute("SELECT test_id, revision FROM test_ids"))
+
+def write_test_ids(conn, test_ids, frames_for):
+    """Replaces the rows of each test ID with frames_for(test_id), giving it a new revision; None removes the test ID."""
+    for test_id in test_ids:
+        frames = frames_for(test_id)
+        conn.execute("DELETE FROM interactions WHERE test_id = ?", (test_id,))
+        if frames is None:
+            conn.execute("DELETE FROM test_ids WHERE test_id = ?", (test_id,))
+            continue
+        conn.execute(
+            "INSERT INTO test_ids (test_id, revision) VALUES (?, random()) ON CONFLICT (test_id) DO UPDATE SET revision = random()",
+            (test_id,),
+        )
+        conn.executemany(
+            "INSERT INTO interactions (test_id, img_id, interaction_type, parameters, grounding) VALUES (?, ?, ?, ?, ?)",
+            [interaction_to_row(test_id, img_id, interaction) for img_id, interaction in frames.items()],
+        )
+
+def write_interactions(db_path, interactions, test_ids=None):
+    """Writes the given test IDs of a plain interactions dict; without test_ids the database is replaced by it."""
+    with connect(db_path) as conn:
+        if test_ids is None:
+            conn.execute("DELETE FROM interactions")
+            conn.execute("DELETE FROM test_ids")
+            test_ids = list(interactions)
+        write_test_ids(conn, test_ids, interactions.get)
+
+def read_interactions(db_path):
+    """Reads the whole database into a plain interactions dict in a single scan."""
+    with connect(db_path) as conn:
+        interactions = {test_id: {} for (test_id,) in conn.execute("SELECT test_id FROM test_ids ORDER BY test_id")}
+        rows = conn.execute("SELECT test_id, img_id, interaction_type, parameters, grounding FROM interactions ORDER BY test_id, img_id")
+        for test_id, img_id, *row in rows:
+            interactions.setdefault(test_id, {})[img_id] = row_to_interaction(*row)
+    return interactions
+
+class SQLiteInteractions(MutableMapping):
+    """Interactions dict backed by an SQLite database, loaded one test ID at a time.
+
+    Frames are read from the database when a test ID is first looked up and then edited in memory
+    like the plain dict; flush writes the edited test IDs back without touching the others. reload
+    picks up test IDs written by others, comparing revisions only.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._frames = {}
+        self._deleted = set()
+        # {test_id: revision} of the test IDs in the database, as last read.
+        with connect(db_path) as conn:
+            self._stored = load_revisions(conn)
+
+    def reload(self):
+        """Forgets the loaded frames of test IDs whose revision changed in the database since it was last read. Returns those test IDs."""
+        with connect(self.db_path) as conn:
+            revisions = load_revisions(conn)
+        changed = [test_id for test_id in self._stored.keys() | revisions.keys() if self._stored.get(test_id) != revisions.get(test_id)]
+        for test_id in changed:
+            self._frames.pop(test_id, None)
+            self._deleted.discard(test_id)
+        self._stored = revisions
+        return changed
+
+    def __getitem__(self, test_id):
+        frames = self._frames.get(test_id)
+        if frames is None:
+            if test_id not in self:
+                raise KeyError(test_id)
+            with connect(self.db_path) as conn:
+                frames = self._frames[test_id] = load_test_id(conn, test_id)
+        return frames
+
+    def __setitem__(self, test_id, frames):
+        self._frames[test_id] = frames
+        self._deleted.discard(test_id)
+
+    def __delitem__(self, test_id):
+        if test_id not in self:
+            raise KeyError(test_id)
+        self._frames.pop(test_id, None)
+        self._deleted.add(test_id)
+
+    def __contains__(self, test_id):
+        if test_id in self._frames:
+            return True
+        return test_id not in self._deleted and test_id in self._stored
+
+    def __iter__(self):
+        return iter(sorted((self._stored.keys() | self._frames.keys()) - self._deleted))
+
+    def __len__(self):
+        return len((self._stored.keys() | self._frames.keys()) - self._deleted)
+
+    def __bool__(self):
+        return bool(self._frames) or any(test_id not in self._deleted for test_id in self._stored)
+
+    def flush(self, test_ids=None):
+        """Writes the given test IDs, or every test ID loaded or edited in this session, to the database."""
+        if test_ids is None:
+            test_ids = set(self._frames) | self._deleted
+        with connect(self.db_path) as conn:
+            write_test_ids(conn, test_ids, self.get)
+            revisions = {test_id: conn.execute("SELECT revision FROM test_ids WHERE test_id = ?", (test_id,)).fetchone() for test_id in test_ids}
+        for test_id, revision in revisions.items():
+            if revision is not None:
+                self._stored[test_id] = revision[0]
+            else:
+                self._stored.pop(test_id, None)
+                self._deleted.discard(test_id)
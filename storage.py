@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+from sqlite_store import SQLiteInteractions, read_interactions, write_interactions
+
+INTERACTIONS_NAME = "interactions.json"
+# Exports of individual test IDs are appended here and merged into interactions.json by compaction.
+JOURNAL_NAME = "interactions.journal.jsonl"
+# The journal is compacted once it grows past this size, or past the size of interactions.json.
+COMPACT_MIN_BYTES = 1024 * 1024
+SQLITE_NAME = "interactions.sqlite"
+# You can set INTERACTIONS_BACKEND=sqlite to keep interactions in interactions.sqlite instead of interactions.json.
+# A folder that already has interactions.sqlite always uses it.
+INTERACTIONS_BACKEND = os.environ.get("INTERACTIONS_BACKEND", "json")
+
+logger = logging.getLogger(__name__)
+
+_folder_locks = {}
+_folder_locks_lock = threading.Lock()
+
+def _folder_lock(test_img_dir):
+    with _folder_locks_lock:
+        return _folder_locks.setdefault(os.path.abspath(test_img_dir), threading.Lock())
+
+# Read once at import: os.umask can only be read by setting it, which is not safe once threads run.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def _target_mode(path):
+    """The mode path has, or the one a new file would get from open(); mkstemp's 0600 would otherwise replace it."""
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+def write_json_atomic(path, data, **dump_kwargs):
+    """Writes data as JSON to a temp file next to path and renames it over path, so readers never see a partial file.
+
+    The file keeps the mode it had, or gets the usual umask-based mode when it is new.
+    """
+    dump_kwargs.setdefault("separators", (',', ':'))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path), suffix=".tmp", dir=os.path.dirname(path) or ".")
+    try:
+        os.chmod(tmp_path, _target_mode(path))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+def _read_canonical(test_img_dir):
+    interaction_file = os.path.join(test_img_dir, INTERACTIONS_NAME)
+    if not os.path.isfile(interaction_file):
+        return {}
+    with open(interaction_file, 'r') as f:
+        return json.load(f)
+
+def _replay_journal(test_img_dir, interactions):
+    journal_file = os.path.join(test_img_dir, JOURNAL_NAME)
+    if not os.path.isfile(journal_file):
+        return interactions
+    with open(journal_file, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue # A crash mid-append leaves at most a truncated last line
+            if entry.get("frames") is None:
+                interactions.pop(entry["test_id"], None)
+            else:
+                interactions[entry["test_id"]] = entry["frames"]
+    return interactions
+
+def read_journal(test_img_dir, offset=0):
+    """Returns the exports journaled from byte offset on, as {test_id: frames, None if removed}, and the offset after them.
+
+    A last line that is still being appended is left for the next read.
+    """
+    changes = {}
+    try:
+        with open(os.path.join(test_img_dir, JOURNAL_NAME), 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                changes[entry["test_id"]] = entry.get("frames")
+    except FileNotFoundError:
+        pass
+    return changes, offset
+
+def use_sqlite(test_img_dir):
+    return INTERACTIONS_BACKEND == "sqlite" or os.path.isfile(os.path.join(test_img_dir, SQLITE_NAME))
+
+def load_interactions(test_img_dir):
+    """Loads the interactions of a test_img directory.
+
+    With the SQLite backend this returns an SQLiteInteractions that reads test IDs on demand, importing
+    interactions.json first if the database does not exist yet. Otherwise it returns interactions.json
+    as a dict, with any journaled exports applied on top of it.
+    """
+    if not use_sqlite(test_img_dir):
+        return _load_json_interactions(test_img_dir)
+    if not os.path.isdir(test_img_dir):
+        return {}
+    db_path = os.path.join(test_img_dir, SQLITE_NAME)
+    if not os.path.isfile(db_path):
+        import_json_to_sqlite(test_img_dir)
+    return SQLiteInteractions(db_path)
+
+def load_all_interactions(test_img_dir):
+    """Loads every test ID of a test_img directory as a plain dict, reading the SQLite backend in one scan."""
+    interactions = load_interactions(test_img_dir)
+    if isinstance(interactions, SQLiteInteractions):
+        return read_interactions(interactions.db_path)
+    return interactions
+
+def _load_json_interactions(test_img_dir):
+    with _folder_lock(test_img_dir):
+        try:
+            interactions = _read_canonical(test_img_dir)
+        except json.JSONDecodeError:
+            interactions = {} # Ignore if file is empty or corrupt
+        return _replay_journal(test_img_dir, interactions)
+
+def save_interactions(test_img_dir, interactions, test_ids=None):
+    """Persists interactions for a test_img directory.
+
+    With test_ids, only those test IDs are appended to the journal, so the cost does not grow with the rest
+    of the folder. Without, the whole dict is written atomically as the new interactions.json. With the
+    SQLite backend the same test IDs are written as rows instead. Returns the path that was written.
+    """
+    os.makedirs(test_img_dir, exist_ok=True)
+    if isinstance(interactions, SQLiteInteractions):
+        interactions.flush(test_ids)
+        return interactions.db_path
+    if use_sqlite(test_img_dir):
+        db_path = os.path.join(test_img_dir, SQLITE_NAME)
+        write_interactions(db_path, interactions, test_ids)
+        return db_path
+    if test_ids is None:
+        with _folder_lock(test_img_dir):
+            return _write_canonical(test_img_dir, interactions)
+
+    journal_file = os.path.join(test_img_dir, JOURNAL_NAME)
+    with _folder_lock(test_img_dir):
+        with open(journal_file, 'a') as f:
+            for test_id in test_ids:
+                f.write(json.dumps({"test_id": test_id, "frames": interactions.get(test_id)}, separators=(',', ':')) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        needs_compaction = _journal_too_large(test_img_dir)
+    if needs_compaction:
+        # The export is already safe in the journal, so a failed compaction is only logged; the next export retries it.
+        try:
+            compact_interactions(test_img_dir)
+        except (OSError, ValueError):
+            logger.exception("Compacting the journal of %s failed", test_img_dir)
+    return journal_file
+
+def compact_interactions(test_img_dir):
+    """Merges the journal into interactions.json and removes it.
+
+    Raises json.JSONDecodeError instead of overwriting an interactions.json that cannot be read.
+    """
+    with _folder_lock(test_img_dir):
+        interactions = _replay_journal(test_img_dir, _read_canonical(test_img_dir))
+        return _write_canonical(test_img_dir, interactions)
+
+def _write_canonical(test_img_dir, interactions):
+    interaction_file = os.path.join(test_img_dir, INTERACTIONS_NAME)
+    write_json_atomic(interaction_file, interactions)
+    journal_file = os.path.join(test_img_dir, JOURNAL_NAME)
+    if os.path.exists(journal_file):
+        os.unlink(journal_file)
+    return interaction_file
+
+def _journal_too_large(test_img_dir):
+    journal_size = os.path.getsize(os.path.join(test_img_dir, JOURNAL_NAME))
+    interaction_file = os.path.join(test_img_dir, INTERACTIONS_NAME)
+    canonical_size = os.path.getsize(interaction_file) if os.path.isfile(interaction_file) else 0
+    return journal_size > max(COMPACT_MIN_BYTES, canonical_size)
+
+def import_json_to_sqlite(test_img_dir):
+    """Replaces the contents of interactions.sqlite with interactions.json and its journal."""
+    db_path = os.path.join(test_img_dir, SQLITE_NAME)
+    write_interactions(db_path, _load_json_interactions(test_img_dir))
+    return db_path
+
+def export_sqlite_to_json(test_img_dir):
+    """Writes the contents of interactions.sqlite to interactions.json."""
+    interactions = read_interactions(os.path.join(test_img_dir, SQLITE_NAME))
+    with _folder_lock(test_img_dir):
+        return _write_canonical(test_img_dir, interactions)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert the interactions of a test_img directory between interactions.json and interactions.sqlite.")
+    parser.add_argument("command", choices=["import", "export", "compact"], help="import: JSON to SQLite, export: SQLite to JSON, compact: merge the JSON journal")
+    parser.add_argument("test_img_dir")
+    args = parser.parse_args()
+    commands = {"import": import_json_to_sqlite, "export": export_sqlite_to_json, "compact": compact_interactions}
+    print(commands[args.command](args.test_img_dir))
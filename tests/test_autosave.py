@@ -0,0 +1,51 @@
+"""AutoSaver giving up on writes that keep failing.
+
+The delay is long so the background thread stays out of the way; the tests flush by hand.
+"""
+import storage
+from autosave import AutoSaver
+from interaction_store import _folder_stores, open_interactions
+
+def test_failed_writes_are_retried_then_reported(tmp_path, monkeypatch):
+    storage.save_interactions(str(tmp_path), {"test_00": {}})
+    interactions = open_interactions(str(tmp_path))
+    interactions["test_00"] = {"img_0": {"interaction_type": "click", "interaction_parameters": {}}}
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+    monkeypatch.setattr(interactions.store, "commit", fail)
+
+    autosaver = AutoSaver(delay=60, retries=2)
+    failures = []
+    autosaver.mark(interactions, "test_00", on_failure=lambda test_ids, error: failures.append((test_ids, str(error))))
+    for _ in range(3):
+        assert not failures
+        autosaver.flush()
+
+    assert failures == [(["test_00"], "disk full")]
+    assert autosaver.errors == 3 and autosaver.pending() == 0
+    _folder_stores.clear()
+
+def test_a_successful_write_resets_the_failure_count(tmp_path, monkeypatch):
+    storage.save_interactions(str(tmp_path), {"test_00": {}})
+    interactions = open_interactions(str(tmp_path))
+    interactions["test_00"] = {}
+    commit = interactions.store.commit
+    outcomes = iter([OSError("busy"), None, OSError("busy"), None])
+
+    def flaky(*args, **kwargs):
+        error = next(outcomes)
+        if error:
+            raise error
+        return commit(*args, **kwargs)
+    monkeypatch.setattr(interactions.store, "commit", flaky)
+
+    autosaver = AutoSaver(delay=60, retries=1)
+    failures = []
+    for _ in range(2):
+        autosaver.mark(interactions, "test_00", on_failure=lambda *args: failures.append(args))
+        autosaver.flush()
+        autosaver.flush()
+
+    assert not failures and autosaver.writes == 2
+    _folder_stores.clear()
@@ -0,0 +1,35 @@
+"""Headless batch analysis reading image headers in its workers."""
+import folder_index
+from PIL import Image
+from batch_analysis import iter_tasks, run_analysis
+from folder_index import FolderIndex
+from storage import save_interactions
+
+def make_folder(root, count):
+    test_img_dir = root / "folder" / "test_img"
+    interactions = {}
+    for i in range(count):
+        imgs = test_img_dir / f"test_{i:02d}" / "imgs"
+        imgs.mkdir(parents=True)
+        for j in range(3):
+            Image.new("RGB", (100 + i, 200)).save(imgs / f"{j}.png")
+        interactions[f"test_{i:02d}"] = {
+            f"{j}.png": {"interaction_type": "click", "interaction_parameters": {"grounding": [0.1 * j, 0.5]}} for j in range(3)
+        }
+    save_interactions(str(test_img_dir), interactions)
+    return test_img_dir
+
+def test_workers_index_the_folder_and_the_parent_writes_the_manifest_once(tmp_path, monkeypatch):
+    test_img_dir = make_folder(tmp_path, 10)
+    writes = []
+    write_json_atomic = folder_index.write_json_atomic
+    monkeypatch.setattr(folder_index, "write_json_atomic", lambda *args: writes.append(args) or write_json_atomic(*args))
+
+    summaries, steps = run_analysis(iter_tasks(str(tmp_path), batch_size=3), workers=0)
+    assert len(writes) == 1
+    assert len(FolderIndex(str(test_img_dir))._manifest) == 10
+    assert [summary["points"] for summary in summaries] == [3] * 10
+
+    # A warm manifest is left alone, and a process pool gives the same report.
+    assert run_analysis(iter_tasks(str(tmp_path), batch_size=3), workers=2) == (summaries, steps)
+    assert len(writes) == 1
@@ -0,0 +1,27 @@
+"""Screenshot caches checking file mtimes only every IMAGE_RECHECK_SECONDS."""
+import os
+from PIL import Image
+import cache
+
+def test_hits_skip_stat_until_the_recheck(tmp_path, monkeypatch):
+    path = str(tmp_path / "0.png")
+    Image.new("RGB", (10, 20)).save(path)
+    now = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    assert cache.load_image(path).size == (10, 20)
+
+    stats = []
+    real_stat = os.stat
+    monkeypatch.setattr(cache.os, "stat", lambda p, *args, **kwargs: stats.append(p) or real_stat(p, *args, **kwargs))
+    for _ in range(5):
+        assert cache.load_image(path).size == (10, 20)
+        assert cache.get_image_size(path) == (10, 20)
+    assert stats == []
+
+    # The screenshot is replaced; it is picked up once the recheck interval has passed.
+    Image.new("RGB", (30, 40)).save(path)
+    os.utime(path, ns=(real_stat(path).st_atime_ns, real_stat(path).st_mtime_ns + 1))
+    assert cache.load_image(path).size == (10, 20)
+    now[0] += cache.IMAGE_RECHECK_SECONDS
+    assert cache.load_image(path).size == (30, 40)
+    assert cache.get_image_size(path) == (30, 40)
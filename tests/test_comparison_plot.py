@@ -0,0 +1,21 @@
+"""The batched multi-comparison figure."""
+import pytest
+from calculate_tab import build_multi_comparison_figure
+from path_metrics import compute_path_metrics
+
+def metrics(n):
+    frames = {f"{j}.jpg": {"interaction_type": "click", "interaction_parameters": {"grounding": [j / 10, (j % 3) / 7]}} for j in range(n)}
+    return compute_path_metrics({"t": frames}, "t", {img_id: (100, 200) for img_id in frames})
+
+@pytest.mark.parametrize("count", [1, 2, 5])
+def test_each_series_gets_its_own_color_band(count):
+    marker = build_multi_comparison_figure([(f"t{i}", metrics(4 + i)) for i in range(count)])["data"][0]["marker"]
+    stops = marker["colorscale"]
+    # Plotly.js needs at least two stops, from 0 to 1, in order.
+    assert len(stops) >= 2 and stops[0][0] == 0 and stops[-1][0] == 1
+    assert [position for position, _ in stops] == sorted(position for position, _ in stops)
+
+    for i in set(marker["color"]):
+        position = (i - marker["cmin"]) / (marker["cmax"] - marker["cmin"])
+        band = [color for (start, color), (end, _) in zip(stops[::2], stops[1::2]) if start <= position <= end]
+        assert band == [stops[2 * i][1]]
@@ -0,0 +1,105 @@
+"""Many annotators editing and exporting the same folder at once.
+
+Every annotator thread repeatedly opens a session, adds one interaction to a random test ID and
+commits it, redoing the edit from a fresh session on conflict. Some exports rewrite the whole file
+instead. At the end the folder is reloaded from disk, and every committed interaction must be
+there.
+"""
+import random
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import storage
+from autosave import AutoSaver
+from interaction_store import _folder_stores, open_interactions
+
+ANNOTATORS = 8
+ROUNDS = 25
+TEST_IDS = [f"test_{i:02d}" for i in range(4)]
+
+def interaction(rng):
+    return {"interaction_type": "click", "interaction_parameters": {"grounding": [rng.random(), rng.random()]}}
+
+@pytest.fixture(params=["json", "sqlite"])
+def test_img_dir(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "INTERACTIONS_BACKEND", request.param)
+    # Compact often, so compaction runs while other annotators are appending.
+    monkeypatch.setattr(storage, "COMPACT_MIN_BYTES", 4096)
+    storage.save_interactions(str(tmp_path), {test_id: {} for test_id in TEST_IDS})
+    yield str(tmp_path)
+    _folder_stores.clear()
+
+def reload(test_img_dir):
+    _folder_stores.clear()
+    return storage.load_interactions(test_img_dir)
+
+def annotate(test_img_dir, annotator, full_export_every=10):
+    rng = random.Random(annotator)
+    committed = []
+    for round_index in range(ROUNDS):
+        test_id = rng.choice(TEST_IDS)
+        img_id = f"{annotator:03d}-{round_index:04d}.png"
+        while True:
+            interactions = open_interactions(test_img_dir)
+            interactions[test_id][img_id] = interaction(rng)
+            if not interactions.commit([test_id]):
+                committed.append((test_id, img_id))
+                break
+        if round_index % full_export_every == 0:
+            interactions.store.save_all()
+    return committed
+
+def test_concurrent_commits_lose_nothing(test_img_dir):
+    with ThreadPoolExecutor(max_workers=ANNOTATORS) as executor:
+        results = list(executor.map(lambda annotator: annotate(test_img_dir, annotator), range(ANNOTATORS)))
+    committed = [item for items in results for item in items]
+
+    saved = reload(test_img_dir)
+    assert [item for item in committed if item[1] not in saved[item[0]]] == []
+    assert sum(len(saved[test_id]) for test_id in saved) == len(committed)
+
+def test_autosave_does_not_overwrite_other_sessions(test_img_dir):
+    autosaver = AutoSaver(delay=0)
+    rng = random.Random(0)
+    test_id = TEST_IDS[0]
+    ours, theirs = open_interactions(test_img_dir), open_interactions(test_img_dir)
+    ours[test_id]["ours.png"] = interaction(rng)
+    theirs[test_id]["theirs.png"] = interaction(rng)
+    assert theirs.commit([test_id]) == []
+
+    conflicts = []
+    for _ in range(2):
+        # A later autosave of the same test ID must keep conflicting rather than overwrite.
+        autosaver.mark(ours, test_id, conflicts.append)
+        autosaver.flush()
+    assert conflicts == [[test_id], [test_id]]
+    assert autosaver.pending() == 0
+    assert set(reload(test_img_dir)[test_id]) == {"theirs.png"}
+
+def test_autosave_with_concurrent_commits(test_img_dir):
+    # Annotators whose autosaves conflict fall back to committing from a fresh session, as a user
+    # would after the conflict warning; nothing committed by anyone may be lost.
+    autosaver = AutoSaver(delay=0)
+
+    def autosave_annotator(annotator):
+        rng = random.Random(1000 + annotator)
+        committed = []
+        for round_index in range(ROUNDS):
+            test_id = rng.choice(TEST_IDS)
+            img_id = f"auto-{annotator:03d}-{round_index:04d}.png"
+            interactions = open_interactions(test_img_dir)
+            interactions[test_id][img_id] = interaction(rng)
+            conflicts = []
+            autosaver.mark(interactions, test_id, conflicts.extend)
+            autosaver.flush()
+            if not conflicts:
+                committed.append((test_id, img_id))
+        return committed
+
+    with ThreadPoolExecutor(max_workers=ANNOTATORS) as executor:
+        autosaved = executor.map(autosave_annotator, range(ANNOTATORS // 2))
+        exported = executor.map(lambda annotator: annotate(test_img_dir, annotator), range(ANNOTATORS // 2))
+        committed = [item for items in list(autosaved) + list(exported) for item in items]
+
+    saved = reload(test_img_dir)
+    assert [item for item in committed if item[1] not in saved[item[0]]] == []
+    assert sum(len(saved[test_id]) for test_id in saved) == len(committed)
@@ -0,0 +1,70 @@
+"""FolderIndex reusing its manifest only for images that did not change."""
+import os
+from PIL import Image
+import folder_index
+from folder_index import FolderIndex
+
+def make_image(path, size):
+    Image.new("RGB", size).save(path)
+
+def test_replaced_image_is_read_again(tmp_path, monkeypatch):
+    imgs = tmp_path / "test_00" / "imgs"
+    imgs.mkdir(parents=True)
+    make_image(imgs / "0.png", (10, 20))
+    make_image(imgs / "1.png", (30, 40))
+    assert FolderIndex(str(tmp_path)).frame_sizes("test_00") == {"0.png": (10, 20), "1.png": (30, 40)}
+
+    # Overwriting a screenshot in place leaves the mtime of the imgs directory as it was.
+    dir_stat = os.stat(imgs)
+    make_image(imgs / "1.png", (50, 60))
+    os.utime(imgs, ns=(dir_stat.st_atime_ns, dir_stat.st_mtime_ns))
+
+    read = []
+    monkeypatch.setattr(folder_index, "read_image_header", lambda path: read.append(os.path.basename(path)) or Image.open(path).size)
+    assert FolderIndex(str(tmp_path)).frame_sizes("test_00") == {"0.png": (10, 20), "1.png": (50, 60)}
+    assert read == ["1.png"]
+
+def test_unchanged_folder_keeps_its_manifest(tmp_path):
+    imgs = tmp_path / "test_00" / "imgs"
+    imgs.mkdir(parents=True)
+    make_image(imgs / "0.png", (10, 20))
+    FolderIndex(str(tmp_path))["test_00"]
+    manifest_mtime = os.stat(tmp_path / folder_index.MANIFEST_NAME).st_mtime_ns
+
+    assert FolderIndex(str(tmp_path))["test_00"] == [str(imgs / "0.png")]
+    assert os.stat(tmp_path / folder_index.MANIFEST_NAME).st_mtime_ns == manifest_mtime
+
+def test_loading_a_folder_writes_the_manifest_once(tmp_path, monkeypatch):
+    for i in range(20):
+        imgs = tmp_path / f"test_{i:02d}" / "imgs"
+        imgs.mkdir(parents=True)
+        make_image(imgs / "0.png", (10, 20))
+    writes = []
+    write_json_atomic = folder_index.write_json_atomic
+    monkeypatch.setattr(folder_index, "write_json_atomic", lambda *args: writes.append(args) or write_json_atomic(*args))
+
+    index = FolderIndex(str(tmp_path))
+    for test_id in index:
+        index[test_id]
+    index.flush()
+
+    # The first lookup writes at once, the rest wait for the flush.
+    assert len(writes) == 2
+    assert len(FolderIndex(str(tmp_path))._manifest) == 20
+
+def test_test_ids_without_images_are_not_listed(tmp_path):
+    for test_id in ("test_00", "test_01", "test_02"):
+        (tmp_path / test_id / "imgs").mkdir(parents=True)
+    make_image(tmp_path / "test_00" / "imgs" / "0.png", (10, 20))
+    (tmp_path / "test_01" / "imgs" / ".DS_Store").write_bytes(b"")
+    (tmp_path / "test_03").mkdir()
+    assert list(FolderIndex(str(tmp_path))) == ["test_00"]
+
+    # A manifest entry does not keep a test ID whose images were removed.
+    make_image(tmp_path / "test_02" / "imgs" / "0.png", (10, 20))
+    index = FolderIndex(str(tmp_path))
+    assert index.first_non_empty() == "test_00" and list(index) == ["test_00", "test_02"]
+    index["test_02"]
+    index.flush()
+    (tmp_path / "test_02" / "imgs" / "0.png").unlink()
+    assert list(FolderIndex(str(tmp_path))) == ["test_00"]
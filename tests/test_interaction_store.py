@@ -0,0 +1,79 @@
+"""FolderStore picking up changes that another process wrote to the folder's files."""
+import sqlite3
+import pytest
+import sqlite_store
+import storage
+from interaction_store import FolderStore, SessionInteractions
+
+TEST_IDS = [f"test_{i:02d}" for i in range(5)]
+
+def frames(x):
+    return {"img_0": {"interaction_type": "click", "interaction_parameters": {"grounding": [x, x]}}}
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "INTERACTIONS_BACKEND", request.param)
+    storage.save_interactions(str(tmp_path), {test_id: frames(0.1) for test_id in TEST_IDS})
+    return FolderStore(str(tmp_path))
+
+def test_outside_changes_bump_only_their_test_ids(store):
+    versions = {test_id: store.version(test_id) for test_id in TEST_IDS}
+    # Another process exports one test ID and removes another.
+    storage.save_interactions(store.test_img_dir, {"test_01": frames(0.5), "test_03": None}, ["test_01", "test_03"])
+
+    assert store.has("test_01") and not store.has("test_03")
+    assert store.checkout("test_01")[0] == frames(0.5)
+    assert {test_id for test_id in TEST_IDS if store.version(test_id) != versions[test_id]} == {"test_01", "test_03"}
+
+def test_sqlite_refresh_does_not_load_frames(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "INTERACTIONS_BACKEND", "sqlite")
+    storage.save_interactions(str(tmp_path), {test_id: frames(0.1) for test_id in TEST_IDS})
+    store = FolderStore(str(tmp_path))
+    storage.save_interactions(store.test_img_dir, {"test_02": frames(0.9)}, ["test_02"])
+
+    assert store.version("test_02") == 0 and store.has("test_02")
+    assert store.version("test_02") == 1
+    assert not store.interactions._frames
+
+def test_own_commits_are_not_outside_changes(store):
+    base_versions = {}
+    assert store.commit({"test_00": frames(0.7)}, base_versions) == []
+    store.test_ids()
+    assert base_versions == {"test_00": 1}
+    assert all(store.version(test_id) == 0 for test_id in TEST_IDS[1:])
+
+def test_sqlite_databases_without_revisions_are_upgraded(tmp_path):
+    db_path = str(tmp_path / storage.SQLITE_NAME)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE test_ids (test_id TEXT PRIMARY KEY)")
+        conn.execute("CREATE TABLE interactions (test_id TEXT NOT NULL, img_id TEXT NOT NULL, interaction_type TEXT, parameters TEXT NOT NULL, grounding TEXT, PRIMARY KEY (test_id, img_id))")
+        conn.execute("INSERT INTO test_ids VALUES ('test_00')")
+    conn.close()
+
+    sqlite_store.write_interactions(db_path, {"test_01": frames(0.2)}, ["test_01"])
+    assert sqlite_store.read_interactions(db_path) == {"test_00": {}, "test_01": frames(0.2)}
+    with sqlite_store.connect(db_path) as conn:
+        assert set(sqlite_store.load_revisions(conn)) == {"test_00", "test_01"}
+
+def test_recreated_sqlite_database_gets_its_schema(tmp_path):
+    db_path = str(tmp_path / storage.SQLITE_NAME)
+    for _ in range(3):
+        # A new file may reuse the inode of the one just deleted.
+        sqlite_store.write_interactions(db_path, {"test_00": frames(0.3)})
+        assert sqlite_store.read_interactions(db_path) == {"test_00": frames(0.3)}
+        for suffix in ("", "-wal", "-shm"):
+            if (tmp_path / (storage.SQLITE_NAME + suffix)).exists():
+                (tmp_path / (storage.SQLITE_NAME + suffix)).unlink()
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_session_truthiness_does_not_list_test_ids(tmp_path, monkeypatch, backend):
+    monkeypatch.setattr(storage, "INTERACTIONS_BACKEND", backend)
+    storage.save_interactions(str(tmp_path), {"test_00": frames(0.1)})
+    interactions = SessionInteractions(FolderStore(str(tmp_path)))
+    monkeypatch.setattr(SessionInteractions, "__iter__", lambda self: pytest.fail("listed every test ID"))
+
+    assert interactions
+    del interactions["test_00"]
+    assert not interactions
+    interactions["test_01"] = frames(0.2)
+    assert interactions
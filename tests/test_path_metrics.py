@@ -0,0 +1,73 @@
+"""calculate_operation_quality_scores against the per-point loop create_distance_plot used before it.
+
+The loop summed with pandas and the vectorised version subtracts from the total, so results are
+compared with isclose. An average that is zero up to rounding can therefore print as -0.00% where
+the loop printed 0.00% (or the other way round); the scores themselves agree.
+"""
+import random
+import numpy as np
+import pandas as pd
+import pytest
+from path_metrics import calculate_operation_quality_scores
+
+def loop_scores(distances):
+    """The previous per-point loop: (mean without point i, its score) per interaction point, None where it gave none."""
+    mean_dist = pd.Series(distances).mean()
+    results = []
+    for i in range(len(distances) + 1):
+        indices_to_remove = []
+        if i > 0:
+            indices_to_remove.append(i - 1)
+        if i < len(distances):
+            indices_to_remove.append(i)
+        remaining_distances = [d for j, d in enumerate(distances) if j not in indices_to_remove]
+        if not remaining_distances:
+            results.append((None, None))
+            continue
+        mean_dist_without_i = pd.Series(remaining_distances).mean()
+        score = (mean_dist_without_i - mean_dist) / mean_dist if mean_dist > 0 else 0.0
+        results.append((mean_dist_without_i, score))
+    return results
+
+def assert_matches_loop(distances):
+    means_without, scores = calculate_operation_quality_scores(distances)
+    expected = loop_scores(distances)
+    assert len(means_without) == len(scores) == len(expected) == len(distances) + 1
+    for i, (mean_without, score) in enumerate(expected):
+        if mean_without is None:
+            assert np.isnan(means_without[i]) and np.isnan(scores[i]), i
+        else:
+            assert means_without[i] == pytest.approx(mean_without, abs=1e-12), i
+            assert scores[i] == pytest.approx(score, abs=1e-12), i
+
+    loop_average = [score for mean_without, score in expected if mean_without is not None]
+    if loop_average and pd.Series(distances).mean() > 0:
+        assert np.nanmean(scores) == pytest.approx(pd.Series(loop_average).mean(), abs=1e-12)
+
+def test_first_last_and_interior_points():
+    distances = [3.0, 1.0, 4.0, 1.0, 5.0]
+    means_without, _ = calculate_operation_quality_scores(distances)
+    # The first and last points drop one distance, interior points the two on either side.
+    assert means_without[0] == pytest.approx(np.mean(distances[1:]))
+    assert means_without[-1] == pytest.approx(np.mean(distances[:-1]))
+    assert means_without[2] == pytest.approx(np.mean([3.0, 1.0, 5.0]))
+    assert_matches_loop(distances)
+
+def test_two_points_have_no_scores():
+    means_without, scores = calculate_operation_quality_scores([2.5])
+    assert np.isnan(means_without).all() and np.isnan(scores).all()
+    assert_matches_loop([2.5])
+
+def test_three_points():
+    assert_matches_loop([2.0, 6.0])
+
+def test_all_zero_distances_score_zero():
+    means_without, scores = calculate_operation_quality_scores([0.0, 0.0, 0.0])
+    assert (means_without == 0).all() and (scores == 0).all()
+    assert_matches_loop([0.0, 0.0, 0.0])
+
+def test_random_series():
+    rng = random.Random(7)
+    for _ in range(200):
+        distances = [rng.choice([0.0, rng.random(), rng.uniform(0, 500)]) for _ in range(rng.randint(1, 40))]
+        assert_matches_loop(distances)
@@ -0,0 +1,116 @@
+"""Rendered previews against the renderers they replaced.
+
+Markers were rasterized as 100 concentric ellipses and are now a cached sprite (user-001); overlays
+were blended over the whole frame and now only over the dirty region (user-002); previews are now
+rendered at display resolution, with clicks normalized by the preview size (user-004).
+"""
+import math
+import numpy as np
+import pytest
+from PIL import Image, ImageColor, ImageDraw
+from utils import display_size, draw_point_on_image, paste_marker
+
+def ellipse_marker(size, x, y, rgb_color, total_radius=100, solid_radius=25):
+    """The previous marker: semi-transparent concentric circles with a solid centre."""
+    overlay = Image.new("RGBA", size, (255, 255, 255, 0))
+    draw = ImageDraw.Draw(overlay)
+    for i in range(total_radius, 0, -1):
+        alpha = int(255 * (1 - (i / total_radius))**1.5)
+        draw.ellipse((x - i, y - i, x + i, y + i), fill=rgb_color + (alpha,), outline=None)
+    draw.ellipse((x - solid_radius, y - solid_radius, x + solid_radius, y + solid_radius), fill=rgb_color + (255,), outline=None)
+    return overlay
+
+def full_frame_render(image_path, normalized_coords, color="red", interaction_type="click", trajectory_points=None):
+    """The previous full-frame compositing, with the sprite marker so only the compositing differs."""
+    with Image.open(image_path) as base_img:
+        base_img = base_img.convert("RGBA")
+        overlay = Image.new("RGBA", base_img.size, (255, 255, 255, 0))
+        draw = ImageDraw.Draw(overlay)
+        width, height = base_img.size
+        rgb_color = ImageColor.getrgb(color)
+
+        if trajectory_points and len(trajectory_points) > 1:
+            pixel_points = [(p[0] * width, p[1] * height) for p in trajectory_points]
+            num_segments = len(pixel_points) - 1
+            for i in range(num_segments):
+                alpha = int(255 * ((i + 1) / num_segments))
+                draw.line([pixel_points[i], pixel_points[i + 1]], fill=(255, 0, 0, alpha), width=5)
+
+        coords_to_draw = normalized_coords if isinstance(normalized_coords[0], (list, tuple)) else [normalized_coords]
+        for coords in coords_to_draw:
+            paste_marker(overlay, coords[0] * width, coords[1] * height, rgb_color, 100, 25)
+
+        if interaction_type == 'slide' and len(coords_to_draw) == 2:
+            x1, y1 = coords_to_draw[0][0] * width, coords_to_draw[0][1] * height
+            x2, y2 = coords_to_draw[1][0] * width, coords_to_draw[1][1] * height
+            draw.line([(x1, y1), (x2, y2)], fill=rgb_color + (255,), width=10)
+            angle = math.atan2(y1 - y2, x1 - x2)
+            head = [(x2, y2)] + [(x2 + 80 * math.cos(angle + a), y2 + 80 * math.sin(angle + a)) for a in (-math.pi / 8, math.pi / 8)]
+            draw.polygon(head, fill=rgb_color + (255,))
+
+        return Image.alpha_composite(base_img, overlay).convert("RGB")
+
+def over_gray(overlay):
+    rgba = np.asarray(overlay).astype(float)
+    alpha = rgba[..., 3:] / 255
+    return rgba[..., :3] * alpha + 128 * (1 - alpha)
+
+@pytest.mark.parametrize("x, y, total_radius, solid_radius", [(150, 160, 100, 25), (20, 300, 100, 25), (150, 160, 47, 12), (40.4, 60.6, 23, 6)])
+def test_sprite_marker_matches_concentric_circles(x, y, total_radius, solid_radius):
+    size = (300, 320)
+    old = over_gray(ellipse_marker(size, x, y, (255, 0, 0), total_radius, solid_radius))
+    sprite = Image.new("RGBA", size, (255, 255, 255, 0))
+    paste_marker(sprite, x, y, (255, 0, 0), total_radius, solid_radius)
+    new = over_gray(sprite)
+
+    difference = np.abs(old - new).max(axis=2)
+    # The ellipses were anti-aliased by PIL ring by ring, the sprite by distance, so only ring edges differ.
+    assert difference.mean() < 0.5
+    assert (difference > 8).mean() < 0.01
+    assert tuple(new[round(y), round(x)]) == (255, 0, 0)
+
+@pytest.fixture
+def screenshot(tmp_path):
+    rng = np.random.default_rng(3)
+    path = str(tmp_path / "frame.png")
+    Image.fromarray(rng.integers(0, 256, (900, 420, 3), dtype=np.uint8)).save(path)
+    return path
+
+CASES = {
+    "click": dict(normalized_coords=[0.5, 0.5], color="red", interaction_type="click"),
+    "edge": dict(normalized_coords=[0.02, 0.99], color="blue", interaction_type="longpress"),
+    "slide": dict(normalized_coords=[[0.5, 0.7], [0.4, 0.3]], color="green", interaction_type="slide"),
+    "trajectory": dict(normalized_coords=[0.5, 0.5], color="red", interaction_type="click",
+                       trajectory_points=[[0.2, 0.8], [0.3, 0.6], [0.45, 0.55], [0.5, 0.5]]),
+}
+
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_dirty_region_matches_full_frame(screenshot, case):
+    new = np.asarray(draw_point_on_image(screenshot, **CASES[case]))
+    old = np.asarray(full_frame_render(screenshot, **CASES[case]))
+    assert new.shape == old.shape
+    assert np.array_equal(new, old)
+
+def marker_centre(image, rgb_color):
+    """Centroid of the pixels drawn in exactly the marker colour."""
+    ys, xs = np.nonzero((np.asarray(image) == rgb_color).all(axis=2))
+    return xs.mean(), ys.mean()
+
+@pytest.mark.parametrize("click", [(10, 15), (100, 200), (200, 480)])
+def test_preview_clicks_land_where_the_full_frame_draws_them(tmp_path, click):
+    # A 1080x2340 screenshot shown in a 256 px high widget is rendered at 236x512.
+    path = str(tmp_path / "frame.png")
+    Image.new("RGB", (1080, 2340), (128, 128, 128)).save(path)
+    width, height = display_size((1080, 2340), 256)
+    assert (width, height) == (236, 512)
+
+    # Clicks arrive in preview pixels and are stored normalized, as handle_image_click does.
+    grounding = [click[0] / width, click[1] / height]
+    preview = draw_point_on_image(path, grounding, display_height=256)
+    full = draw_point_on_image(path, grounding)
+    assert preview.size == (width, height)
+
+    preview_x, preview_y = marker_centre(preview, (255, 0, 0))
+    full_x, full_y = marker_centre(full, (255, 0, 0))
+    assert (preview_x, preview_y) == pytest.approx(click, abs=1)
+    assert (full_x, full_y) == pytest.approx((click[0] * 1080 / width, click[1] * 2340 / height), abs=2)
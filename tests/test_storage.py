@@ -0,0 +1,24 @@
+"""The JSON journal and its compaction."""
+import os
+import storage
+
+def test_failed_compaction_keeps_the_export(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(storage, "COMPACT_MIN_BYTES", 0)
+    # An interactions.json that cannot be read makes compaction refuse to overwrite it.
+    (tmp_path / storage.INTERACTIONS_NAME).write_text("{")
+
+    frames = {"img_0": {"interaction_type": "click", "interaction_parameters": {}}}
+    path = storage.save_interactions(str(tmp_path), {"test_00": frames}, ["test_00"])
+
+    assert path == os.path.join(str(tmp_path), storage.JOURNAL_NAME)
+    assert "Compacting the journal" in caplog.text
+    assert storage.read_journal(str(tmp_path))[0] == {"test_00": frames}
+
+def test_atomic_writes_keep_the_file_mode(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_UMASK", 0o022)
+    path = str(tmp_path / storage.INTERACTIONS_NAME)
+    storage.write_json_atomic(path, {})
+    assert os.stat(path).st_mode & 0o777 == 0o644
+    os.chmod(path, 0o664)
+    storage.write_json_atomic(path, {"test_00": {}})
+    assert os.stat(path).st_mode & 0o777 == 0o664
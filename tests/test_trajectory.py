@@ -0,0 +1,78 @@
+"""TrajectoryIndex, updated edit by edit, against the per-frame loop get_render_args used before it."""
+import random
+from trajectory import TrajectoryIndex, get_trajectory_index, update_trajectory
+
+def loop_points(frames, img_id):
+    """The previous loop: walks every earlier frame again for each frame shown."""
+    trajectory_points = []
+    sorted_img_ids = sorted(frames.keys())
+    up_to_index = sorted_img_ids.index(img_id)
+    for i in range(up_to_index):
+        interaction = frames.get(sorted_img_ids[i], {})
+        grounding = interaction.get("interaction_parameters", {}).get("grounding")
+        if not grounding:
+            continue
+        if interaction.get("interaction_type") == "slide" and len(grounding) == 2:
+            if not trajectory_points or trajectory_points[-1] != grounding[0]:
+                trajectory_points.append(grounding[0])
+            trajectory_points.append(grounding[1])
+        else:
+            point = grounding[0] if isinstance(grounding[0], list) else grounding
+            if isinstance(point, list) and len(point) == 2:
+                trajectory_points.append(point)
+
+    current_grounding = frames[img_id].get("interaction_parameters", {}).get("grounding")
+    if current_grounding:
+        start_point_current = current_grounding[0] if isinstance(current_grounding[0], list) else current_grounding
+        if isinstance(start_point_current, list) and len(start_point_current) == 2:
+            if not trajectory_points or trajectory_points[-1] != start_point_current:
+                trajectory_points.append(start_point_current)
+    return trajectory_points
+
+def random_interaction(rng, previous_end=None):
+    point = lambda: [rng.choice([0.25, 0.5, 0.75]), rng.choice([0.25, 0.5, 0.75])]
+    kind = rng.choice(["click", "multiclick", "longpress", "slide", "slide", "empty"])
+    if kind == "empty":
+        return {"interaction_type": "click", "interaction_parameters": {"grounding": []}}
+    if kind == "slide":
+        # Slides often start where the previous one ended, which the knots deduplicate.
+        start = previous_end if previous_end and rng.random() < 0.5 else point()
+        grounding = rng.choice([[start, point()], [start]])
+        return {"interaction_type": "slide", "interaction_parameters": {"grounding": grounding}}
+    return {"interaction_type": kind, "interaction_parameters": {"grounding": point()}}
+
+def slide_end(interaction):
+    grounding = interaction["interaction_parameters"]["grounding"] if interaction else None
+    if interaction and interaction["interaction_type"] == "slide" and grounding:
+        return grounding[-1]
+    return None
+
+def assert_matches_loop(index, frames):
+    for img_id in frames:
+        assert index.points_for(img_id) == loop_points(frames, img_id), img_id
+
+def test_fresh_index_matches_loop():
+    rng = random.Random(11)
+    for _ in range(50):
+        frames, end = {}, None
+        for i in rng.sample(range(40), rng.randint(1, 25)):
+            frames[f"{i:03d}.jpg"] = interaction = random_interaction(rng, end)
+            end = slide_end(interaction)
+        assert_matches_loop(TrajectoryIndex(frames), frames)
+
+def test_incremental_updates_match_loop():
+    rng = random.Random(5)
+    for trial in range(200):
+        frames, built = {}, None
+        test_id = f"test_{trial}"
+        for _ in range(rng.randint(1, 30)):
+            # Edits land on new frames before, between and after the existing ones, or replace one.
+            img_id = f"{rng.randrange(20):03d}.jpg"
+            frames[img_id] = random_interaction(rng, slide_end(frames[max(frames)]) if frames else None)
+            if built is None:
+                built = get_trajectory_index(test_id, frames)
+            update_trajectory(test_id, frames, img_id)
+            # Still the first index, so update() did the work rather than a rebuild.
+            index = get_trajectory_index(test_id, frames)
+            assert index is built
+            assert_matches_loop(index, frames)
@@ -0,0 +1,88 @@
+from bisect import insort
+from cache import LRUCache
+
+def get_grounding_start(grounding):
+    """Returns the first point of a grounding, which is either a point or a list of points."""
+    point = grounding[0] if isinstance(grounding[0], list) else grounding
+    if isinstance(point, list) and len(point) == 2:
+        return point
+    return None
+
+class TrajectoryIndex:
+    """Trajectory knot points of one test ID, with the prefix of knots that precedes every frame.
+
+    The trajectory shown on frame k is an O(1) prefix lookup. When an interaction changes,
+    only the frames from that one onwards are rewalked.
+    """
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.img_ids = sorted(frames)
+        self.knots = []
+        # prefix_ends[i] is the number of knots contributed by the frames before img_ids[i].
+        self.prefix_ends = []
+        self._rebuild_from(0)
+
+    def _rebuild_from(self, position):
+        if position < len(self.prefix_ends):
+            del self.knots[self.prefix_ends[position]:]
+            del self.prefix_ends[position:]
+        self.positions = {img_id: i for i, img_id in enumerate(self.img_ids)}
+
+        for img_id in self.img_ids[position:]:
+            self.prefix_ends.append(len(self.knots))
+            interaction = self.frames.get(img_id, {})
+            grounding = interaction.get("interaction_parameters", {}).get("grounding")
+            if not grounding:
+                continue
+
+            if interaction.get("interaction_type") == "slide" and len(grounding) == 2:
+                if not self.knots or self.knots[-1] != grounding[0]:
+                    self.knots.append(grounding[0])
+                self.knots.append(grounding[1])
+            else:
+                point = get_grounding_start(grounding)
+                if point is not None:
+                    self.knots.append(point)
+
+    def update(self, img_id):
+        """Refreshes the index after the interaction of img_id was added or changed."""
+        if img_id in self.positions:
+            position = self.positions[img_id]
+        else:
+            insort(self.img_ids, img_id)
+            position = self.img_ids.index(img_id)
+        self._rebuild_from(position)
+
+    def is_current(self, frames):
+        return self.frames is frames and len(frames) == len(self.img_ids)
+
+    def points_for(self, img_id):
+        """Returns the trajectory from the first frame up to the start point of img_id."""
+        trajectory_points = self.knots[:self.prefix_ends[self.positions[img_id]]]
+
+        # Connect to the current interaction's start point
+        current_grounding = self.frames[img_id].get("interaction_parameters", {}).get("grounding")
+        if current_grounding:
+            start_point_current = get_grounding_start(current_grounding)
+            if start_point_current is not None:
+                if not trajectory_points or trajectory_points[-1] != start_point_current:
+                    trajectory_points.append(start_point_current)
+        return trajectory_points
+
+# Indexes are tied to the frames dict they were built from, so sessions and folders never share one.
+_trajectory_indexes = LRUCache(256)
+
+def get_trajectory_index(test_id, frames):
+    key = (test_id, id(frames))
+    index = _trajectory_indexes.get(key)
+    if index is None or not index.is_current(frames):
+        index = _trajectory_indexes.put(key, TrajectoryIndex(frames))
+    return index
+
+def update_trajectory(test_id, frames, img_id):
+    """Tells an already built trajectory index that the interaction of img_id changed."""
+    key = (test_id, id(frames))
+    index = _trajectory_indexes.get(key)
+    if index is not None and index.frames is frames:
+        index.update(img_id)
@@ -1,117 +1,195 @@
 import os
 import json
 import math
+from functools import lru_cache
+import numpy as np
 from PIL import Image, ImageDraw, ImageColor
+from cache import file_mtime, load_image, get_image_size, render_cache
+from folder_index import FolderIndex
+from interaction_store import open_interactions
+from trajectory import get_trajectory_index, update_trajectory
+
+# Previews are rendered at this multiple of the widget height so they stay sharp on high-DPI screens.
+DISPLAY_PIXEL_RATIO = 2
+
+def display_size(dims, display_height=None):
+    """Returns the (width, height) a frame of the given size is rendered at for a widget of display_height."""
+    if not dims or not display_height:
+        return tuple(dims) if dims else dims
+    width, height = dims
+    target_height = display_height * DISPLAY_PIXEL_RATIO
+    if height <= target_height:
+        return (width, height)
+    return (max(1, round(width * target_height / height)), target_height)
 
 def get_test_folders(base_dir="test_folder"):
     if not os.path.isdir(base_dir):
         return []
     return [f.name for f in os.scandir(base_dir) if f.is_dir()]
 
-def draw_point_on_image(image_path, normalized_coords, color="red", interaction_type="click", trajectory_points=None):
-    with Image.open(image_path) as base_img:
-        base_img = base_img.convert("RGBA")
-
-        # Create a transparent overlay for drawing
-        overlay = Image.new("RGBA", base_img.size, (255, 255, 255, 0))
-        draw = ImageDraw.Draw(overlay)
-
-        width, height = base_img.size
+@lru_cache(maxsize=64)
+def get_marker_sprite(rgb_color, total_radius, solid_radius):
+    """Builds the blurred-disc marker once per (color, radius) as a small RGBA sprite."""
+    size = 2 * total_radius + 1
+    offsets = np.arange(size) - total_radius
+    dist = np.sqrt(offsets[np.newaxis, :] ** 2 + offsets[:, np.newaxis] ** 2)
+
+    # Same falloff as concentric semi-transparent circles: each pixel takes the alpha
+    # of the smallest ring that still covers it. The exponent 1.5 keeps the blur light.
+    ring = np.maximum(np.ceil(dist), 1)
+    alpha = np.where(ring <= total_radius, (255 * np.clip(1 - ring / total_radius, 0, 1) ** 1.5).astype(np.uint8), 0)
+    alpha[dist <= solid_radius] = 255
+
+    sprite = np.empty((size, size, 4), dtype=np.uint8)
+    sprite[..., :3] = rgb_color
+    sprite[..., 3] = alpha
+    # Cached sprites are shared between renders and must not be drawn on.
+    return Image.fromarray(sprite, "RGBA")
+
+def paste_marker(overlay, x, y, rgb_color, total_radius, solid_radius):
+    """Alpha-composites the cached marker sprite centred on (x, y), clipped to the overlay."""
+    sprite = get_marker_sprite(rgb_color, total_radius, solid_radius)
+    left = int(round(x)) - total_radius
+    top = int(round(y)) - total_radius
+
+    src_left = max(0, -left)
+    src_top = max(0, -top)
+    src_right = min(sprite.width, overlay.width - left)
+    src_bottom = min(sprite.height, overlay.height - top)
+    if src_left >= src_right or src_top >= src_bottom:
+        return
+
+    overlay.alpha_composite(sprite, dest=(left + src_left, top + src_top), source=(src_left, src_top, src_right, src_bottom))
+
+def union_box(boxes, width, height):
+    """Returns the bounding box covering all boxes, clipped to the image, or None if nothing is visible."""
+    if not boxes:
+        return None
+    left = max(0, int(math.floor(min(b[0] for b in boxes))))
+    top = max(0, int(math.floor(min(b[1] for b in boxes))))
+    right = min(width, int(math.ceil(max(b[2] for b in boxes))))
+    bottom = min(height, int(math.ceil(max(b[3] for b in boxes))))
+    if left >= right or top >= bottom:
+        return None
+    return (left, top, right, bottom)
+
+def points_box(points, padding):
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return (min(xs) - padding, min(ys) - padding, max(xs) + padding + 1, max(ys) + padding + 1)
+
+def draw_point_on_image(image_path, normalized_coords, color="red", interaction_type="click", trajectory_points=None, display_height=None):
+    # Decoded screenshots are shared through the image cache, so draw on a copy.
+    full_size = get_image_size(image_path)
+    base_img = load_image(image_path, display_size(full_size, display_height)).copy()
+
+    width, height = base_img.size
+    # Marker sizes are in full-resolution pixels and shrink with the preview.
+    scale = height / full_size[1]
+    
+    # You can adjust the radius to change the size of the point.
+    total_radius = max(1, round(100 * scale))
+    solid_radius = max(1, round(25 * scale))
+    trajectory_line_width = max(1, round(5 * scale))
+    
+    try:
+        rgb_color = ImageColor.getrgb(color)
+    except ValueError:
+        rgb_color = (255, 0, 0) # Default to red
+
+    # Work out the geometry first so only the dirty region has to be composited.
+    dirty_boxes = []
+
+    trajectory_segments = []
+    if trajectory_points and len(trajectory_points) > 1:
+        pixel_points = [(p[0] * width, p[1] * height) for p in trajectory_points]
+        trajectory_segments = list(zip(pixel_points, pixel_points[1:]))
+        dirty_boxes.append(points_box(pixel_points, trajectory_line_width))
+
+    coords_to_draw = []
+    if normalized_coords:
+        # Check if it's a list of points e.g. [[0.5, 0.5], [0.6, 0.6]]
+        if isinstance(normalized_coords, list) and len(normalized_coords) > 0 and isinstance(normalized_coords[0], (list, tuple)):
+            coords_to_draw = normalized_coords
+        else: # A single point e.g. [0.5, 0.5] or (0.5, 0.5)
+            coords_to_draw = [normalized_coords]
+
+    marker_points = [(coords[0] * width, coords[1] * height) for coords in coords_to_draw]
+    for x, y in marker_points:
+        dirty_boxes.append((round(x) - total_radius, round(y) - total_radius, round(x) + total_radius + 1, round(y) + total_radius + 1))
+
+    arrow = None
+    if interaction_type == 'slide' and len(coords_to_draw) == 2:
+        (x1, y1), (x2, y2) = marker_points
+
+        # --- Adjustable arrow parameters ---
+        # You can adjust the width of the arrow line.
+        arrow_line_width = max(1, round(10 * scale))
+        # You can adjust the length of the arrowhead.
+        arrowhead_length = 80 * scale
+        # You can adjust the angle of the arrowhead.
+        arrowhead_angle = math.pi / 8 # 22.5 degrees
+        # --- End of adjustable parameters ---
+
+        angle = math.atan2(y1 - y2, x1 - x2)
         
-        # You can adjust the radius to change the size of the point.
-        total_radius = 100
-        solid_radius = 25
+        x_arrow1 = x2 + arrowhead_length * math.cos(angle - arrowhead_angle)
+        y_arrow1 = y2 + arrowhead_length * math.sin(angle - arrowhead_angle)
+        x_arrow2 = x2 + arrowhead_length * math.cos(angle + arrowhead_angle)
+        y_arrow2 = y2 + arrowhead_length * math.sin(angle + arrowhead_angle)
+
+        arrow = ((x1, y1), (x2, y2), [(x2, y2), (x_arrow1, y_arrow1), (x_arrow2, y_arrow2)])
+        dirty_boxes.append(points_box([(x1, y1)] + arrow[2], arrow_line_width))
+
+    box = union_box(dirty_boxes, width, height)
+    if box is None:
+        return base_img
+    left, top = box[0], box[1]
+
+    def shift(point):
+        return (point[0] - left, point[1] - top)
+
+    # Create a transparent overlay covering only the dirty region
+    region = base_img.crop(box).convert("RGBA")
+    overlay = Image.new("RGBA", region.size, (255, 255, 255, 0))
+    draw = ImageDraw.Draw(overlay)
+
+    # Draw trajectory path FIRST
+    num_segments = len(trajectory_segments)
+    for i, (start_seg, end_seg) in enumerate(trajectory_segments):
+        # Gradient opacity from 0 to 1
+        alpha = int(255 * ((i + 1) / num_segments))
         
-        try:
-            rgb_color = ImageColor.getrgb(color)
-        except ValueError:
-            rgb_color = (255, 0, 0) # Default to red
-
-        # Draw trajectory path FIRST
-        if trajectory_points and len(trajectory_points) > 1:
-            pixel_points = [(p[0] * width, p[1] * height) for p in trajectory_points]
-            
-            num_segments = len(pixel_points) - 1
-            for i in range(num_segments):
-                start_seg = pixel_points[i]
-                end_seg = pixel_points[i+1]
-                
-                # Gradient opacity from 0 to 1
-                alpha = int(255 * ((i + 1) / num_segments))
-                
-                # Red color for trajectory
-                line_color = (255, 0, 0, alpha)
-                
-                draw.line([start_seg, end_seg], fill=line_color, width=5)
-
-        coords_to_draw = []
-        if normalized_coords:
-            # Check if it's a list of points e.g. [[0.5, 0.5], [0.6, 0.6]]
-            if isinstance(normalized_coords, list) and len(normalized_coords) > 0 and isinstance(normalized_coords[0], (list, tuple)):
-                coords_to_draw = normalized_coords
-            else: # A single point e.g. [0.5, 0.5] or (0.5, 0.5)
-                coords_to_draw = [normalized_coords]
-
-        for coords in coords_to_draw:
-            x = coords[0] * width
-            y = coords[1] * height
-            # The following code creates a pseudo-blur effect with a solid center.
-            
-            # Draw the blurred part by drawing semi-transparent concentric circles.
-            for i in range(total_radius, 0, -1):
-                # To make the blur lighter, the exponent is changed from 2 to 1.5
-                alpha = int(255 * (1 - (i / total_radius))**1.5)
-                fill_color = rgb_color + (alpha,)
-                draw.ellipse((x - i, y - i, x + i, y + i), fill=fill_color, outline=None)
-
-            # Draw the solid inner circle on top of the blur.
-            draw.ellipse((x - solid_radius, y - solid_radius, x + solid_radius, y + solid_radius), fill=rgb_color + (255,), outline=None)
-
-        # Draw arrow for slide interaction
-        if interaction_type == 'slide' and len(coords_to_draw) == 2:
-            start_point_norm = coords_to_draw[0]
-            end_point_norm = coords_to_draw[1]
-
-            x1 = start_point_norm[0] * width
-            y1 = start_point_norm[1] * height
-            x2 = end_point_norm[0] * width
-            y2 = end_point_norm[1] * height
-
-            # --- Adjustable arrow parameters ---
-            # You can adjust the width of the arrow line.
-            arrow_line_width = 10
-            # You can adjust the length of the arrowhead.
-            arrowhead_length = 80
-            # You can adjust the angle of the arrowhead.
-            arrowhead_angle = math.pi / 8 # 22.5 degrees
-            # --- End of adjustable parameters ---
-
-            # Draw line
-            draw.line([(x1, y1), (x2, y2)], fill=rgb_color + (255,), width=arrow_line_width)
-
-            # Draw arrowhead
-            angle = math.atan2(y1 - y2, x1 - x2)
-            
-            x_arrow1 = x2 + arrowhead_length * math.cos(angle - arrowhead_angle)
-            y_arrow1 = y2 + arrowhead_length * math.sin(angle - arrowhead_angle)
-            x_arrow2 = x2 + arrowhead_length * math.cos(angle + arrowhead_angle)
-            y_arrow2 = y2 + arrowhead_length * math.sin(angle + arrowhead_angle)
-
-            draw.polygon([(x2, y2), (x_arrow1, y_arrow1), (x_arrow2, y_arrow2)], fill=rgb_color + (255,))
-
-        # Alpha composite the overlay onto the original image
-        combined = Image.alpha_composite(base_img, overlay)
+        # Red color for trajectory
+        line_color = (255, 0, 0, alpha)
         
-        return combined.convert("RGB")
+        draw.line([shift(start_seg), shift(end_seg)], fill=line_color, width=trajectory_line_width)
+
+    for x, y in marker_points:
+        # The blurred disc with a solid center is a cached sprite, so each marker is a single blit.
+        paste_marker(overlay, x - left, y - top, rgb_color, total_radius, solid_radius)
+
+    # Draw arrow for slide interaction
+    if arrow:
+        start, end, arrowhead = arrow
+        draw.line([shift(start), shift(end)], fill=rgb_color + (255,), width=arrow_line_width)
+        draw.polygon([shift(p) for p in arrowhead], fill=rgb_color + (255,))
+
+    # Alpha composite the overlay onto the dirty region and paste it back
+    combined = Image.alpha_composite(region, overlay)
+    base_img.paste(combined.convert("RGB"), box)
+    
+    return base_img
 
-def get_image_for_display(image_path, test_id, interactions, draw_trajectory=False):
+def get_render_args(image_path, test_id, interactions, draw_trajectory=False):
+    """Returns (coords, color, interaction_type, trajectory_points) to draw on the frame, or None if it is shown as is."""
     img_id = os.path.basename(image_path)
     if test_id in interactions and img_id in interactions[test_id]:
         interaction_data = interactions[test_id][img_id]
         if "interaction_parameters" in interaction_data and "grounding" in interaction_data["interaction_parameters"]:
             coords = interaction_data["interaction_parameters"]["grounding"]
             if not coords:
-                return Image.open(image_path)
+                return None
             interaction_type = interaction_data.get("interaction_type", "click")
             color = "red" # default
             if interaction_type == 'multiclick':
@@ -123,42 +201,27 @@ def get_image_for_display(image_path, test_id, interactions, draw_trajectory=Fal
 
             trajectory_points = []
             if draw_trajectory:
-                # --- Trajectory logic ---
-                sorted_img_ids = sorted(interactions[test_id].keys())
-                
-                if test_id in interactions:
-                    up_to_index = sorted_img_ids.index(img_id)
-
-                    # Collect all "knot" points from previous interactions
-                    for i in range(up_to_index):
-                        img_id_for_traj = sorted_img_ids[i]
-                        interaction = interactions[test_id].get(img_id_for_traj, {})
-                        params = interaction.get("interaction_parameters", {})
-                        grounding = params.get("grounding")
-                        
-                        if not grounding:
-                            continue
-
-                        if interaction.get("interaction_type") == "slide" and len(grounding) == 2:
-                            if not trajectory_points or trajectory_points[-1] != grounding[0]:
-                                trajectory_points.append(grounding[0])
-                            trajectory_points.append(grounding[1])
-                        else:
-                            point = grounding[0] if isinstance(grounding[0], list) else grounding
-                            if isinstance(point, list) and len(point) == 2:
-                                trajectory_points.append(point)
-
-                    # Now, connect to the current interaction's start point
-                    current_interaction = interactions[test_id][img_id]
-                    current_grounding = current_interaction.get("interaction_parameters", {}).get("grounding")
-                    if current_grounding:
-                        start_point_current = current_grounding[0] if isinstance(current_grounding[0], list) else current_grounding
-                        if isinstance(start_point_current, list) and len(start_point_current) == 2:
-                            if not trajectory_points or trajectory_points[-1] != start_point_current:
-                                trajectory_points.append(start_point_current)
-
-            return draw_point_on_image(image_path, coords, color, interaction_type=interaction_type, trajectory_points=trajectory_points)
-    return Image.open(image_path)
+                trajectory_points = get_trajectory_index(test_id, interactions[test_id]).points_for(img_id)
+
+            return coords, color, interaction_type, trajectory_points
+    return None
+
+def get_render_key(image_path, render_args, display_height=None):
+    """Identifies a rendered frame by source file, preview size and everything drawn on it."""
+    return (image_path, file_mtime(image_path), display_height, json.dumps(render_args))
+
+def get_image_for_display(image_path, test_id, interactions, draw_trajectory=False, display_height=None):
+    render_args = get_render_args(image_path, test_id, interactions, draw_trajectory)
+    if render_args is None:
+        return load_image(image_path, display_size(get_image_size(image_path), display_height))
+
+    key = get_render_key(image_path, render_args, display_height)
+    display_image = render_cache.get(key)
+    if display_image is None:
+        coords, color, interaction_type, trajectory_points = render_args
+        display_image = draw_point_on_image(image_path, coords, color, interaction_type=interaction_type, trajectory_points=trajectory_points, display_height=display_height)
+        render_cache.put(key, display_image)
+    return display_image
 
 def update_and_get_interactions(interactions, test_id, index, image_groups, tool_type, clicks, duration, slide_duration):
     if not test_id or not image_groups:
@@ -199,6 +262,7 @@ def update_and_get_interactions(interactions, test_id, index, image_groups, tool
              if 'clicks' in params:
                 del params['clicks']
         interaction_data['interaction_parameters'] = params
+        update_trajectory(test_id, interactions[test_id], img_id)
 
     return interactions
 
@@ -211,40 +275,20 @@ def process_folder(folder_name):
     if not os.path.isdir(base_folder_path):
         return [], "", "Please provide a valid folder path.", {}, None, {}
 
-    # Load interactions from the interactions.json file in the test_img directory
-    interactions = {}
-    interaction_file = os.path.join(base_folder_path, "test_img", "interactions.json")
-    if os.path.isfile(interaction_file):
-        with open(interaction_file, 'r') as f:
-            try:
-                interactions = json.load(f)
-            except json.JSONDecodeError:
-                pass # Ignore if file is empty or corrupt
-
     test_ids_dir = os.path.join(base_folder_path, "test_img")
     if not os.path.isdir(test_ids_dir):
-        return [], "", f"'test_img' directory not found in '{folder_name}'.", {}, None, interactions
-
-    subfolders = [f.path for f in os.scandir(test_ids_dir) if f.is_dir()]
-    if not subfolders:
-        return [], "", "The 'test_img' directory has no subfolders.", {}, None, interactions
-
-    image_groups = {}
-    for subfolder in subfolders:
-        test_id = os.path.basename(subfolder)
-        imgs_folder = os.path.join(subfolder, "imgs")
-        if os.path.isdir(imgs_folder):
-            images = sorted([os.path.join(imgs_folder, img) for img in os.listdir(imgs_folder) if not img.startswith('.')])
-            if images:
-                image_groups[test_id] = images
-
-    if not image_groups:
+        return [], "", f"'test_img' directory not found in '{folder_name}'.", {}, None, {}
+
+    # Interactions are shared with every other session on this folder; test IDs are copied out as they are opened.
+    interactions = open_interactions(test_ids_dir)
+
+    # Test IDs are listed lazily; each one's images are only read when it is selected.
+    image_groups = FolderIndex(test_ids_dir)
+    first_test_id = image_groups.first_non_empty()
+    if first_test_id is None:
         return [], "", "No subfolders with an 'imgs' directory found in 'test_img'.", {}, None, interactions
 
-    test_ids = sorted(list(image_groups.keys()))
-    first_test_id = test_ids[0]
     first_image_path = image_groups[first_test_id][0]
-    with Image.open(first_image_path) as img:
-        dims = img.size
+    dims = get_image_size(first_image_path)
     
     return image_groups[first_test_id], first_test_id, f"Displaying images for {first_test_id}", image_groups, dims, interactions
\ No newline at end of file